@@ -0,0 +1,18 @@
+from django.core.management import base
+
+from piplmesh.account import presence
+
+class Command(base.NoArgsCommand):
+    help = 'Forget connections of users, so that online users who do not reconnect become offline. Run it when the push server is (re)started.'
+
+    def handle_noargs(self, **options):
+        """
+        Resets presence store.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        presence.presence.reset()
+
+        if verbosity > 0:
+            self.stdout.write('Presence has been reset.\n')
@@ -84,9 +84,14 @@ class User(auth.User):
     browserid_profile_data = mongoengine.DictField()
 
     connections = mongoengine.ListField(mongoengine.EmbeddedDocumentField(Connection))
+    # Maintained atomically by presence.DatabasePresenceStore
+    connections_count = mongoengine.IntField(default=0)
     connection_last_unsubscribe = mongoengine.DateTimeField()
     is_online = mongoengine.BooleanField(default=False)
 
+    # Maintained incrementally when notifications are created and read
+    unread_notifications_count = mongoengine.IntField(default=0)
+
     email_confirmed = mongoengine.BooleanField(default=False)
     email_confirmation_token = mongoengine.EmbeddedDocumentField(EmailConfirmationToken)
 
@@ -94,6 +99,13 @@ class User(auth.User):
     panels_collapsed = mongoengine.DictField()
     panels_order = mongoengine.DictField()
 
+    meta = {
+        # Users whose reconnect timeout could have expired are found through the index
+        'indexes': [
+            ('is_online', 'connections_count', 'connection_last_unsubscribe'),
+        ],
+    }
+
     @models.permalink
     def get_absolute_url(self):
         return ('profile', (), {'username': self.username})
@@ -0,0 +1,520 @@
+from __future__ import absolute_import
+
+import collections, datetime, math, threading, time
+
+from django.conf import settings
+from django.core import cache as django_cache, exceptions
+from django.utils import importlib, timezone
+
+from piplmesh.account import models, signals
+
+DEFAULT_RECONNECT_TIMEOUT = 20 # seconds
+DEFAULT_RESOLUTION = 1 # seconds
+DEFAULT_CACHE_TIMEOUT = 24 * 60 * 60 # seconds
+# Generation of counted connections has to outlive them
+GENERATION_TIMEOUT = 365 * 24 * 60 * 60 # seconds
+LOCK_TIMEOUT = 10 # seconds
+LOCK_WAIT = 0.01 # seconds
+
+# Push server channel subscription, identified as by the push server
+Connection = collections.namedtuple('Connection', ('http_if_none_match', 'http_if_modified_since', 'channel_id'))
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel. Timers are kept in slots by the tick at which they
+    expire, so scheduling, cancelling and expiring a timer costs O(1) and
+    advancing the wheel costs O(ticks passed + timers expired).
+
+    It is not thread-safe.
+    """
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION, size=64, now=None):
+        self.resolution = resolution
+        self.slots = [set() for i in xrange(size)]
+        self.deadlines = {}
+        self.tick = self.get_tick(now if now is not None else time.time())
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def get_tick(self, now):
+        return int(math.floor(now / self.resolution))
+
+    def schedule(self, key, timeout, now=None):
+        """
+        Schedules (or reschedules) a timer for the given key.
+        """
+
+        self.cancel(key)
+        # Timer expires at the first tick after the timeout passed
+        deadline = max(self.get_tick((now if now is not None else time.time()) + timeout) + 1, self.tick + 1)
+        self.deadlines[key] = deadline
+        self.slots[deadline % len(self.slots)].add(key)
+
+    def cancel(self, key):
+        deadline = self.deadlines.pop(key, None)
+        if deadline is None:
+            return False
+        self.slots[deadline % len(self.slots)].discard(key)
+        return True
+
+    def advance(self, now=None):
+        """
+        Advances the wheel to the given time and returns a list of keys of expired timers.
+        """
+
+        tick = self.get_tick(now if now is not None else time.time())
+        if tick <= self.tick:
+            return []
+
+        expired = []
+        # After a whole turn all slots have been visited
+        for current in xrange(self.tick + 1, min(tick, self.tick + len(self.slots)) + 1):
+            slot = self.slots[current % len(self.slots)]
+            for key in [key for key in slot if self.deadlines[key] <= tick]:
+                slot.discard(key)
+                del self.deadlines[key]
+                expired.append(key)
+
+        self.tick = tick
+        return expired
+
+def to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, timezone.utc)
+
+def update_online(user_id, **conditions):
+    """
+    Marks the user online in the database if they match given conditions.
+    Returns ``True`` if user has been marked online.
+    """
+
+    return bool(models.User.objects(pk=user_id, is_online=False, **conditions).update(set__is_online=True))
+
+def update_offline(user_id, last_seen=None, **conditions):
+    """
+    Marks the user offline in the database if they match given conditions.
+    Returns ``True`` if user has been marked offline.
+    """
+
+    # On user disconnect we cycle channel_id, this is to improve security if somebody
+    # intercepted current channel_id as there is no authentication on HTTP push channels
+    # This is the best place to cycle channel_id as we know that user does not listen
+    # anymore to any channel, and we do it in the same update, so that a user who
+    # connects in the meantime keeps the channel
+    update = {
+        'set__is_online': False,
+        'set__channel_id': models.generate_channel_id(),
+    }
+    if last_seen is not None:
+        update['set__connection_last_unsubscribe'] = to_datetime(last_seen)
+    return bool(models.User.objects(pk=user_id, is_online=True, **conditions).update(**update))
+
+class PresenceStore(object):
+    """
+    Base class for presence stores, which keep open connections of users and
+    time they were last seen, and make online status transitions.
+
+    Transitions have to be atomic with changes of connections, so that a user
+    who connects while their reconnect timeout is expiring stays online.
+    """
+
+    def connect(self, user_id, connection, now):
+        """
+        Registers a new connection of the user.
+        """
+
+        raise NotImplementedError
+
+    def disconnect(self, user_id, connection, now):
+        """
+        Unregisters a connection of the user.
+        """
+
+        raise NotImplementedError
+
+    def get_connections(self, user_id):
+        """
+        Returns a list of open connections of the user, or ``None`` if the store
+        keeps only their number.
+        """
+
+        return None
+
+    def set_online(self, user_id):
+        """
+        Marks the user online if they have an open connection. Returns ``True``
+        if user has been marked online.
+        """
+
+        raise NotImplementedError
+
+    def get_idle(self, deadline):
+        """
+        Returns a list of IDs of online users who have no connections and were
+        last seen before ``deadline`` (a timestamp).
+        """
+
+        raise NotImplementedError
+
+    def set_offline(self, user_id, deadline):
+        """
+        Marks the user offline if they have no connections and were last seen
+        before ``deadline``. Returns ``True`` if user has been marked offline.
+        """
+
+        raise NotImplementedError
+
+    def reset(self, now):
+        """
+        Forgets all connections, for example after the push server has been
+        restarted, so that online users who do not reconnect become offline.
+        """
+
+        raise NotImplementedError
+
+class DatabasePresenceStore(PresenceStore):
+    """
+    Presence store in user documents, shared between all processes. It keeps
+    only the number of connections of each user, which is updated atomically,
+    and transitions are conditional updates on it.
+    """
+
+    def connect(self, user_id, connection, now):
+        models.User.objects(pk=user_id).update(inc__connections_count=1)
+
+    def disconnect(self, user_id, connection, now):
+        last_seen = to_datetime(now)
+        # Connection could be opened before the store was reset
+        if not models.User.objects(pk=user_id, connections_count__gt=0).update(dec__connections_count=1, set__connection_last_unsubscribe=last_seen):
+            models.User.objects(pk=user_id).update(set__connection_last_unsubscribe=last_seen)
+
+    def set_online(self, user_id):
+        return update_online(user_id, connections_count__gt=0)
+
+    def get_idle(self, deadline):
+        return [user.pk for user in models.User.objects(
+            is_online=True,
+            connections_count__lte=0,
+            connection_last_unsubscribe__lte=to_datetime(deadline),
+        ).only('id')]
+
+    def set_offline(self, user_id, deadline):
+        return update_offline(user_id, connections_count__lte=0, connection_last_unsubscribe__lte=to_datetime(deadline))
+
+    def reset(self, now):
+        models.User.objects(is_online=True).update(set__connections_count=0, set__connection_last_unsubscribe=to_datetime(now))
+        models.User.objects(is_online=False, connections_count__ne=0).update(set__connections_count=0)
+
+class CachePresenceStore(PresenceStore):
+    """
+    Presence store in a Django cache (configured with ``PRESENCE_CACHE``), so
+    that it can be shared between processes. Cache has to support atomic
+    ``add``, ``incr`` and ``decr``, like memcached does.
+
+    It keeps only the number of connections of each user and the time they
+    were last seen, so subscribes and unsubscribes do not touch the database,
+    which is updated only on online and offline transitions. Whether the user
+    is online is cached as well, so connections of online users do not query
+    the database.
+
+    Offline transitions are made while holding a per-user lock in the cache,
+    and connections opened meanwhile wait for it before they mark the user
+    online, so a user who connects during expiry becomes online again.
+    """
+
+    def __init__(self, cache_name=None, prefix='piplmesh.presence', timeout=DEFAULT_CACHE_TIMEOUT):
+        if cache_name is None:
+            cache_name = getattr(settings, 'PRESENCE_CACHE', 'default')
+        self.cache = django_cache.get_cache(cache_name)
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def get_key(self, name, user_id):
+        return '%s:%s:%s' % (self.prefix, name, user_id)
+
+    def get_generation(self):
+        return self.cache.get(self.get_key('generation', ''), 0)
+
+    def get_connections_key(self, user_id, generation):
+        # Reset starts a new generation, so that connections do not have to be forgotten one by one
+        return self.get_key('connections:%s' % generation, user_id)
+
+    def get_last_seen_key(self, user_id, generation):
+        return self.get_key('last_seen:%s' % generation, user_id)
+
+    def connect(self, user_id, connection, now):
+        generation = self.get_generation()
+        key = self.get_connections_key(user_id, generation)
+        self.cache.add(key, 0, self.timeout)
+        self.cache.incr(key)
+        self.cache.set(self.get_last_seen_key(user_id, generation), now, self.timeout)
+
+    def disconnect(self, user_id, connection, now):
+        generation = self.get_generation()
+        key = self.get_connections_key(user_id, generation)
+        self.cache.set(self.get_last_seen_key(user_id, generation), now, self.timeout)
+        try:
+            connections = self.cache.decr(key)
+        except ValueError:
+            # Connection could be opened before the store was reset
+            return
+        if connections < 0:
+            self.cache.incr(key, -connections)
+
+    def get_state(self, user_ids):
+        """
+        Returns a dict of ``(connections count, last seen)`` pairs of given users.
+        """
+
+        generation = self.get_generation()
+        keys = dict((user_id, (self.get_connections_key(user_id, generation), self.get_last_seen_key(user_id, generation))) for user_id in user_ids)
+        values = self.cache.get_many([key for user_keys in keys.values() for key in user_keys])
+        return dict((user_id, (max(0, values.get(connections_key) or 0), values.get(last_seen_key))) for user_id, (connections_key, last_seen_key) in keys.items())
+
+    def set_online(self, user_id):
+        lock_key = self.get_key('lock', user_id)
+        online_key = self.get_key('online', user_id)
+        connections_key = self.get_connections_key(user_id, self.get_generation())
+
+        # We wait for an offline transition in progress to finish, and then mark the user online again
+        started = time.time()
+        values = self.cache.get_many([lock_key, online_key, connections_key])
+        while values.get(lock_key) and time.time() - started < LOCK_TIMEOUT:
+            time.sleep(LOCK_WAIT)
+            values = self.cache.get_many([lock_key, online_key, connections_key])
+
+        if values.get(online_key) or (values.get(connections_key) or 0) <= 0:
+            return False
+
+        online = update_online(user_id)
+        self.cache.set(online_key, True, self.timeout)
+        return online
+
+    def get_idle(self, deadline):
+        # Online users are known from the database, which is changed only on transitions
+        user_ids = [user.pk for user in models.User.objects(is_online=True).only('id')]
+        return [user_id for user_id, (connections, last_seen) in self.get_state(user_ids).items() if connections <= 0 and (last_seen is None or last_seen <= deadline)]
+
+    def set_offline(self, user_id, deadline):
+        lock_key = self.get_key('lock', user_id)
+        if not self.cache.add(lock_key, True, LOCK_TIMEOUT):
+            return False
+
+        try:
+            connections, last_seen = self.get_state([user_id])[user_id]
+            if connections > 0 or (last_seen is not None and last_seen > deadline):
+                return False
+
+            offline = update_offline(user_id, last_seen)
+            self.cache.delete(self.get_key('online', user_id))
+            return offline
+        finally:
+            self.cache.delete(lock_key)
+
+    def reset(self, now):
+        generation_key = self.get_key('generation', '')
+        self.cache.add(generation_key, 0, GENERATION_TIMEOUT)
+        generation = self.cache.incr(generation_key)
+
+        # Online users who do not reconnect become offline after the reconnect timeout
+        user_ids = [user.pk for user in models.User.objects(is_online=True).only('id')]
+        self.cache.set_many(dict((self.get_last_seen_key(user_id, generation), now) for user_id in user_ids), self.timeout)
+
+class LocalPresenceStore(PresenceStore):
+    """
+    In-process presence store. It can be used only when push server
+    passthrough callbacks and ``Presence.expire`` are all processed by
+    the same process, for example in tests.
+
+    Users without connections are kept in a timer wheel by the time they
+    were last seen, so finding idle users does not scan all users.
+    """
+
+    def __init__(self, resolution=DEFAULT_RESOLUTION):
+        self.users = {}
+        self.idle = TimerWheel(resolution)
+        self.lock = threading.Lock()
+
+    def get_user(self, user_id):
+        return self.users.setdefault(user_id, {'connections': [], 'last_seen': None})
+
+    def connect(self, user_id, connection, now):
+        with self.lock:
+            user = self.get_user(user_id)
+            user['connections'].append(connection)
+            user['last_seen'] = now
+            self.idle.cancel(user_id)
+
+    def disconnect(self, user_id, connection, now):
+        with self.lock:
+            user = self.get_user(user_id)
+            # Connection could be opened before the process started
+            if connection in user['connections']:
+                user['connections'].remove(connection)
+            user['last_seen'] = now
+            if not user['connections']:
+                self.idle.schedule(user_id, 0, now)
+
+    def get_connections(self, user_id):
+        with self.lock:
+            return list(self.users.get(user_id, {}).get('connections', ()))
+
+    def set_online(self, user_id):
+        # Transitions are made while holding the lock, so they are atomic with connection changes
+        with self.lock:
+            if not self.users.get(user_id, {}).get('connections'):
+                return False
+            return update_online(user_id)
+
+    def get_idle(self, deadline):
+        with self.lock:
+            return self.idle.advance(deadline)
+
+    def set_offline(self, user_id, deadline):
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is not None and (user['connections'] or user['last_seen'] > deadline):
+                return False
+            # We do not keep offline users without connections
+            self.users.pop(user_id, None)
+            return update_offline(user_id, user['last_seen'] if user is not None else None)
+
+    def reset(self, now):
+        user_ids = [user.pk for user in models.User.objects(is_online=True).only('id')]
+        with self.lock:
+            self.users = {}
+            self.idle = TimerWheel(self.idle.resolution, now=now)
+            for user_id in user_ids:
+                self.get_user(user_id)['last_seen'] = now
+                self.idle.schedule(user_id, 0, now)
+
+class Presence(object):
+    """
+    Tracks online status of users from push server channel subscriptions.
+
+    Users become online with their first connection and offline when they
+    have no connection for the reconnect timeout. The database is updated and
+    ``user_online`` and ``user_offline`` signals are sent only on those
+    transitions, so costs are proportional to the number of changes and not
+    to the number of users.
+
+    Users are marked offline by ``expire``, which has to be called periodically
+    by one designated process (see ``expire_presence`` task). It does not start
+    any threads.
+
+    If ``snapshot_interval`` is set and the store keeps connections, connections
+    of users whose connections changed are periodically written to the database
+    by the process keeping them.
+    """
+
+    def __init__(self, store=None, timeout=None, snapshot_interval=None):
+        self._store = store
+        self.timeout = timeout if timeout is not None else getattr(settings, 'PRESENCE_RECONNECT_TIMEOUT', DEFAULT_RECONNECT_TIMEOUT)
+        self.snapshot_interval = snapshot_interval if snapshot_interval is not None else getattr(settings, 'PRESENCE_SNAPSHOT_INTERVAL', None)
+        self.last_snapshot = time.time()
+        self.changed = set()
+        self.lock = threading.RLock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self.lock:
+                if self._store is None:
+                    self._store = load_store(getattr(settings, 'PRESENCE_STORE', 'piplmesh.account.presence.CachePresenceStore'))
+        return self._store
+
+    def connect(self, user_id, connection=None, now=None):
+        if now is None:
+            now = time.time()
+
+        self.store.connect(user_id, connection, now)
+
+        if self.store.set_online(user_id):
+            signals.user_online.send(sender=Presence, user_id=user_id)
+
+        self.connections_changed(user_id, now)
+
+    def disconnect(self, user_id, connection=None, now=None):
+        if now is None:
+            now = time.time()
+
+        self.store.disconnect(user_id, connection, now)
+
+        self.connections_changed(user_id, now)
+
+    def connections_changed(self, user_id, now):
+        if not self.snapshot_interval:
+            return
+
+        with self.lock:
+            self.changed.add(user_id)
+            due = now - self.last_snapshot >= self.snapshot_interval
+
+        if due:
+            self.snapshot(now)
+
+    def expire(self, now=None):
+        """
+        Marks offline users whose reconnect timeout expired. Returns their IDs.
+        """
+
+        if now is None:
+            now = time.time()
+
+        deadline = now - self.timeout
+
+        offline = []
+        for user_id in self.store.get_idle(deadline):
+            # Store checks again, user could connect in the meantime
+            if self.store.set_offline(user_id, deadline):
+                signals.user_offline.send(sender=Presence, user_id=user_id)
+                offline.append(user_id)
+
+        return offline
+
+    def snapshot(self, now=None):
+        """
+        Writes connections of users whose connections changed since the last
+        snapshot to the database. Returns the number of updated users.
+        """
+
+        with self.lock:
+            changed, self.changed = self.changed, set()
+            self.last_snapshot = now if now is not None else time.time()
+
+        updated = 0
+        for user_id in changed:
+            connections = self.store.get_connections(user_id)
+            if connections is None:
+                continue
+            updated += models.User.objects(pk=user_id).update(
+                set__connections=[models.Connection(**connection._asdict()) for connection in connections if connection is not None],
+            )
+        return updated
+
+    def reset(self, now=None):
+        """
+        Forgets all connections, so that online users who do not reconnect become
+        offline. It should be called when the push server is (re)started.
+        """
+
+        self.store.reset(now if now is not None else time.time())
+
+def load_store(path):
+    i = path.rfind('.')
+    module, attr = path[:i], path[i+1:]
+    try:
+        mod = importlib.import_module(module)
+    except ImportError, e:
+        raise exceptions.ImproperlyConfigured('Error importing presence store %s: "%s"' % (path, e))
+    try:
+        cls = getattr(mod, attr)
+    except AttributeError:
+        raise exceptions.ImproperlyConfigured('Module "%s" does not define a "%s" presence store' % (module, attr))
+
+    return cls()
+
+presence = Presence()
@@ -0,0 +1,5 @@
+from django import dispatch
+
+# Signals dispatched when user becomes online or offline
+user_online = dispatch.Signal(providing_args=('user_id',))
+user_offline = dispatch.Signal(providing_args=('user_id',))
@@ -0,0 +1,188 @@
+from __future__ import absolute_import
+
+import time
+
+from django import dispatch
+
+from tastypie_mongoengine import test_runner
+
+from piplmesh.account import models, presence, signals
+
+class PresenceTest(test_runner.MongoEngineTestCase):
+    def setUp(self):
+        self.transitions = []
+        signals.user_online.connect(self.on_online)
+        signals.user_offline.connect(self.on_offline)
+
+    def tearDown(self):
+        signals.user_online.disconnect(self.on_online)
+        signals.user_offline.disconnect(self.on_offline)
+
+    def on_online(self, sender, user_id, **kwargs):
+        self.transitions.append(('online', user_id))
+
+    def on_offline(self, sender, user_id, **kwargs):
+        self.transitions.append(('offline', user_id))
+
+    def test_timer_wheel(self):
+        now = time.time()
+        wheel = presence.TimerWheel(1, 4, now)
+
+        wheel.schedule('a', 2, now)
+        wheel.schedule('b', 10, now)
+        wheel.schedule('c', 2, now)
+        self.assertTrue(wheel.cancel('c'))
+        self.assertFalse(wheel.cancel('c'))
+
+        self.assertEqual(wheel.advance(now + 1), [])
+        self.assertEqual(wheel.advance(now + 3), ['a'])
+        self.assertEqual(len(wheel), 1)
+
+        # Timers longer than a whole turn of the wheel
+        self.assertEqual(wheel.advance(now + 8), [])
+        self.assertEqual(wheel.advance(now + 100), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+    def check_presence(self, store):
+        user = models.User.create_user(username='test_user', password='foobar')
+        channel_id = user.channel_id
+
+        user_presence = presence.Presence(store, timeout=20)
+        now = time.time()
+
+        # Two connections, user becomes online only once
+
+        user_presence.connect(user.pk, now=now)
+        user_presence.connect(user.pk, now=now)
+        self.assertEqual(self.transitions, [('online', user.pk)])
+        self.assertTrue(models.User.objects.get(pk=user.pk).is_online)
+
+        # User stays online while any connection is open
+
+        user_presence.disconnect(user.pk, now=now + 1)
+        self.assertEqual(user_presence.expire(now + 100), [])
+
+        # And while it reconnects in time
+
+        user_presence.disconnect(user.pk, now=now + 101)
+        self.assertEqual(user_presence.expire(now + 110), [])
+        user_presence.connect(user.pk, now=now + 115)
+        self.assertEqual(user_presence.expire(now + 200), [])
+        self.assertEqual(self.transitions, [('online', user.pk)])
+
+        # Without connections for the reconnect timeout user becomes offline
+
+        user_presence.disconnect(user.pk, now=now + 201)
+        self.assertEqual(user_presence.expire(now + 210), [])
+        self.assertEqual(user_presence.expire(now + 230), [user.pk])
+        self.assertEqual(self.transitions, [('online', user.pk), ('offline', user.pk)])
+
+        user = models.User.objects.get(pk=user.pk)
+        self.assertFalse(user.is_online)
+        self.assertNotEqual(user.channel_id, channel_id)
+        self.assertNotEqual(user.connection_last_unsubscribe, None)
+
+        # User who connects after being found idle stays online
+
+        user_presence.connect(user.pk, now=now + 300)
+        user_presence.disconnect(user.pk, now=now + 301)
+        channel_id = models.User.objects.get(pk=user.pk).channel_id
+        self.assertEqual(store.get_idle(now + 330), [user.pk])
+        user_presence.connect(user.pk, now=now + 331)
+        self.assertFalse(store.set_offline(user.pk, now + 330))
+
+        user = models.User.objects.get(pk=user.pk)
+        self.assertTrue(user.is_online)
+        self.assertEqual(user.channel_id, channel_id)
+
+        # After a reset users who do not reconnect become offline
+
+        user_presence.reset(now + 400)
+        self.assertEqual(user_presence.expire(now + 410), [])
+        self.assertEqual(user_presence.expire(now + 430), [user.pk])
+
+    def test_local_presence(self):
+        self.check_presence(presence.LocalPresenceStore())
+
+    def test_database_presence(self):
+        self.check_presence(presence.DatabasePresenceStore())
+
+    def get_cache_store(self):
+        store = presence.CachePresenceStore('django.core.cache.backends.locmem.LocMemCache')
+        store.cache.clear()
+        return store
+
+    def test_cache_presence(self):
+        self.check_presence(self.get_cache_store())
+
+    def test_cache_presence_writes(self):
+        user = models.User.create_user(username='test_user', password='foobar')
+
+        user_presence = presence.Presence(self.get_cache_store(), timeout=20)
+        now = time.time()
+
+        user_presence.connect(user.pk, now=now)
+        self.assertTrue(models.User.objects.get(pk=user.pk).is_online)
+
+        updates = []
+        queryset_class = type(models.User.objects)
+        original_methods = dict((name, getattr(queryset_class, name)) for name in ('update', 'update_one'))
+        def recording_method(name):
+            def method(queryset, *args, **kwargs):
+                updates.append((queryset._document, name))
+                return original_methods[name](queryset, *args, **kwargs)
+            return method
+
+        for name in original_methods:
+            setattr(queryset_class, name, recording_method(name))
+        try:
+            # Connections of an already online user are not written to the database
+
+            user_presence.disconnect(user.pk, now=now + 1)
+            user_presence.connect(user.pk, now=now + 2)
+            user_presence.disconnect(user.pk, now=now + 3)
+            user_presence.connect(user.pk, now=now + 4)
+            self.assertEqual(user_presence.expire(now + 100), [])
+        finally:
+            for name, method in original_methods.items():
+                setattr(queryset_class, name, method)
+
+        self.assertEqual([document for document, name in updates if document is models.User], [])
+        self.assertEqual(self.transitions, [('online', user.pk)])
+
+    def test_snapshot(self):
+        user = models.User.create_user(username='test_user', password='foobar')
+
+        user_presence = presence.Presence(presence.LocalPresenceStore(), timeout=20, snapshot_interval=60)
+        now = time.time()
+        user_presence.last_snapshot = now
+
+        connection1 = presence.Connection('etag1', 'time1', 'channel')
+        connection2 = presence.Connection('etag2', 'time2', 'channel')
+
+        user_presence.connect(user.pk, connection1, now)
+        user_presence.connect(user.pk, connection2, now)
+        user_presence.disconnect(user.pk, connection1, now)
+
+        # Connections are not stored until a snapshot
+
+        self.assertEqual(models.User.objects.get(pk=user.pk).connections, [])
+
+        self.assertEqual(user_presence.snapshot(now), 1)
+        connections = models.User.objects.get(pk=user.pk).connections
+        self.assertEqual([(connection.http_if_none_match, connection.http_if_modified_since, connection.channel_id) for connection in connections], [tuple(connection2)])
+
+        # Without changes nothing is written
+
+        self.assertEqual(user_presence.snapshot(now), 0)
+
+        # Snapshot is made only when connections change after the interval
+
+        user_presence.connect(user.pk, connection1, now + 30)
+        connections = models.User.objects.get(pk=user.pk).connections
+        self.assertEqual([(connection.http_if_none_match, connection.http_if_modified_since, connection.channel_id) for connection in connections], [tuple(connection2)])
+
+        user_presence.disconnect(user.pk, connection2, now + 61)
+        self.assertEqual(user_presence.changed, set())
+        connections = models.User.objects.get(pk=user.pk).connections
+        self.assertEqual([(connection.http_if_none_match, connection.http_if_modified_since, connection.channel_id) for connection in connections], [tuple(connection1)])
@@ -8,14 +8,14 @@ from django.core import urlresolvers
 from django.template import loader
 from django.views import generic as generic_views
 from django.views.generic import simple, edit as edit_views
-from django.utils import crypto, timezone, translation
+from django.utils import crypto, translation
 from django.utils.translation import ugettext_lazy as _
 
 from pushserver import signals
 
 import tweepy
 
-from piplmesh.account import forms, models
+from piplmesh.account import forms, models, presence
 
 import django_browserid
 from django_browserid import views as browserid_views
@@ -440,29 +440,21 @@ def set_language(request):
             request.user.save()
     return response
 
+def get_connection(request, channel_id):
+    return presence.Connection(
+        http_if_none_match=request.META['HTTP_IF_NONE_MATCH'],
+        http_if_modified_since=request.META['HTTP_IF_MODIFIED_SINCE'],
+        channel_id=channel_id,
+    )
+
 @dispatch.receiver(signals.channel_subscribe)
 def process_channel_subscribe(sender, request, channel_id, **kwargs):
-    request.user.update(
-        push__connections={
-            'http_if_none_match': request.META['HTTP_IF_NONE_MATCH'],
-            'http_if_modified_since': request.META['HTTP_IF_MODIFIED_SINCE'],
-            'channel_id': channel_id,
-        }
-    )
+    # Connections are kept in memory, only presence transitions are stored
+    presence.presence.connect(request.user.id, get_connection(request, channel_id))
 
 @dispatch.receiver(signals.channel_unsubscribe)
 def process_channel_unsubscribe(sender, request, channel_id, **kwargs):
-    models.User.objects(
-        id=request.user.id,
-        connections__http_if_none_match=request.META['HTTP_IF_NONE_MATCH'],
-        connections__http_if_modified_since=request.META['HTTP_IF_MODIFIED_SINCE'],
-        connections__channel_id=channel_id,
-    ).update_one(unset__connections__S=1)
-
-    request.user.update(
-        pull__connections=None,
-        set__connection_last_unsubscribe=timezone.now(),
-    )
+    presence.presence.disconnect(request.user.id, get_connection(request, channel_id))
 
 @dispatch.receiver(auth_signals.user_logged_in)
 def user_login_message(sender, request, user, **kwargs):
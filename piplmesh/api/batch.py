@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+
+import cStringIO as StringIO
+
+from django import http
+from django.conf import settings
+from django.conf.urls import url
+from django.core import urlresolvers
+from django.core.handlers import wsgi
+from django.utils import simplejson as json
+
+from tastypie import api, http as tastypie_http, utils
+
+DEFAULT_MAX_REQUESTS = 20
+
+# Attributes set on a request by middleware which sub-requests share with it
+SHARED_ATTRIBUTES = ('user', 'session', 'LANGUAGE_CODE', 'node')
+
+# Response headers returned for sub-requests
+RESPONSE_HEADERS = ('Location', 'Content-Type')
+
+class BatchApi(api.Api):
+    """
+    API which in addition to registered resources provides a ``batch/``
+    endpoint, which runs multiple API requests in one HTTP request.
+
+    The endpoint accepts a POST with a JSON list of sub-requests, each an
+    object with ``method`` (default ``GET``), ``path`` (full URL path of an
+    API endpoint, with an optional query string) and optional ``body``
+    (JSON payload). Sub-requests are run in order, in-process, reusing
+    the user and session of the batch request, so authentication and
+    middleware are processed only once. Response is a JSON list of
+    objects with ``status``, ``headers`` and ``body`` of each sub-request.
+    """
+
+    def override_urls(self):
+        return [
+            url(r'^(?P<api_name>%s)/batch%s$' % (self.api_name, utils.trailing_slash()), self.wrap_view('batch'), name='api_batch'),
+        ]
+
+    def get_max_requests(self):
+        return getattr(settings, 'API_BATCH_MAX_REQUESTS', DEFAULT_MAX_REQUESTS)
+
+    def batch(self, request, api_name=None):
+        if request.method != 'POST':
+            return tastypie_http.HttpMethodNotAllowed()
+
+        try:
+            sub_requests = json.loads(request.raw_post_data)
+        except ValueError:
+            return tastypie_http.HttpBadRequest("Invalid JSON payload.")
+
+        if not isinstance(sub_requests, list) or not all(isinstance(sub_request, dict) for sub_request in sub_requests):
+            return tastypie_http.HttpBadRequest("Payload has to be a list of requests.")
+
+        if len(sub_requests) > self.get_max_requests():
+            return tastypie_http.HttpBadRequest("Too many requests, at most %d are allowed." % self.get_max_requests())
+
+        responses = [self.run(request, data) for data in sub_requests]
+
+        return http.HttpResponse(json.dumps(responses), content_type='application/json; charset=utf-8')
+
+    def resolve(self, path_info):
+        """
+        Returns view and its arguments for the given path, if the path is
+        an endpoint of this API (but not the batch endpoint itself).
+        """
+
+        try:
+            match = urlresolvers.resolve(path_info)
+        except urlresolvers.Resolver404:
+            return None
+
+        if match.kwargs.get('api_name') != self.api_name or match.url_name == 'api_batch':
+            return None
+
+        return match
+
+    def build_request(self, request, method, path, body):
+        """
+        Returns a sub-request of the given request, sharing its user and session.
+        """
+
+        path, _, query_string = path.partition('?')
+
+        script_prefix = urlresolvers.get_script_prefix()
+        if path.startswith(script_prefix):
+            path = '/' + path[len(script_prefix):]
+
+        environ = dict((key, value) for key, value in request.META.items() if not key.startswith('wsgi.') and key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'))
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string.encode('utf-8'),
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': StringIO.StringIO(body),
+        })
+        if body:
+            environ['CONTENT_TYPE'] = 'application/json'
+            environ['CONTENT_LENGTH'] = str(len(body))
+
+        sub_request = wsgi.WSGIRequest(environ)
+        for name in SHARED_ATTRIBUTES:
+            if hasattr(request, name):
+                setattr(sub_request, name, getattr(request, name))
+        return sub_request
+
+    def run(self, request, data):
+        """
+        Runs one sub-request and returns its response as a dict.
+        """
+
+        method = data.get('method', 'GET')
+        path = data.get('path')
+        if not isinstance(method, basestring) or not isinstance(path, basestring):
+            return {
+                'status': tastypie_http.HttpBadRequest.status_code,
+                'headers': {},
+                'body': "Request requires method and path.",
+            }
+
+        body = data.get('body')
+        body = json.dumps(body) if body is not None else ''
+
+        sub_request = self.build_request(request, method.upper(), path, body)
+
+        match = self.resolve(sub_request.path_info)
+        if match is None:
+            return {
+                'status': tastypie_http.HttpNotFound.status_code,
+                'headers': {},
+                'body': "Unknown API endpoint.",
+            }
+
+        response = match.func(sub_request, *match.args, **match.kwargs)
+
+        content = response.content
+        if content and response.get('Content-Type', '').startswith('application/json'):
+            content = json.loads(content)
+
+        return {
+            'status': response.status_code,
+            'headers': dict((name, response[name]) for name in RESPONSE_HEADERS if response.has_header(name)),
+            'body': content,
+        }
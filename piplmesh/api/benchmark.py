@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+
+import datetime, timeit
+
+from django.contrib.auth import models as auth_models
+from django.test import client
+from django.utils import timezone
+
+import bson
+
+from piplmesh.account import models as account_models
+
+from . import cache, models, resources
+
+DEFAULT_POSTS = 20
+DEFAULT_COMMENTS_COUNTS = (0, 10, 50)
+DEFAULT_REPEATS = 100
+AUTHORS = 10
+
+def make_posts(count, comments):
+    """
+    Returns a list of posts with given number of comments each. Documents are
+    not saved, so benchmark does not depend on the database.
+    """
+
+    authors = []
+    for i in xrange(AUTHORS):
+        author = account_models.User(username='benchmark%d' % i)
+        author.id = bson.ObjectId()
+        authors.append(author)
+
+    now = timezone.now()
+    posts = []
+    for i in xrange(count):
+        post = models.Post(author=authors[i % AUTHORS], message="Benchmark post %d." % i, is_published=True, created_time=now)
+        post.id = bson.ObjectId()
+        post.updated_time = now - datetime.timedelta(seconds=i)
+        post.comments = [models.Comment(author=authors[j % AUTHORS], message="Benchmark comment %d." % j, created_time=now) for j in xrange(comments)]
+        posts.append(post)
+    return posts
+
+def serialize_page(resource, request, posts, dehydrate):
+    bundles = [dehydrate(resource.build_bundle(obj=post, request=request)) for post in posts]
+    return resource.serialize(request, {'objects': bundles}, 'application/json')
+
+def uncached_dehydrate(resource):
+    return lambda bundle: super(resources.PostResource, resource).full_dehydrate(bundle)
+
+def measure(function, repeats, before=None):
+    timer = timeit.default_timer
+    times = []
+    for i in xrange(repeats):
+        if before:
+            before()
+        start = timer()
+        function()
+        times.append(timer() - start)
+    times.sort()
+    return {
+        'mean': sum(times) / len(times),
+        'min': times[0],
+        'p50': times[len(times) // 2],
+        'max': times[-1],
+    }
+
+def run(posts=DEFAULT_POSTS, comments_counts=DEFAULT_COMMENTS_COUNTS, repeats=DEFAULT_REPEATS, log=None):
+    """
+    Measures serialization of a page of posts without the cache, with an empty
+    cache (which has to be filled) and with a warm cache. Returns results as a
+    JSON-serializable dict. Times are in seconds per page.
+    """
+
+    resource = resources.PostResource()
+    request = client.RequestFactory().get(resource.get_resource_list_uri() or '/')
+    request.user = auth_models.AnonymousUser()
+
+    results = []
+    for comments in comments_counts:
+        page = make_posts(posts, comments)
+
+        result = {
+            'posts': posts,
+            'comments': comments,
+            'uncached': measure(lambda: serialize_page(resource, request, page, uncached_dehydrate(resource)), repeats),
+            'cold': measure(lambda: serialize_page(resource, request, page, resource.full_dehydrate), repeats, cache.posts_cache.clear),
+            'warm': measure(lambda: serialize_page(resource, request, page, resource.full_dehydrate), repeats),
+        }
+        results.append(result)
+
+        if log:
+            log("Comments: %(comments)d, uncached: %(uncached).6f s, cold: %(cold).6f s, warm: %(warm).6f s\n" % dict(result, **dict((name, result[name]['p50']) for name in ('uncached', 'cold', 'warm'))))
+
+    cache.posts_cache.clear()
+
+    return {
+        'created_time': datetime.datetime.utcnow().isoformat(),
+        'posts': posts,
+        'repeats': repeats,
+        'results': results,
+    }
@@ -0,0 +1,134 @@
+from __future__ import absolute_import
+
+import calendar, collections, hashlib, threading
+
+from django.conf import settings
+from django.core import cache as django_cache
+from django.utils import translation
+
+DEFAULT_SIZE = 1000
+
+class LRUCache(object):
+    """
+    Thread-safe in-process cache holding up to ``size`` most recently used entries.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Reinserted entry becomes the most recently used
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.size < 1:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+class VersionedCache(object):
+    """
+    Cache of serialized representations of documents, keyed by document ID, its
+    version (time of the last update) and language. So entries do not have to
+    be invalidated, changed documents are simply stored under new keys.
+
+    It has an in-process LRU tier and an optional shared tier, a Django cache
+    with the given name, which is used on local misses.
+    """
+
+    def __init__(self, prefix, size=DEFAULT_SIZE, shared_cache=None):
+        self.prefix = prefix
+        self.local = LRUCache(size)
+        self.shared_cache = shared_cache
+        self._shared = None
+
+    def get_shared(self):
+        if self.shared_cache is None:
+            return None
+        if self._shared is None:
+            self._shared = django_cache.get_cache(self.shared_cache)
+        return self._shared
+
+    def get_key(self, document_id, version, language=None):
+        if language is None:
+            language = translation.get_language()
+        if hasattr(version, 'utctimetuple'):
+            version = calendar.timegm(version.utctimetuple()) * 1000 + version.microsecond // 1000
+        return (str(document_id), version, language)
+
+    def get_shared_key(self, key):
+        # Keys can contain any characters and be long, so we hash them to get valid memcached keys
+        return '%s:%s' % (self.prefix, hashlib.md5(u':'.join(unicode(part) for part in key).encode('utf-8')).hexdigest())
+
+    def get_many(self, keys):
+        """
+        Returns a dict of found entries for given keys.
+        """
+
+        result = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                result[key] = value
+
+        shared = self.get_shared()
+        if missing and shared is not None:
+            shared_keys = dict((self.get_shared_key(key), key) for key in missing)
+            for shared_key, value in shared.get_many(shared_keys.keys()).items():
+                key = shared_keys[shared_key]
+                self.local.set(key, value)
+                result[key] = value
+
+        return result
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def set(self, key, value):
+        self.local.set(key, value)
+
+        shared = self.get_shared()
+        if shared is not None:
+            shared.set(self.get_shared_key(key), value)
+
+    def clear(self):
+        """
+        Clears the in-process tier.
+        """
+
+        self.local.clear()
+
+posts_cache = VersionedCache(
+    'piplmesh.api.post',
+    getattr(settings, 'API_POSTS_CACHE_SIZE', DEFAULT_SIZE),
+    getattr(settings, 'API_POSTS_CACHE_BACKEND', None),
+)
@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+
+import collections
+
+import mongoengine
+
+from bson import dbref
+
+class IdentityMap(object):
+    """
+    Map of already fetched documents, keyed by document class and ID, so that
+    each referenced document is fetched only once.
+    """
+
+    def __init__(self):
+        self.documents = collections.defaultdict(dict)
+
+    def add(self, document):
+        self.documents[document.__class__][document.pk] = document
+
+    def get(self, document_class, document_id):
+        return self.documents[document_class].get(document_id)
+
+    def fetch(self, document_class, document_ids):
+        """
+        Fetches documents with given IDs which are not yet in the map, all in one query.
+        """
+
+        documents = self.documents[document_class]
+        missing = [document_id for document_id in document_ids if document_id not in documents]
+        if missing:
+            documents.update(document_class.objects.in_bulk(missing))
+
+def get_identity_map(request):
+    """
+    Returns identity map for the given request, creating it if necessary. User
+    making the request is already in the map.
+    """
+
+    if request is None:
+        return IdentityMap()
+
+    identity_map = getattr(request, '_identity_map', None)
+    if identity_map is None:
+        identity_map = request._identity_map = IdentityMap()
+        user = getattr(request, 'user', None)
+        if isinstance(user, mongoengine.Document) and user.pk is not None:
+            identity_map.add(user)
+    return identity_map
+
+def get_id(reference):
+    """
+    Returns ID of a referenced document, given either as a DBRef or a document.
+    """
+
+    if isinstance(reference, dbref.DBRef):
+        return reference.id
+    elif reference is not None:
+        return reference.pk
+    return None
+
+def get_reference_id(document, name):
+    """
+    Returns ID of the document referenced by the given reference field,
+    without dereferencing it.
+    """
+
+    return get_id(document._data.get(name))
+
+def get_targets(documents, path):
+    """
+    Returns a list of ``(document, field name)`` pairs for reference fields
+    at the given dotted path, following embedded documents and lists of them.
+    """
+
+    parts = path.split('.')
+    targets = list(documents)
+    for part in parts[:-1]:
+        next_targets = []
+        for target in targets:
+            value = getattr(target, part, None)
+            if isinstance(value, (list, tuple)):
+                next_targets.extend(value)
+            elif value is not None:
+                next_targets.append(value)
+        targets = next_targets
+    return [(target, parts[-1]) for target in targets]
+
+def dereference(documents, paths, identity_map=None):
+    """
+    Dereferences reference fields at given dotted paths (for example
+    ``comments.author``) of all given documents in bulk, with one query per
+    referenced document class and path, instead of one query per reference.
+
+    Paths are processed in order, so a path can continue through a reference
+    dereferenced by a previous path.
+    """
+
+    if identity_map is None:
+        identity_map = IdentityMap()
+
+    for path in paths:
+        references = []
+        document_ids = collections.defaultdict(set)
+        for target, name in get_targets(documents, path):
+            field = target._fields.get(name)
+            value = target._data.get(name)
+            if isinstance(field, mongoengine.ReferenceField) and isinstance(value, dbref.DBRef):
+                references.append((target, name, field.document_type, value.id))
+                document_ids[field.document_type].add(value.id)
+
+        for document_class, ids in document_ids.items():
+            identity_map.fetch(document_class, ids)
+
+        for target, name, document_class, document_id in references:
+            document = identity_map.get(document_class, document_id)
+            if document is not None:
+                # Reference field returns an already dereferenced document as it is
+                target._data[name] = document
+
+    return documents
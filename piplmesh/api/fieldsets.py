@@ -0,0 +1,126 @@
+from __future__ import absolute_import
+
+from tastypie import bundle as tastypie_bundle
+
+# Fields which are always returned, so that objects can be identified
+ALWAYS_INCLUDED_FIELDS = ('id', 'resource_uri', 'resource_type')
+
+class Fieldsets(object):
+    """
+    Fields requested with ``fields`` and ``embed`` query parameters.
+
+    ``fields`` is a comma-separated list of fields to return, dotted names
+    (for example ``author.username``) select fields of embedded objects.
+    ``embed`` is a comma-separated list of related fields which should be
+    embedded in full, also those which are by default returned only as URIs,
+    other related fields are returned only as URIs. Without parameters all
+    fields are returned as declared.
+    """
+
+    def __init__(self, fields=None, embed=None):
+        self.fields = None
+        self.nested_fields = {}
+        if fields is not None:
+            self.fields = set()
+            for name in fields:
+                name, _, nested_name = name.partition('.')
+                self.fields.add(name)
+                if nested_name:
+                    self.nested_fields.setdefault(name, set()).add(nested_name)
+
+        self.embed = set(embed) if embed is not None else None
+
+    def __nonzero__(self):
+        return self.fields is not None or self.embed is not None
+
+    def get_key(self, resource_fields):
+        """
+        Returns a string identifying requested fields, for use in cache keys.
+
+        Only names of given resource fields (and of fields of resources they
+        relate to) are included, sorted, so that names of unknown fields do
+        not make new keys.
+        """
+
+        if not self:
+            return ''
+
+        if self.fields is not None:
+            names = set(name for name in self.fields if name in resource_fields)
+            for name, nested_names in self.nested_fields.items():
+                if name not in resource_fields:
+                    continue
+                related_names = get_related_field_names(resource_fields[name])
+                # Nested fields of a field are filtered even if none of them is known, so we always mark them
+                names.add('%s.' % name)
+                names.update('%s.%s' % (name, nested_name) for nested_name in nested_names if nested_name in related_names)
+            fields = ','.join(sorted(names))
+        else:
+            fields = '*'
+
+        if self.embed is not None:
+            embed = ','.join(sorted(name for name in self.embed if name in resource_fields))
+        else:
+            embed = '*'
+
+        return '%s|%s' % (fields, embed)
+
+    def is_requested(self, field_name):
+        return self.fields is None or field_name in self.fields or field_name in ALWAYS_INCLUDED_FIELDS
+
+    def is_embedded(self, field_name, full):
+        if self.embed is None:
+            return full
+        return field_name in self.embed
+
+    def filter_nested(self, field_name, value):
+        """
+        Removes unrequested fields from embedded objects of the given field.
+        """
+
+        nested_names = self.nested_fields.get(field_name)
+        if not nested_names:
+            return value
+
+        for nested_bundle in (value if isinstance(value, (list, tuple)) else [value]):
+            if isinstance(nested_bundle, tastypie_bundle.Bundle):
+                for name in nested_bundle.data.keys():
+                    if name not in nested_names and name not in ALWAYS_INCLUDED_FIELDS:
+                        del nested_bundle.data[name]
+        return value
+
+def get_related_field_names(field_object):
+    """
+    Returns names of fields of the resource (and of its polymorphic
+    resources) the given related field relates to.
+    """
+
+    to_class = getattr(field_object, 'to_class', None)
+    if to_class is None:
+        return set()
+
+    names = set(to_class.base_fields)
+    for resource in getattr(to_class._meta, 'polymorphic', {}).values():
+        names.update(resource.base_fields)
+    return names
+
+def split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def get_fieldsets(request):
+    """
+    Returns fieldsets requested by the given request, parsed only once per request.
+    """
+
+    if request is None:
+        return Fieldsets()
+
+    fieldsets = getattr(request, '_fieldsets', None)
+    if fieldsets is None:
+        fields = request.GET.get('fields')
+        embed = request.GET.get('embed')
+        fieldsets = request._fieldsets = Fieldsets(
+            split(fields) if fields is not None else None,
+            split(embed) if embed is not None else None,
+        )
+    return fieldsets
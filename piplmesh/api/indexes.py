@@ -0,0 +1,70 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.test import client
+from django.utils import timezone
+
+import bson
+
+from piplmesh.account import models as account_models
+
+from . import paginator
+
+FULL_SCAN_CURSOR = 'BasicCursor'
+FULL_SCAN_STAGE = 'COLLSCAN'
+
+def get_resource_queries(resource, user):
+    """
+    Returns a list of ``(name, queryset)`` pairs of default queries which the
+    resource runs when listing objects for the given user.
+    """
+
+    request = client.RequestFactory().get(resource.get_resource_list_uri() or '/')
+    request.user = user
+
+    limit = resource._meta.limit or getattr(settings, 'API_LIMIT_PER_PAGE', 20)
+    objects = resource.apply_sorting(resource.obj_get_list(request=request), options=request.GET)
+
+    queries = [('list', objects.limit(limit))]
+
+    paginator_class = resource._meta.paginator_class
+    if issubclass(paginator_class, paginator.KeysetPaginator):
+        cursor_paginator = paginator_class(request.GET, objects, limit=limit)
+        obj = resource._meta.object_class(id=bson.ObjectId(), **{paginator_class.time_field: timezone.now()})
+        cursor = cursor_paginator.encode_cursor(obj)
+        queries.append(('after cursor', objects.filter(cursor_paginator.get_cursor_filter(cursor, False)).limit(limit)))
+        queries.append(('before cursor', objects.filter(cursor_paginator.get_cursor_filter(cursor, True)).order_by(paginator_class.time_field, 'id').limit(limit)))
+
+    return queries
+
+def get_api_queries(api):
+    """
+    Returns a list of ``(resource name, query name, queryset)`` triples of
+    default queries of all listable resources registered in the given API.
+    """
+
+    # An unsaved user is enough, queries only reference it
+    user = account_models.User(username='checkindexes')
+    user.id = bson.ObjectId()
+
+    queries = []
+    for resource_name, resource in sorted(api._registry.items()):
+        if getattr(resource._meta, 'queryset', None) is None or 'get' not in resource._meta.list_allowed_methods:
+            continue
+        for name, queryset in get_resource_queries(resource, user):
+            queries.append((resource_name, name, queryset))
+    return queries
+
+def is_full_scan(plan):
+    """
+    Returns ``True`` if explain plan (of any MongoDB version) contains a full
+    collection scan, also in any of ``$or`` clauses.
+    """
+
+    if isinstance(plan, dict):
+        if unicode(plan.get('cursor', '')).startswith(FULL_SCAN_CURSOR) or plan.get('stage') == FULL_SCAN_STAGE:
+            return True
+        return any(is_full_scan(value) for value in plan.values())
+    elif isinstance(plan, (list, tuple)):
+        return any(is_full_scan(value) for value in plan)
+    return False
@@ -0,0 +1,47 @@
+import json
+from optparse import make_option
+
+from django.core.management import base
+
+from piplmesh.api import benchmark
+
+class Command(base.BaseCommand):
+    option_list = base.BaseCommand.option_list + (
+        make_option('--posts', action='store', type='int', dest='posts', default=benchmark.DEFAULT_POSTS,
+            help='Number of posts in a page. Default is %default.'),
+        make_option('--comments', action='store', dest='comments', default=','.join(str(count) for count in benchmark.DEFAULT_COMMENTS_COUNTS),
+            help='Comma-separated list of numbers of comments per post. Default is "%default".'),
+        make_option('--repeats', action='store', type='int', dest='repeats', default=benchmark.DEFAULT_REPEATS,
+            help='Number of times each page is serialized. Default is %default.'),
+        make_option('--output', action='store', dest='output', default=None,
+            help='File to write JSON results to. By default they are written to standard output.'),
+    )
+    help = 'Benchmark serialization of a page of posts with and without the posts cache.'
+
+    def handle(self, *args, **options):
+        """
+        Runs posts serialization benchmark and outputs results as JSON.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        try:
+            comments_counts = [int(count) for count in options['comments'].split(',')]
+        except ValueError:
+            raise base.CommandError("Invalid comments counts: '%s'" % options['comments'])
+
+        if options['posts'] < 1 or options['repeats'] < 1:
+            raise base.CommandError("Number of posts and repeats has to be positive.")
+
+        log = self.stderr.write if verbosity > 1 else None
+
+        results = benchmark.run(options['posts'], comments_counts, options['repeats'], log=log)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=4)
+            if verbosity > 0:
+                self.stdout.write("Results written to '%s'.\n" % options['output'])
+        else:
+            json.dump(results, self.stdout, indent=4)
+            self.stdout.write('\n')
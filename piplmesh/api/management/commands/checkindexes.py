@@ -0,0 +1,29 @@
+from django.core.management import base
+
+from piplmesh import urls
+from piplmesh.api import indexes
+
+class Command(base.NoArgsCommand):
+    help = 'Explain default queries of API resources and report those which scan whole collections.'
+
+    def handle_noargs(self, **options):
+        """
+        Explains default queries and fails if any of them is a full collection scan.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        full_scans = []
+        for resource_name, query_name, queryset in indexes.get_api_queries(urls.v1_api):
+            plan = queryset.explain()
+
+            if indexes.is_full_scan(plan):
+                full_scans.append((resource_name, query_name))
+                self.stdout.write("%s (%s): full collection scan\n" % (resource_name, query_name))
+                if verbosity > 1:
+                    self.stdout.write("%s\n" % queryset.explain(format=True))
+            elif verbosity > 0:
+                self.stdout.write("%s (%s): uses index\n" % (resource_name, query_name))
+
+        if full_scans:
+            raise base.CommandError("%d queries scan whole collections." % len(full_scans))
@@ -0,0 +1,24 @@
+from django.core.management import base
+
+from piplmesh.account import models as account_models
+from piplmesh.api import models as api_models
+
+class Command(base.NoArgsCommand):
+    help = 'Recount unread notifications of all users. Run it on deploy, users created before the counter was introduced have it unset.'
+
+    def handle_noargs(self, **options):
+        """
+        Sets unread notifications counter of every user to the number of their unread notifications.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        updated = 0
+        for user in account_models.User.objects.only('unread_notifications_count'):
+            count = api_models.Notification.objects(recipient=user, read=False).count()
+            if user.unread_notifications_count != count:
+                account_models.User.objects(pk=user.pk).update_one(set__unread_notifications_count=count)
+                updated += 1
+
+        if verbosity > 0:
+            self.stdout.write('Unread notifications of %d users have been recounted.\n' % updated)
@@ -1,14 +1,17 @@
 from __future__ import absolute_import
 
-from django.utils import timezone
+from django.utils import text, timezone
 
 import mongoengine
 
+from bson import dbref
+
 from . import base
 from piplmesh.account import models as account_models
 
 POST_MESSAGE_MAX_LENGTH = 500
 COMMENT_MESSAGE_MAX_LENGTH = 300
+NOTIFICATION_COMMENT_EXCERPT_LENGTH = 100
 
 class Comment(base.AuthoredEmbeddedDocument):
     """
@@ -41,10 +44,59 @@ class Post(base.AuthoredDocument):
     # TODO: Prevent marking post as unpublished once it was published
     is_published = mongoengine.BooleanField(default=False, required=True)
 
+    meta = {
+        # Indexes match access paths of PostResource: feed is sorted by updated
+        # time (and ID for cursors), filtered to published posts or those of the author
+        'indexes': [
+            ('-updated_time', '-id'),
+            ('is_published', '-updated_time', '-id'),
+            ('author', '-updated_time', '-id'),
+        ],
+    }
+
     def save(self, *args, **kwargs):
         self.updated_time = timezone.now()
         return super(Post, self).save(*args, **kwargs)
 
+    def add_comment(self, comment):
+        """
+        Atomically appends the comment to the post, subscribes its author to the
+        post and bumps updated time, without rewriting the whole post.
+
+        Returns index of the new comment, or ``None`` if post does not exist
+        anymore. This instance is updated accordingly, but it does not reflect
+        concurrent changes.
+        """
+
+        comment.validate()
+
+        updated_time = timezone.now()
+        # We get back only minimal data, enough to know the index of the new comment
+        result = self._get_collection().find_and_modify(
+            query={'_id': self.pk},
+            update={
+                '$push': {'comments': comment.to_mongo()},
+                '$addToSet': {'subscribers': self._fields['subscribers'].field.to_mongo(comment.author)},
+                '$set': {'updated_time': updated_time},
+            },
+            fields={'comments.created_time': True},
+            new=True,
+        )
+
+        if result is None:
+            return None
+
+        index = len(result['comments']) - 1
+
+        self.comments.append(comment)
+        if comment.author.pk not in [subscriber.pk for subscriber in self.subscribers]:
+            self.subscribers.append(comment.author)
+        self.updated_time = updated_time
+        # Changes are already stored, so they should not be saved again
+        self._clear_changed_fields()
+
+        return index
+
 class Notification(mongoengine.Document):
     """
     This class defines document type for notifications.
@@ -58,6 +110,78 @@ class Notification(mongoengine.Document):
     # TODO: This is probably not the best approach, https://github.com/wlanslovenija/PiplMesh/issues/299
     comment = mongoengine.IntField()
 
+    # Snapshot of the comment, so that notification can be shown without loading the whole post
+    comment_author = mongoengine.ReferenceField(account_models.User)
+    comment_message = mongoengine.StringField()
+    comment_created_time = mongoengine.DateTimeField()
+
+    meta = {
+        # Notifications are always accessed by recipient
+        'indexes': [
+            ('recipient', 'read', '-created_time'),
+            ('recipient', '-created_time'),
+        ],
+    }
+
+    @classmethod
+    def mark_read(cls, recipient, notification_ids=None):
+        """
+        Marks all unread notifications of the recipient, or only those with given
+        IDs, as read with one multi-update and decrements recipient's unread
+        notifications counter accordingly.
+
+        Returns the number of notifications marked as read.
+        """
+
+        notifications = cls.objects(recipient=recipient, read=False)
+        if notification_ids is not None:
+            notifications = notifications.filter(pk__in=notification_ids)
+
+        count = notifications.update(set__read=True)
+        if count:
+            account_models.User.objects(pk=recipient.pk).update_one(dec__unread_notifications_count=count)
+
+        return count
+
+    def set_comment(self, comment_index, comment):
+        """
+        Sets the comment notification is about, storing its snapshot.
+        """
+
+        self.comment = comment_index
+        # We copy the reference, so that author does not have to be dereferenced
+        self.comment_author = comment._data['author']
+        self.comment_message = text.Truncator(comment.message).chars(NOTIFICATION_COMMENT_EXCERPT_LENGTH)
+        self.comment_created_time = comment.created_time
+
+    def has_snapshot(self):
+        return self.comment_message is not None
+
+    def get_post(self):
+        """
+        Returns the post if it has already been loaded, otherwise just a post
+        with its ID, without loading it.
+        """
+
+        post = self._data.get('post')
+        if isinstance(post, dbref.DBRef):
+            return Post(id=post.id)
+        return post
+
+    def get_comment(self):
+        """
+        Returns the comment, as stored in the snapshot. Notifications created
+        without a snapshot load the whole post.
+        """
+
+        if not self.has_snapshot():
+            return self.post.comments[self.comment]
+
+        comment = Comment(message=self.comment_message, created_time=self.comment_created_time)
+        # We copy the reference, so that author is dereferenced only when needed
+        comment._data['author'] = self._data.get('comment_author')
+        return comment
+
 class UploadedFile(base.AuthoredDocument):
     """
     This class document type for uploaded files.
@@ -66,6 +190,12 @@ class UploadedFile(base.AuthoredDocument):
     filename = mongoengine.StringField(required=True)
     content_type = mongoengine.StringField()
 
+    meta = {
+        'indexes': [
+            ('author', '-created_time'),
+        ],
+    }
+
 class ImageAttachment(Attachment):
     """
     This class defines document type for image attachments.
@@ -0,0 +1,110 @@
+from __future__ import absolute_import
+
+import base64, calendar, datetime, json, urllib
+
+from django.utils import timezone
+
+from mongoengine import queryset
+from tastypie import exceptions
+
+from tastypie_mongoengine import paginator
+
+import bson
+from bson import errors
+
+class KeysetPaginator(paginator.Paginator):
+    """
+    Paginator which paginates by a continuation cursor over ``(updated_time, id)``
+    keys, in the descending order, instead of by an offset.
+
+    ``after`` cursor returns older objects than those which were seen, ``before``
+    cursor newer ones. Cursors are opaque tokens returned in ``meta`` of each
+    page. So every page is just one indexed range scan, without counting or
+    skipping objects, and pages stay consistent when objects are updated
+    between requests.
+
+    Requests with ``offset`` are still served as by the offset-based paginator.
+    """
+
+    time_field = 'updated_time'
+
+    def encode_cursor(self, obj):
+        time = getattr(obj, self.time_field)
+        milliseconds = calendar.timegm(time.utctimetuple()) * 1000 + time.microsecond // 1000
+        return base64.urlsafe_b64encode(json.dumps([milliseconds, str(obj.pk)]))
+
+    def decode_cursor(self, cursor):
+        try:
+            milliseconds, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            time = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc) + datetime.timedelta(milliseconds=milliseconds)
+            return time, bson.ObjectId(pk)
+        except (TypeError, ValueError, errors.InvalidId):
+            raise exceptions.BadRequest("Invalid cursor '%s' provided." % cursor)
+
+    def get_cursor_filter(self, cursor, newer):
+        time, pk = self.decode_cursor(cursor)
+        operator = 'gt' if newer else 'lt'
+        return queryset.Q(**{'%s__%s' % (self.time_field, operator): time}) | queryset.Q(**{self.time_field: time, 'id__%s' % operator: pk})
+
+    def get_cursor_uri(self, limit, name, cursor):
+        if self.resource_uri is None or cursor is None:
+            return None
+
+        request_params = dict((key, value.encode('utf-8')) for key, value in self.request_data.items() if key not in ('offset', 'before', 'after'))
+        request_params.update({'limit': limit, name: cursor})
+        return '%s?%s' % (self.resource_uri, urllib.urlencode(request_params))
+
+    def page(self):
+        if 'offset' in self.request_data:
+            return super(KeysetPaginator, self).page()
+
+        limit = self.get_limit()
+        if limit < 0:
+            raise exceptions.BadRequest("Invalid limit '%s' provided. Please provide a non-negative integer." % limit)
+
+        before = self.request_data.get('before')
+        after = self.request_data.get('after')
+        if before and after:
+            raise exceptions.BadRequest("Only one of 'before' and 'after' cursors can be provided.")
+
+        objects = self.objects
+        if before:
+            objects = objects.filter(self.get_cursor_filter(before, True)).order_by(self.time_field, 'id')
+        elif after:
+            objects = objects.filter(self.get_cursor_filter(after, False)).order_by('-%s' % self.time_field, '-id')
+
+        # We fetch one object more to know if there are more objects
+        if limit:
+            objects = list(objects.limit(limit + 1))
+            has_more = len(objects) > limit
+            objects = objects[:limit]
+        else:
+            objects = list(objects)
+            has_more = False
+
+        if before:
+            objects.reverse()
+
+        if objects:
+            previous_cursor = self.encode_cursor(objects[0])
+            next_cursor = self.encode_cursor(objects[-1])
+        else:
+            previous_cursor = before or None
+            next_cursor = after or None
+
+        # Newer objects can always appear, older ones cannot
+        if not before and not has_more:
+            next_cursor = None
+
+        meta = {
+            'limit': limit,
+            'previous_cursor': previous_cursor,
+            'next_cursor': next_cursor,
+            'previous': self.get_cursor_uri(limit, 'before', previous_cursor),
+            'next': self.get_cursor_uri(limit, 'after', next_cursor),
+        }
+
+        return {
+            'objects': objects,
+            'meta': meta,
+        }
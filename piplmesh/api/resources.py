@@ -1,25 +1,170 @@
-from tastypie import authorization as tastypie_authorization, fields as tastypie_fields
+import copy
 
-from tastypie_mongoengine import fields as tastypie_mongoengine_fields, paginator, resources
+from django.conf.urls import url
+
+from tastypie import authorization as tastypie_authorization, exceptions as tastypie_exceptions, fields as tastypie_fields, http as tastypie_http, utils
+
+from tastypie_mongoengine import fields as tastypie_mongoengine_fields, resources
+
+import mongoengine
+
+import bson
+from bson import errors
 
 from piplmesh.account import models as account_models
-from piplmesh.api import authorization, fields, models as api_models, signals, tasks
+from piplmesh.api import authorization, cache, dereference, fields, fieldsets, models as api_models, paginator, signals, tasks
+
+class FieldsetsResource(resources.MongoEngineResource):
+    """
+    Resource which supports ``fields`` and ``embed`` query parameters (see
+    ``fieldsets.Fieldsets``), so that clients can fetch only what they use.
+
+    Unrequested fields are not dehydrated and references which are not
+    embedded are not dereferenced. Parameters apply to the resource which
+    is requested, not to resources embedded in it. Embedding fields which
+    are not related fields of the resource is a bad request.
+
+    ``always_embedded_fields`` lists related fields which cannot be returned
+    as URIs, so they are embedded also when they are not in ``embed``.
+    """
+
+    always_embedded_fields = ()
+
+    def dispatch(self, request_type, request, **kwargs):
+        if not hasattr(request, '_fieldsets_resource_class'):
+            request._fieldsets_resource_class = self.__class__
+            self.check_embed(request)
+        return super(FieldsetsResource, self).dispatch(request_type, request, **kwargs)
+
+    def check_embed(self, request):
+        requested = self.get_fieldsets(request)
+        if requested.embed is None:
+            return
+
+        related_fields = set(field_name for field_name, field_object in self.fields.items() if getattr(field_object, 'dehydrated_type', None) == 'related')
+        for resource in getattr(self._meta, 'polymorphic', {}).values():
+            related_fields.update(field_name for field_name, field_object in resource.base_fields.items() if getattr(field_object, 'dehydrated_type', None) == 'related')
+
+        unknown = requested.embed - related_fields
+        if unknown:
+            raise tastypie_exceptions.BadRequest("Fields cannot be embedded: %s" % ', '.join(sorted(unknown)))
+
+    def get_fieldsets(self, request):
+        if getattr(request, '_fieldsets_resource_class', None) is not self.__class__:
+            return fieldsets.Fieldsets()
+        return fieldsets.get_fieldsets(request)
+
+    def dehydrate_related_uri(self, bundle, field_object):
+        """
+        Returns only URI (or URIs) of related objects, without dereferencing them.
+        """
+
+        if not getattr(field_object, 'is_m2m', False):
+            document_field = bundle.obj._fields.get(field_object.attribute) if field_object.attribute else None
+            if isinstance(document_field, mongoengine.ReferenceField):
+                document_id = dereference.get_reference_id(bundle.obj, field_object.attribute)
+                if document_id is None:
+                    return None
+                related_object = document_field.document_type(id=document_id)
+                return field_object.get_related_resource(related_object).get_resource_uri(related_object)
+
+        # Fields are shared between requests, so we change a copy
+        field_object = copy.copy(field_object)
+        field_object.full = False
+        return field_object.dehydrate(bundle)
+
+    def full_dehydrate(self, bundle):
+        requested = self.get_fieldsets(bundle.request)
+        if not requested or (getattr(self._meta, 'polymorphic', {}) and self._meta.object_class is not bundle.obj.__class__):
+            return super(FieldsetsResource, self).full_dehydrate(bundle)
+
+        # Same as in tastypie, only with unrequested fields skipped
+        for field_name, field_object in self.fields.items():
+            if not requested.is_requested(field_name):
+                continue
+
+            if getattr(field_object, 'dehydrated_type', None) == 'related':
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+
+                if field_name in self.always_embedded_fields or requested.is_embedded(field_name, field_object.full):
+                    if not field_object.full:
+                        # Fields are shared between requests, so we change a copy
+                        field_object = copy.copy(field_object)
+                        field_object.full = True
+                    bundle.data[field_name] = requested.filter_nested(field_name, field_object.dehydrate(bundle))
+                else:
+                    bundle.data[field_name] = self.dehydrate_related_uri(bundle, field_object)
+            else:
+                bundle.data[field_name] = field_object.dehydrate(bundle)
+
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
 
-class UserResource(resources.MongoEngineResource):
+        bundle = self.dehydrate(bundle)
+        return bundle
+
+class UserResource(FieldsetsResource):
     class Meta:
         queryset = account_models.User.objects.all()
         fields = ('username', 'is_online')
         allowed_methods = ()
 
-class UploadedFileResource(resources.MongoEngineResource):
+class UploadedFileResource(FieldsetsResource):
     class Meta:
         queryset = api_models.UploadedFile.objects.all()
         allowed_methods = ()
 
-class AuthoredResource(resources.MongoEngineResource):
+class DereferencingResource(FieldsetsResource):
+    """
+    Resource which dereferences references of all objects of a listed page in
+    bulk before they are dehydrated, instead of one by one while dehydrating.
+
+    ``dereference_paths`` lists dotted paths to reference fields to dereference.
+    Paths through resource fields which are not requested or embedded are skipped.
+    """
+
+    dereference_paths = ()
+
+    def get_list(self, request, **kwargs):
+        # Same as in tastypie, only with bulk dereferencing added
+        objects = self.obj_get_list(request=request, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+
+        list_paginator = self._meta.paginator_class(request.GET, sorted_objects, resource_uri=self.get_resource_list_uri(), limit=self._meta.limit)
+        to_be_serialized = list_paginator.page()
+
+        page_objects = list(to_be_serialized['objects'])
+        self.dereference_objects(request, page_objects)
+
+        # Dehydrate the bundles in preparation for serialization.
+        bundles = [self.build_bundle(obj=obj, request=request) for obj in page_objects]
+        to_be_serialized['objects'] = [self.full_dehydrate(bundle) for bundle in bundles]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
+
+    def get_dereference_paths(self, request):
+        requested = self.get_fieldsets(request)
+
+        paths = []
+        for path in self.dereference_paths:
+            field_name = path.split('.', 1)[0]
+            field_object = self.fields.get(field_name)
+            if field_object is not None and not (requested.is_requested(field_name) and requested.is_embedded(field_name, getattr(field_object, 'full', False))):
+                continue
+            paths.append(path)
+        return paths
+
+    def dereference_objects(self, request, objects):
+        dereference.dereference(objects, self.get_dereference_paths(request), dereference.get_identity_map(request))
+
+class AuthoredResource(DereferencingResource):
     created_time = tastypie_fields.DateTimeField(attribute='created_time', null=False, readonly=True)
     author = tastypie_mongoengine_fields.ReferenceField(to='piplmesh.api.resources.UserResource', attribute='author', null=False, full=True, readonly=True)
 
+    dereference_paths = ('author',)
+
     def hydrate(self, bundle):
         bundle = super(AuthoredResource, self).hydrate(bundle)
         bundle.obj.author = bundle.request.user
@@ -27,12 +172,22 @@ class AuthoredResource(resources.MongoEngineResource):
 
 class CommentResource(AuthoredResource):
     def obj_create(self, bundle, request=None, **kwargs):
-        bundle = super(CommentResource, self).obj_create(bundle, request=request, **kwargs)
+        # We do not save the whole post, but atomically add the comment to it
+        bundle.obj = self._meta.object_class()
+
+        for key, value in kwargs.items():
+            setattr(bundle.obj, key, value)
+
+        bundle = self.full_hydrate(bundle)
+        self.save_related(bundle)
 
         # By default, comment author is subscribed to the post
-        if bundle.obj.author not in self.instance.subscribers:
-            self.instance.subscribers.append(bundle.obj.author)
-            self.instance.save()
+        index = self.instance.add_comment(bundle.obj)
+        if index is None:
+            raise tastypie_exceptions.NotFound("A document instance matching the provided arguments could not be found.")
+        bundle.obj.pk = unicode(index)
+
+        self.save_m2m(self.hydrate_m2m(bundle))
 
         signals.comment_created.send(sender=self, comment=bundle.obj, post=self.instance, request=request or bundle.request, bundle=bundle)
 
@@ -48,15 +203,100 @@ class CommentResource(AuthoredResource):
         # TODO: Make proper authorization, current implementation is for development use only
         authorization = tastypie_authorization.Authorization()
 
-class NotificationResource(resources.MongoEngineResource):
-    post = tastypie_mongoengine_fields.ReferenceField(to='piplmesh.api.resources.PostResource', attribute='post', null=False, full=False)
-    comment = fields.CustomReferenceField(to='piplmesh.api.resources.CommentResource', attribute_getter=lambda obj: obj.post.comments[obj.comment], target_attribute='_comment_proxy', null=False, full=True)
+class NotificationResource(DereferencingResource):
+    """
+    Notifications are served from the snapshot of the comment they store, so
+    posts have to be loaded only for notifications without it.
+    """
+
+    post = fields.CustomReferenceField(to='piplmesh.api.resources.PostResource', attribute_getter=lambda obj: obj.get_post(), target_attribute='_post_proxy', null=False, full=False)
+    comment = fields.CustomReferenceField(to='piplmesh.api.resources.CommentResource', attribute_getter=lambda obj: obj.get_comment(), target_attribute='_comment_proxy', null=False, full=True)
+
+    dereference_paths = ('comment_author',)
+
+    # Comments are embedded documents without URIs of their own
+    always_embedded_fields = ('comment',)
+
+    def is_post_embedded(self, request):
+        requested = self.get_fieldsets(request)
+        return requested.is_requested('post') and requested.is_embedded('post', self.fields['post'].full)
+
+    def dereference_objects(self, request, objects):
+        if self.is_post_embedded(request):
+            # Embedded posts are dehydrated in full, so all of them have to be loaded
+            dereference.dereference(objects, ('post',) + tuple('post.%s' % path for path in PostResource.dereference_paths), dereference.get_identity_map(request))
+        else:
+            # Only notifications without snapshot need whole posts
+            dereference.dereference([obj for obj in objects if not obj.has_snapshot()], ('post', 'post.comments.author'), dereference.get_identity_map(request))
+        super(NotificationResource, self).dereference_objects(request, objects)
+
+    def obj_get(self, request=None, **kwargs):
+        obj = super(NotificationResource, self).obj_get(request, **kwargs)
+        if self.is_post_embedded(request):
+            self.dereference_objects(request, [obj])
+        return obj
+
+    def override_urls(self):
+        return [
+            url(r'^(?P<resource_name>%s)/unread%s$' % (self._meta.resource_name, utils.trailing_slash()), self.wrap_view('get_unread'), name='api_notifications_unread'),
+            url(r'^(?P<resource_name>%s)/read%s$' % (self._meta.resource_name, utils.trailing_slash()), self.wrap_view('mark_read'), name='api_notifications_read'),
+        ]
+
+    def get_unread_response(self, request, user, **data):
+        # Counter can be temporary negative if notifications are marked read before counter is incremented
+        data['unread_count'] = max(0, user.unread_notifications_count or 0)
+        return self.create_response(request, data)
+
+    def get_unread(self, request, **kwargs):
+        """
+        Returns the number of unread notifications of the user, without counting them.
+        """
+
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        if not request.user.is_authenticated():
+            return tastypie_http.HttpUnauthorized()
+
+        self.log_throttled_access(request)
+        return self.get_unread_response(request, request.user)
+
+    def mark_read(self, request, **kwargs):
+        """
+        Marks notifications with IDs given in ``ids`` list as read, or all
+        notifications if ``ids`` is not given.
+        """
+
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        if not request.user.is_authenticated():
+            return tastypie_http.HttpUnauthorized()
+
+        data = {}
+        if request.raw_post_data:
+            data = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+
+        notification_ids = data.get('ids')
+        if notification_ids is not None:
+            try:
+                notification_ids = [bson.ObjectId(notification_id) for notification_id in notification_ids]
+            except (TypeError, errors.InvalidId):
+                raise tastypie_exceptions.BadRequest("Invalid notification IDs provided.")
+
+        marked = api_models.Notification.mark_read(request.user, notification_ids)
+
+        self.log_throttled_access(request)
+        user = account_models.User.objects.only('unread_notifications_count').get(pk=request.user.pk)
+        return self.get_unread_response(request, user, marked=marked)
 
     class Meta:
         queryset = api_models.Notification.objects.all()
         allowed_methods = ('get',)
         authorization = authorization.NotificationAuthorization()
-        excludes = ('recipient',)
+        excludes = ('recipient', 'comment_author', 'comment_message', 'comment_created_time')
 
 class ImageAttachmentResource(AuthoredResource):
     image_file = tastypie_mongoengine_fields.ReferenceField(to='piplmesh.api.resources.UploadedFileResource', attribute='image_file', null=False, full=True)
@@ -89,29 +329,148 @@ class PostResource(AuthoredResource):
     Query set is ordered by updated time for following reasons:
      * those who open web page anew will get posts in updated time order
      * others with already opened page will get updated posts again as they
-       will request them based on ID of current newest post
+       will request them based on the cursor of current newest post
 
     This is useful if we would like to show on the client side that post has been updated
     (but we do not necessary have to reorder them, this depends on the client code).
+
+    Posts are paginated by cursors over updated time and ID, see ``KeysetPaginator``.
+
+    Dehydrated posts are cached by ID, updated time and language, so changed posts
+    are dehydrated anew, see ``cache.posts_cache``. Fields of embedded users which
+    change independently of posts (``volatile_user_fields``) are not cached, but
+    read for every request, for all cached posts of a page at once.
     """
 
     updated_time = tastypie_fields.DateTimeField(attribute='updated_time', null=False, readonly=True)
     comments = tastypie_mongoengine_fields.EmbeddedListField(of='piplmesh.api.resources.CommentResource', attribute='comments', default=lambda: [], null=True, full=False)
     attachments = tastypie_mongoengine_fields.EmbeddedListField(of='piplmesh.api.resources.AttachmentResource', attribute='attachments', default=lambda: [], null=True, full=True)
 
+    dereference_paths = ('author', 'comments.author', 'attachments.author', 'attachments.image_file')
+
+    volatile_user_paths = ('author', 'comments.author', 'attachments.author')
+    volatile_user_fields = ('is_online',)
+
+    def get_embedded_users(self, data):
+        """
+        Returns a list of representations of users embedded in the given post representation.
+        """
+
+        users = []
+        for path in self.volatile_user_paths:
+            values = [data]
+            for name in path.split('.'):
+                nested_values = []
+                for value in values:
+                    value = value.get(name) if isinstance(value, dict) else None
+                    if isinstance(value, (list, tuple)):
+                        nested_values.extend(value)
+                    elif value is not None:
+                        nested_values.append(value)
+                values = nested_values
+            users.extend(value for value in values if isinstance(value, dict) and value.get('id') is not None)
+        return users
+
+    def fetch_volatile_users(self, request, data_list):
+        """
+        Reads volatile fields of users embedded in given post representations,
+        all in one query, and stores them on the request.
+        """
+
+        volatile_users = getattr(request, '_volatile_users', None)
+        if volatile_users is None:
+            volatile_users = {}
+            if request is not None:
+                request._volatile_users = volatile_users
+
+        user_ids = set(unicode(user['id']) for data in data_list for user in self.get_embedded_users(data)) - set(volatile_users)
+        if user_ids:
+            for user in account_models.User.objects(id__in=list(user_ids)).only(*self.volatile_user_fields):
+                volatile_users[unicode(user.pk)] = dict((field_name, getattr(user, field_name)) for field_name in self.volatile_user_fields)
+
+        return volatile_users
+
+    def strip_volatile(self, data):
+        """
+        Returns a copy of the post representation without values of volatile fields.
+        """
+
+        data = copy.deepcopy(data)
+        for user in self.get_embedded_users(data):
+            for field_name in self.volatile_user_fields:
+                if field_name in user:
+                    user[field_name] = None
+        return data
+
+    def fill_volatile(self, request, data):
+        """
+        Returns a copy of the cached post representation with current values of volatile fields.
+        """
+
+        data = copy.deepcopy(data)
+        volatile_users = self.fetch_volatile_users(request, [data])
+        for user in self.get_embedded_users(data):
+            for field_name, value in volatile_users.get(unicode(user['id']), {}).items():
+                # Only fields which were requested are in the representation
+                if field_name in user:
+                    user[field_name] = value
+        return data
+
+    def get_cache_key(self, obj, request=None):
+        if obj.pk is None or obj.updated_time is None:
+            return None
+        # Representation depends also on requested fields
+        return cache.posts_cache.get_key(obj.pk, obj.updated_time) + (self.get_fieldsets(request).get_key(self.fields),)
+
+    def dereference_objects(self, request, objects):
+        # Representations of cached posts are already known, so only others are dereferenced
+        keys = [self.get_cache_key(obj, request) for obj in objects]
+        request._cached_posts = cache.posts_cache.get_many([key for key in keys if key is not None])
+        self.fetch_volatile_users(request, request._cached_posts.values())
+        objects = [obj for obj, key in zip(objects, keys) if key not in request._cached_posts]
+        super(PostResource, self).dereference_objects(request, objects)
+
+    def full_dehydrate(self, bundle):
+        key = self.get_cache_key(bundle.obj, bundle.request)
+        if key is None:
+            return super(PostResource, self).full_dehydrate(bundle)
+
+        cached_posts = getattr(bundle.request, '_cached_posts', None)
+        if cached_posts is not None:
+            data = cached_posts.get(key)
+        else:
+            data = cache.posts_cache.get(key)
+
+        if data is None:
+            bundle = super(PostResource, self).full_dehydrate(bundle)
+            # We cache simple data structures, so that cache entries can be shared
+            data = self._meta.serializer.to_simple(bundle, {})
+            cache.posts_cache.set(key, self.strip_volatile(data))
+        else:
+            data = self.fill_volatile(bundle.request, data)
+
+        bundle.data = dict(data)
+        return bundle
+
+    def hydrate(self, bundle):
+        bundle = super(PostResource, self).hydrate(bundle)
+
+        # By default, post author is subscribed to the post, we do it before
+        # the post is created, so that it is saved only once
+        if bundle.obj.pk is None and bundle.obj.author not in bundle.obj.subscribers:
+            bundle.obj.subscribers.append(bundle.obj.author)
+
+        return bundle
+
     def obj_create(self, bundle, request=None, **kwargs):
         bundle = super(PostResource, self).obj_create(bundle, request=request, **kwargs)
 
-        # By default, post author is subscribed to the post
-        bundle.obj.subscribers.append(bundle.obj.author)
-        bundle.obj.save()
-
         signals.post_created.send(sender=self, post=bundle.obj, request=request or bundle.request, bundle=bundle)
 
         return bundle
 
     class Meta:
-        queryset = api_models.Post.objects.all().order_by('-updated_time')
+        queryset = api_models.Post.objects.all().order_by('-updated_time', '-id')
         allowed_methods = ('get', 'post', 'put', 'patch', 'delete')
         authorization = authorization.PostAuthorization()
-        paginator_class = paginator.Paginator
+        paginator_class = paginator.KeysetPaginator
@@ -3,3 +3,6 @@ from django import dispatch
 # Signals dispatched when resources are created
 post_created = dispatch.Signal(providing_args=('post', 'request', 'bundle'))
 comment_created = dispatch.Signal(providing_args=('comment', 'post', 'request', 'bundle'))
+
+# Signal dispatched when notifications are created in bulk
+notifications_created = dispatch.Signal(providing_args=('notifications', 'post', 'comment'))
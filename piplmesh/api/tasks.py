@@ -1,16 +1,43 @@
 from __future__ import absolute_import
 
+from django.conf import settings
+
 from celery import task
 
-from . import models
+from piplmesh.account import models as account_models
+
+from . import dereference, models, signals
 
 @task.task
 def process_notifications_on_new_comment(comment_pk, post_pk):
+    """
+    Creates notifications about the new comment for all post subscribers (except
+    comment author). Notifications are inserted in bulk, in batches of
+    ``NOTIFICATIONS_BATCH_SIZE``, unread notifications counters of recipients
+    are incremented and ``notifications_created`` signal is sent for each batch.
+    """
+
     post = models.Post.objects.get(pk=post_pk)
     # TODO: https://github.com/wlanslovenija/PiplMesh/issues/299
     comment_pk = int(comment_pk)
     comment = post.comments[comment_pk]
 
-    for subscriber in post.subscribers:
-        if subscriber != comment.author:
-            models.Notification.objects.create(created_time=comment.created_time, recipient=subscriber, post=post, comment=comment_pk)
+    # We use references directly, so that subscribers are not dereferenced
+    author_id = dereference.get_reference_id(comment, 'author')
+    recipients = [subscriber for subscriber in post._data.get('subscribers') or [] if dereference.get_id(subscriber) != author_id]
+
+    batch_size = getattr(settings, 'NOTIFICATIONS_BATCH_SIZE', 500)
+    for start in xrange(0, len(recipients), batch_size):
+        notifications = []
+        for recipient in recipients[start:start + batch_size]:
+            notification = models.Notification(created_time=comment.created_time, recipient=recipient, post=post)
+            notification.set_comment(comment_pk, comment)
+            notifications.append(notification)
+
+        notification_ids = models.Notification.objects.insert(notifications, load_bulk=False, safe=True)
+        for notification, notification_id in zip(notifications, notification_ids):
+            notification.id = notification_id
+
+        account_models.User.objects(pk__in=[dereference.get_reference_id(notification, 'recipient') for notification in notifications]).update(inc__unread_notifications_count=1)
+
+        signals.notifications_created.send(sender=models.Notification, notifications=notifications, post=post, comment=comment)
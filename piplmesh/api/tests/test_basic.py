@@ -7,6 +7,7 @@ from django.utils import simplejson as json
 from tastypie_mongoengine import test_runner
 
 from piplmesh.account import models as account_models
+from piplmesh.api import models as api_models
 
 @utils.override_settings(DEBUG=True)
 class BasicTest(test_runner.MongoEngineTestCase):
@@ -166,3 +167,213 @@ class BasicTest(test_runner.MongoEngineTestCase):
         self.assertEqual(response['comments'], [])
         self.assertEqual(response['attachments'], [])
         self.assertEqual(response['is_published'], False)
+
+    def test_pagination(self):
+        # Creating published posts
+
+        for i in range(5):
+            response = self.client.post(self.resourceListURI('post'), json.dumps({'message': "Test post %d." % i, 'is_published': True}), content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+
+        # Walking over pages with cursors
+
+        messages = []
+        first_page = None
+        params = {'limit': 2}
+        while True:
+            response = self.client.get(self.resourceListURI('post'), params)
+            self.assertEqual(response.status_code, 200)
+            response = json.loads(response.content)
+
+            self.assertTrue('total_count' not in response['meta'])
+            if first_page is None:
+                first_page = response
+
+            messages.extend(post['message'] for post in response['objects'])
+
+            if not response['meta']['next_cursor']:
+                break
+            params = {'limit': 2, 'after': response['meta']['next_cursor']}
+
+        self.assertEqual(messages, ["Test post %d." % i for i in reversed(range(5))])
+
+        # Newer posts are returned for the previous cursor
+
+        response = self.client.post(self.resourceListURI('post'), json.dumps({'message': "Newest post.", 'is_published': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(self.resourceListURI('post'), {'limit': 2, 'before': first_page['meta']['previous_cursor']})
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.content)
+
+        self.assertEqual([post['message'] for post in response['objects']], ["Newest post."])
+
+        # Invalid cursor
+
+        response = self.client.get(self.resourceListURI('post'), {'after': 'invalid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_fieldsets(self):
+        response = self.client.post(self.resourceListURI('post'), json.dumps({'message': "Test post.", 'is_published': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        post_uri = self.fullURItoAbsoluteURI(response['location'])
+
+        # Only requested fields, with author embedded
+
+        response = self.client.get(self.resourceListURI('post'), {'fields': 'message,author.username', 'embed': 'author'})
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.content)
+
+        post = response['objects'][0]
+        self.assertEqual(post['message'], "Test post.")
+        self.assertEqual(post['resource_uri'], post_uri)
+        self.assertEqual(post['author']['username'], self.user_username)
+        self.assertTrue('id' in post['author'])
+        self.assertTrue('comments' not in post)
+        self.assertTrue('created_time' not in post)
+        self.assertTrue('is_online' not in post['author'])
+
+        # Author not embedded is returned as URI
+
+        response = self.client.get(self.resourceListURI('post'), {'fields': 'message,author', 'embed': ''})
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.content)
+
+        post = response['objects'][0]
+        self.assertEqual(post['message'], "Test post.")
+        self.assertEqual(urlresolvers.resolve(post['author']).kwargs['resource_name'], 'user')
+        self.assertEqual(self.resourcePK(post['author']), str(account_models.User.objects.get(username=self.user_username).pk))
+
+        # Cached full representation is not mixed with sparse one
+
+        response = self.client.get(post_uri)
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.content)
+
+        self.assertEqual(response['author']['username'], self.user_username)
+        self.assertEqual(response['comments'], [])
+
+        # Comments are by default returned as URIs, but can be embedded
+
+        response = self.client.post(post_uri + 'comments/', json.dumps({'message': "Test comment."}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(post_uri, {'fields': 'comments'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(isinstance(json.loads(response.content)['comments'][0], basestring))
+
+        response = self.client.get(post_uri, {'fields': 'comments', 'embed': 'comments'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['comments'][0]['message'], "Test comment.")
+
+        # Only related fields can be embedded
+
+        response = self.client.get(post_uri, {'embed': 'message'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cached_author_presence(self):
+        response = self.client.post(self.resourceListURI('post'), '{"message": "Test post.", "is_published": true}', content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        post_uri = response['location']
+
+        account_models.User.objects(username=self.user_username).update(set__is_online=False)
+
+        response = self.client.get(post_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['author']['is_online'], False)
+
+        # Post is now cached, but author's presence is still current
+
+        account_models.User.objects(username=self.user_username).update(set__is_online=True)
+
+        response = self.client.get(post_uri)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['author']['is_online'], True)
+
+        response = self.client.get(self.resourceListURI('post'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['objects'][0]['author']['is_online'], True)
+
+    def test_batch(self):
+        batch_uri = urlresolvers.reverse('api_batch', kwargs={'api_name': self.api_name})
+
+        response = self.client.post(batch_uri, json.dumps([
+            {'method': 'POST', 'path': self.resourceListURI('post'), 'body': {'message': "Test post.", 'is_published': True}},
+            {'path': self.resourceListURI('post') + '?limit=1'},
+            {'path': urlresolvers.reverse('api_notifications_unread', kwargs={'api_name': self.api_name, 'resource_name': 'notification'})},
+            {'path': '/unknown/'},
+            {'path': batch_uri},
+        ]), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        responses = json.loads(response.content)
+
+        self.assertEqual([response['status'] for response in responses], [201, 200, 200, 404, 404])
+
+        post_uri = self.fullURItoAbsoluteURI(responses[0]['headers']['Location'])
+        self.assertEqual(responses[1]['body']['objects'][0]['resource_uri'], post_uri)
+        self.assertEqual(responses[1]['body']['objects'][0]['author']['username'], self.user_username)
+        self.assertEqual(responses[2]['body']['unread_count'], 0)
+
+        # Invalid batch requests
+
+        response = self.client.get(batch_uri)
+        self.assertEqual(response.status_code, 405)
+
+        response = self.client.post(batch_uri, '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(batch_uri, json.dumps([{'path': self.resourceListURI('post')}] * 100), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_notifications_embed(self):
+        response = self.client.post(self.resourceListURI('post'), json.dumps({'message': "Test post.", 'is_published': True}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        post_uri = self.fullURItoAbsoluteURI(response['location'])
+
+        response = self.client2.post(post_uri + 'comments/', json.dumps({'message': "Test comment."}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        post = api_models.Post.objects.get(pk=self.resourcePK(post_uri))
+        notification = api_models.Notification(created_time=post.comments[0].created_time, recipient=account_models.User.objects.get(username=self.user_username), post=post)
+        notification.set_comment(0, post.comments[0])
+        notification.save()
+
+        # Posts are by default returned as URIs, only comments from snapshots are embedded
+
+        response = self.client.get(self.resourceListURI('notification'))
+        self.assertEqual(response.status_code, 200)
+        notification = json.loads(response.content)['objects'][0]
+        self.assertEqual(notification['post'], post_uri)
+        self.assertEqual(notification['comment']['message'], "Test comment.")
+
+        # Embedded posts are loaded in full
+
+        response = self.client.get(self.resourceListURI('notification'), {'embed': 'post'})
+        self.assertEqual(response.status_code, 200)
+        notification = json.loads(response.content)['objects'][0]
+        self.assertEqual(notification['post']['message'], "Test post.")
+        self.assertEqual(notification['post']['author']['username'], self.user_username)
+        self.assertEqual(notification['comment']['message'], "Test comment.")
+
+        response = self.client.get(self.resourceDetailURI('notification', notification['id']), {'embed': 'post'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['post']['message'], "Test post.")
+
+    def test_unread_notifications(self):
+        kwargs = {'api_name': self.api_name, 'resource_name': 'notification'}
+
+        response = self.client.get(urlresolvers.reverse('api_notifications_unread', kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['unread_count'], 0)
+
+        response = self.client.post(urlresolvers.reverse('api_notifications_read', kwargs=kwargs), '{"ids": ["invalid"]}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(urlresolvers.reverse('api_notifications_read', kwargs=kwargs), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = json.loads(response.content)
+        self.assertEqual(response['marked'], 0)
+        self.assertEqual(response['unread_count'], 0)
@@ -0,0 +1,56 @@
+import datetime
+
+from django.utils import timezone
+
+from tastypie_mongoengine import test_runner
+
+from piplmesh.api import cache, fieldsets, resources
+
+class CacheTest(test_runner.MongoEngineTestCase):
+    def test_lru_cache(self):
+        lru_cache = cache.LRUCache(2)
+
+        lru_cache.set('a', 1)
+        lru_cache.set('b', 2)
+        self.assertEqual(lru_cache.get('a'), 1)
+
+        # Least recently used entry is evicted
+        lru_cache.set('c', 3)
+        self.assertEqual(len(lru_cache), 2)
+        self.assertEqual(lru_cache.get('b'), None)
+        self.assertEqual(lru_cache.get('a'), 1)
+        self.assertEqual(lru_cache.get('c'), 3)
+
+        self.assertEqual(lru_cache.hits, 3)
+        self.assertEqual(lru_cache.misses, 1)
+
+    def test_versioned_cache(self):
+        versioned_cache = cache.VersionedCache('test', 10)
+
+        updated_time = timezone.now()
+        key = versioned_cache.get_key('id', updated_time, 'en')
+        versioned_cache.set(key, {'message': 'Test post.'})
+
+        self.assertEqual(versioned_cache.get(versioned_cache.get_key('id', updated_time, 'en')), {'message': 'Test post.'})
+        self.assertEqual(versioned_cache.get(versioned_cache.get_key('id', updated_time, 'sl')), None)
+        self.assertEqual(versioned_cache.get(versioned_cache.get_key('id', updated_time + datetime.timedelta(seconds=1), 'en')), None)
+
+    def test_shared_key(self):
+        versioned_cache = cache.VersionedCache('test', 10)
+
+        shared_key = versioned_cache.get_shared_key(('id', 1, 'en', u'message,\u010d' * 100))
+        self.assertTrue(isinstance(shared_key, str))
+        self.assertTrue(len(shared_key) < 250)
+        self.assertTrue(' ' not in shared_key)
+        self.assertNotEqual(shared_key, versioned_cache.get_shared_key(('id', 1, 'en', u'message')))
+
+    def test_fieldsets_key(self):
+        resource_fields = resources.PostResource().fields
+
+        # Unknown fields do not make new keys
+
+        key = fieldsets.Fieldsets(['message', 'author.username']).get_key(resource_fields)
+        self.assertEqual(fieldsets.Fieldsets(['author.username', u'unknown\u010d', 'message', 'author.unknown']).get_key(resource_fields), key)
+        self.assertNotEqual(fieldsets.Fieldsets(['message', 'author']).get_key(resource_fields), key)
+        self.assertNotEqual(fieldsets.Fieldsets(['message', 'author', 'author.unknown']).get_key(resource_fields), fieldsets.Fieldsets(['message', 'author']).get_key(resource_fields))
+        self.assertEqual(fieldsets.Fieldsets(['message'], ['author', 'unknown']).get_key(resource_fields), fieldsets.Fieldsets(['message'], ['author']).get_key(resource_fields))
@@ -0,0 +1,37 @@
+from tastypie_mongoengine import test_runner
+
+from piplmesh.account import models as account_models
+from piplmesh.api import dereference, models as api_models
+
+class CountingIdentityMap(dereference.IdentityMap):
+    def __init__(self):
+        super(CountingIdentityMap, self).__init__()
+        self.queries = 0
+
+    def fetch(self, document_class, document_ids):
+        if any(document_id not in self.documents[document_class] for document_id in document_ids):
+            self.queries += 1
+        return super(CountingIdentityMap, self).fetch(document_class, document_ids)
+
+class DereferenceTest(test_runner.MongoEngineTestCase):
+    def test_dereference(self):
+        users = [account_models.User.create_user(username='test_user%d' % i, password='foobar') for i in range(3)]
+
+        for i in range(5):
+            post = api_models.Post(author=users[i % 3], message="Test post %d." % i, is_published=True)
+            post.comments = [api_models.Comment(author=users[j % 3], message="Test comment %d." % j) for j in range(i)]
+            post.save()
+
+        posts = list(api_models.Post.objects.all())
+
+        identity_map = CountingIdentityMap()
+        dereference.dereference(posts, ('author', 'comments.author'), identity_map)
+
+        # Authors of posts are fetched once, authors of comments are then already known
+        self.assertEqual(identity_map.queries, 1)
+
+        for post in posts:
+            self.assertTrue(isinstance(post._data['author'], account_models.User))
+            for comment in post.comments:
+                self.assertTrue(isinstance(comment._data['author'], account_models.User))
+                self.assertTrue(comment.author is identity_map.get(account_models.User, comment.author.pk))
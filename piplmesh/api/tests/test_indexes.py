@@ -0,0 +1,20 @@
+from tastypie_mongoengine import test_runner
+
+from piplmesh import urls
+from piplmesh.api import indexes
+
+class IndexesTest(test_runner.MongoEngineTestCase):
+    def test_is_full_scan(self):
+        self.assertTrue(indexes.is_full_scan({'cursor': 'BasicCursor'}))
+        self.assertTrue(indexes.is_full_scan({'clauses': [{'cursor': 'BtreeCursor author_1'}, {'cursor': 'BasicCursor'}]}))
+        self.assertTrue(indexes.is_full_scan({'queryPlanner': {'winningPlan': {'stage': 'LIMIT', 'inputStage': {'stage': 'COLLSCAN'}}}}))
+        self.assertFalse(indexes.is_full_scan({'cursor': 'BtreeCursor _types_1_is_published_1_updated_time_-1__id_-1'}))
+        self.assertFalse(indexes.is_full_scan({'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}))
+
+    def test_api_queries(self):
+        queries = indexes.get_api_queries(urls.v1_api)
+
+        self.assertTrue(('post', 'list') in [(resource_name, query_name) for resource_name, query_name, queryset in queries])
+
+        for resource_name, query_name, queryset in queries:
+            self.assertFalse(indexes.is_full_scan(queryset.explain()), "%s (%s) is a full collection scan" % (resource_name, query_name))
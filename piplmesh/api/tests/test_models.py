@@ -0,0 +1,29 @@
+from tastypie_mongoengine import test_runner
+
+from piplmesh.account import models as account_models
+from piplmesh.api import models as api_models
+
+class PostTest(test_runner.MongoEngineTestCase):
+    def test_add_comment(self):
+        user = account_models.User.create_user(username='test_user', password='foobar')
+        user2 = account_models.User.create_user(username='test_user2', password='foobar2')
+
+        post = api_models.Post(author=user, message="Test post.", subscribers=[user])
+        post.save()
+        updated_time = api_models.Post.objects.get(pk=post.pk).updated_time
+
+        # Two instances of the same post, as in two concurrent requests
+        post1 = api_models.Post.objects.get(pk=post.pk)
+        post2 = api_models.Post.objects.get(pk=post.pk)
+
+        self.assertEqual(post1.add_comment(api_models.Comment(author=user2, message="Test comment 1.")), 0)
+        self.assertEqual(post2.add_comment(api_models.Comment(author=user2, message="Test comment 2.")), 1)
+        self.assertEqual(post1.add_comment(api_models.Comment(author=user, message="Test comment 3.")), 2)
+
+        post = api_models.Post.objects.get(pk=post.pk)
+        self.assertEqual([comment.message for comment in post.comments], ["Test comment 1.", "Test comment 2.", "Test comment 3."])
+        self.assertEqual([subscriber.pk for subscriber in post.subscribers], [user.pk, user2.pk])
+        self.assertTrue(post.updated_time >= updated_time)
+
+        api_models.Post.objects(pk=post.pk).delete()
+        self.assertEqual(post1.add_comment(api_models.Comment(author=user, message="Test comment 4.")), None)
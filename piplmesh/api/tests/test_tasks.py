@@ -0,0 +1,69 @@
+from django.core import management
+from django.test import utils
+
+from tastypie_mongoengine import test_runner
+
+from piplmesh.account import models as account_models
+from piplmesh.api import models as api_models, signals, tasks
+
+class TasksTest(test_runner.MongoEngineTestCase):
+    @utils.override_settings(NOTIFICATIONS_BATCH_SIZE=2)
+    def test_notifications_on_new_comment(self):
+        users = [account_models.User.create_user(username='test_user%d' % i, password='foobar') for i in range(4)]
+
+        post = api_models.Post(author=users[0], message="Test post.", subscribers=users)
+        post.save()
+        index = post.add_comment(api_models.Comment(author=users[1], message="Test comment."))
+
+        batches = []
+        def receiver(sender, notifications, post, comment, **kwargs):
+            batches.append([notification.pk for notification in notifications])
+        signals.notifications_created.connect(receiver)
+
+        try:
+            tasks.process_notifications_on_new_comment(index, post.pk)
+        finally:
+            signals.notifications_created.disconnect(receiver)
+
+        # Three recipients in batches of two
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+
+        notifications = api_models.Notification.objects.all()
+        self.assertEqual(sorted(notification.pk for notification in notifications), sorted(sum(batches, [])))
+        self.assertEqual(sorted(notification.recipient.username for notification in notifications), ['test_user0', 'test_user2', 'test_user3'])
+        for notification in notifications:
+            self.assertEqual(notification.comment, index)
+
+            # Notification is shown from the snapshot, without loading the post
+            self.assertTrue(notification.has_snapshot())
+            self.assertEqual(notification.get_post().pk, post.pk)
+            self.assertEqual(notification.get_post().comments, [])
+            self.assertEqual(notification.get_comment().message, "Test comment.")
+            self.assertEqual(notification.get_comment().author.username, 'test_user1')
+
+            self.assertEqual(notification.post.pk, post.pk)
+
+        # Unread notifications counters
+
+        for user in users:
+            user.reload()
+        self.assertEqual([user.unread_notifications_count for user in users], [1, 0, 1, 1])
+
+        notification = api_models.Notification.objects.get(recipient=users[0])
+        self.assertEqual(api_models.Notification.mark_read(users[0], [notification.pk]), 1)
+        self.assertEqual(api_models.Notification.mark_read(users[0], [notification.pk]), 0)
+        self.assertEqual(api_models.Notification.mark_read(users[2]), 1)
+
+        for user in users:
+            user.reload()
+        self.assertEqual([user.unread_notifications_count for user in users], [0, 0, 0, 1])
+        self.assertEqual(api_models.Notification.objects(read=False).count(), 1)
+
+        # Counters of users created before counters were introduced are recounted
+
+        account_models.User.objects.update(set__unread_notifications_count=0)
+        management.call_command('countnotifications', verbosity=0)
+
+        for user in users:
+            user.reload()
+        self.assertEqual([user.unread_notifications_count for user in users], [0, 0, 0, 1])
@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+import zlib
+
+from django.conf import settings
+
+# Channel for updates about all users, like their presence
+HOME_CHANNEL_ID = 'home'
+
+# Prefix of channels for updates about nodes, like posts made there
+NODE_CHANNEL_PREFIX = 'node'
+
+DEFAULT_SHARDS = 1
+DEFAULT_NEIGHBOURS = 5
+
+def get_shards():
+    return max(1, getattr(settings, 'HOME_CHANNEL_SHARDS', DEFAULT_SHARDS))
+
+def get_shard(user_id, shards=None):
+    """
+    Returns a shard of the user's node channel, stable across processes.
+    """
+
+    if shards is None:
+        shards = get_shards()
+    return zlib.crc32(str(user_id)) % shards
+
+def get_node_channel_id(node, shard=0):
+    """
+    Returns ID of the channel for the given node (or for users without a node).
+    """
+
+    channel_id = '%s/%s' % (NODE_CHANNEL_PREFIX, node.get_full_node_id()) if node else NODE_CHANNEL_PREFIX
+    if shard:
+        channel_id = '%s/%d' % (channel_id, shard)
+    return channel_id
+
+def get_subscriber_channel_id(node, user):
+    """
+    Returns ID of the node channel the given user at the given node subscribes to.
+    """
+
+    return get_node_channel_id(node, get_shard(user.pk))
+
+def get_broadcast_nodes(node):
+    """
+    Returns a list of nodes whose users receive updates made at the given node:
+    the node itself and its nearest neighbours.
+
+    The relation is not symmetric. Node B can be among the nearest neighbours
+    of node A, so users at B receive posts made at A, while A is not among
+    the nearest neighbours of B, so users at A do not receive posts made at B.
+    """
+
+    if not node:
+        return [None]
+
+    # Requests carry a request-specific wrapper around a node
+    node = getattr(node, 'node', node)
+
+    neighbours = getattr(settings, 'HOME_CHANNEL_NEIGHBOURS', DEFAULT_NEIGHBOURS)
+    if not neighbours:
+        return [node]
+
+    return [node] + list(node.get_neighbours(k=neighbours))
+
+def get_broadcast_channel_ids(node):
+    """
+    Returns IDs of all channels (of all shards) an update made at the given node
+    is sent to.
+    """
+
+    shards = get_shards()
+    return [get_node_channel_id(broadcast_node, shard) for broadcast_node in get_broadcast_nodes(node) for shard in xrange(shards)]
@@ -3,7 +3,7 @@ from django.contrib import auth
 from django.utils import translation
 
 from piplmesh import urls
-from piplmesh.frontend import forms, tasks
+from piplmesh.frontend import channels, forms
 
 def global_vars(request):
     """
@@ -11,7 +11,7 @@ def global_vars(request):
     """
     context = {
         # Constants
-        'HOME_CHANNEL_ID': tasks.HOME_CHANNEL_ID,
+        'HOME_CHANNEL_ID': channels.HOME_CHANNEL_ID,
         'LOGIN_REDIRECT_URL': settings.LOGIN_REDIRECT_URL,
         'REDIRECT_FIELD_NAME': auth.REDIRECT_FIELD_NAME,
         'SEARCH_ENGINE_UNIQUE_ID': settings.SEARCH_ENGINE_UNIQUE_ID,
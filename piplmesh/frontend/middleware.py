@@ -1,16 +1,24 @@
 from django import http
 from django.conf import settings
 from django.core import urlresolvers
+from django.utils import functional
 
 from piplmesh import nodes
 
 class NodesMiddleware(object):
     def process_request(self, request):
+        # Node is resolved only if it is used, so that requests
+        # which do not need it do not pay for its resolution
+        request.node = functional.SimpleLazyObject(lambda: nodes.get_node(request))
+
+        for exception in getattr(settings, 'NODES_MIDDLEWARE_EXCEPTIONS', ()):
+            if request.path.startswith(exception):
+                return None
+
         outside_url = urlresolvers.reverse('outside')
-        request.node = nodes.get_node(request)
 
         if request.path == outside_url:
-            if request.node is None:
+            if not request.node:
                 # We do nothing special for outside view if request
                 # is from outside and without geolocation data
                 return None
@@ -23,11 +31,7 @@ class NodesMiddleware(object):
                 # Otherwise we redirect to home
                 return http.HttpResponseRedirect(urlresolvers.reverse('home'))
 
-        for exception in getattr(settings, 'NODES_MIDDLEWARE_EXCEPTIONS', ()):
-            if request.path.startswith(exception):
-                return None
-
-        if request.node is None:
+        if not request.node:
             # Outside request and without geolocation data, we redirect
             return http.HttpResponseRedirect(outside_url)
         else:
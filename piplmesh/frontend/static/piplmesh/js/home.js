@@ -214,11 +214,18 @@ function Post(data) {
     }
 }
 
-function loadPosts(offset) {
-    $.getJSON(URLS.post, {
-        'limit': POSTS_LIMIT,
-        'offset': offset
-    }, function (data, textStatus, jqXHR) {
+// Cursor from which older posts are loaded, null when there are no more posts
+var next_posts_cursor = null;
+
+function loadPosts(cursor) {
+    var data = {
+        'limit': POSTS_LIMIT
+    };
+    if (cursor) {
+        data.after = cursor;
+    }
+    $.getJSON(URLS.post, data, function (data, textStatus, jqXHR) {
+        next_posts_cursor = data.meta.next_cursor;
         $.each(data.objects, function (i, post) {
             new Post(post).addToBottom();
         });
@@ -253,9 +260,6 @@ function Notification(data) {
     self.add = function () {
         if (checkIfNotificationExists()) return;
 
-        if (!self.read) {
-            $('#notifications_count').text(parseInt($('#notifications_count').text()) + 1);
-        }
         $('#notifications_list').prepend(createDOM());
     };
 
@@ -264,11 +268,68 @@ function Notification(data) {
     }
 }
 
+function setUnreadNotificationsCount(count) {
+    $('#notifications_count').text(count);
+}
+
+// Runs multiple API requests in one HTTP request, each request is an object
+// with method, path and optional body, and its callback gets the response body
+function batchRequests(requests) {
+    $.ajax({
+        'type': 'POST',
+        'url': URLS.batch,
+        'data': JSON.stringify($.map(requests, function (request, i) {
+            return {
+                'method': request.method || 'GET',
+                'path': request.path,
+                'body': request.body
+            };
+        })),
+        'contentType': 'application/json',
+        'dataType': 'json',
+        'success': function (data, textStatus, jqXHR) {
+            $.each(data, function (i, response) {
+                if (response.status >= 200 && response.status < 300 && requests[i].success) {
+                    requests[i].success(response.body);
+                }
+            });
+        }
+    });
+}
+
 function loadNotifications() {
-    $.getJSON(URLS.notifications, function (data, textStatus, jqXHR) {
-        $.each(data.objects, function (i, notification) {
-            new Notification(notification).add();
-        });
+    batchRequests([
+        {
+            'path': URLS.notifications,
+            'success': function (data) {
+                $.each(data.objects, function (i, notification) {
+                    new Notification(notification).add();
+                });
+            }
+        },
+        {
+            // Count is maintained on the server, so we do not have to count notifications
+            'path': URLS.notifications_unread,
+            'success': function (data) {
+                setUnreadNotificationsCount(data.unread_count);
+            }
+        }
+    ]);
+}
+
+function markNotificationsRead() {
+    $.ajax({
+        'type': 'POST',
+        'url': URLS.notifications_read,
+        'data': JSON.stringify({}),
+        'contentType': 'application/json',
+        'dataType': 'json',
+        'success': function (data, textStatus, jqXHR) {
+            $('.notification').each(function (i, notification) {
+                $(notification).data('notification').read = true;
+            });
+            setUnreadNotificationsCount(data.unread_count);
+        }
     });
 }
 
@@ -312,7 +373,7 @@ $(document).ready(function () {
     // List of URIs of posts by user
     $('.posts').data('user_posts_URIs', []);
 
-    $.updates.registerProcessor('home_channel', 'post_new', function (data) {
+    $.updates.registerProcessor('node_channel', 'post_new', function (data) {
         new Post(data.post).addToTop();
     });
 
@@ -336,8 +397,8 @@ $(document).ready(function () {
     // Saving text from post input box
     var input_box_text = $('#post_text').val();
 
-    // Shows last updated posts, starting at offset 0, limited by POSTS_LIMIT
-    loadPosts(0);
+    // Shows last updated posts, limited by POSTS_LIMIT
+    loadPosts(null);
 
     $('#submit_post').click(function (event) {
         var message = $('#post_text').val();
@@ -401,9 +462,11 @@ $(document).ready(function () {
 
     $(window).scroll(function (event) {
         if (document.body.scrollHeight - $(this).scrollTop() <= $(this).height()) {
-            var last_post = $('.post:last').data('post');
-            if (last_post) {
-                loadPosts(last_post.id);
+            if (next_posts_cursor) {
+                var cursor = next_posts_cursor;
+                // So that we do not load the same posts again while this request is in progress
+                next_posts_cursor = null;
+                loadPosts(cursor);
             }
         }
     });
@@ -411,6 +474,9 @@ $(document).ready(function () {
     // Notifications
     $('#notifications_count').add('.close_notifications_box').click(function (event) {
         $('#notifications_box').slideToggle('fast');
+        if (parseInt($('#notifications_count').text()) > 0) {
+            markNotificationsRead();
+        }
     });
     // TODO: Just for testing
     $('#add_comment').click(function (event) {
@@ -419,6 +485,9 @@ $(document).ready(function () {
 
     $.updates.registerProcessor('user_channel', 'notification', function (data) {
         new Notification(data.notification).add();
+        if (data.unread_count !== undefined) {
+            setUnreadNotificationsCount(data.unread_count);
+        }
     });
 
     loadNotifications();
@@ -0,0 +1,83 @@
+// Extends push server updates with streaming (Server-Sent Events) delivery and
+// unpacking of batch updates, in which the server coalesces multiple updates to
+// the same channel, to processors registered for contained updates' types
+(function ($) {
+    var processors = {};
+    var registerProcessor = $.updates.registerProcessor;
+    var subscribe = $.updates.subscribe;
+
+    function processUpdate(channel_name, data) {
+        if (!processors[channel_name]) {
+            return;
+        }
+
+        if (data.type === 'batch') {
+            $.each(data.updates, function (i, update) {
+                processUpdate(channel_name, update);
+            });
+            return;
+        }
+
+        $.each(processors[channel_name][data.type] || [], function (i, processor) {
+            processor(data);
+        });
+    }
+
+    function poll(channel_name, url) {
+        var channels = {};
+        channels[channel_name] = url;
+        subscribe(channels);
+    }
+
+    function stream(channel_name, urls) {
+        var opened = false;
+        var source = new EventSource(urls.stream, {'withCredentials': true});
+
+        source.onopen = function (event) {
+            opened = true;
+        };
+        source.onmessage = function (event) {
+            processUpdate(channel_name, $.parseJSON(event.data));
+        };
+        source.onerror = function (event) {
+            // Once opened, browser reconnects by itself, continuing from the last update,
+            // but if the stream cannot be opened at all, we fall back to long polling
+            if (!opened) {
+                source.close();
+                poll(channel_name, urls.poll);
+            }
+        };
+    }
+
+    // Channels can be given with a long polling URL or with an object with
+    // stream and poll URLs, streaming is then used if available
+    $.updates.subscribe = function (channels) {
+        $.each(channels, function (channel_name, urls) {
+            if (typeof urls === 'string') {
+                poll(channel_name, urls);
+            }
+            else if (urls.stream && window.EventSource) {
+                stream(channel_name, urls);
+            }
+            else {
+                poll(channel_name, urls.poll);
+            }
+        });
+    };
+
+    $.updates.registerProcessor = function (channel_name, type, processor) {
+        if (!processors[channel_name]) {
+            processors[channel_name] = {};
+            registerProcessor(channel_name, 'batch', function (data) {
+                processUpdate(channel_name, data);
+            });
+        }
+
+        if (!processors[channel_name][type]) {
+            processors[channel_name][type] = [];
+        }
+
+        processors[channel_name][type].push(processor);
+        registerProcessor(channel_name, type, processor);
+    };
+})(jQuery);
@@ -1,71 +1,69 @@
-import datetime
-
-from django.conf import settings
-from django.utils import timezone
+from django import dispatch
 
 from celery import task
 
-from pushserver.utils import updates
+from piplmesh.account import models as account_models, presence, signals as account_signals
+from piplmesh.frontend import channels
+from piplmesh.utils import updates
+
+@task.task
+def send_update(channel_id, data):
+    updates.send_update(channel_id, data)
 
-from piplmesh.account import models
+@task.task
+def send_update_on_new_post(serialized_update, channel_ids=None):
+    # Tasks queued before posts were sent to node channels do not have channels
+    # given, they are sent to the home channel, as clients from then expect
+    if channel_ids is None:
+        channel_ids = [channels.HOME_CHANNEL_ID]
 
-HOME_CHANNEL_ID = 'home'
-CHECK_ONLINE_USERS_RECONNECT_TIMEOUT = 2 * settings.CHECK_ONLINE_USERS_INTERVAL
+    updates.send_updates([(channel_id, serialized_update) for channel_id in channel_ids], True)
 
 @task.task
-def check_online_users():
-    for user in models.User.objects(
-        is_online=False,
-        connections__not__in=([], None), # None if field is missing altogether, not__in seems not to be equal to nin
-    ):
-        if models.User.objects(
-            pk=user.pk,
-            is_online=False,
-            connections__not__in=([], None), # None if field is missing altogether, not__in seems not to be equal to nin
-        ).update(set__is_online=True):
-            updates.send_update(
-                HOME_CHANNEL_ID,
-                {
-                    'type': 'user_connect',
-                    'user': {
-                        'username': user.username,
-                        'profile_url': user.get_profile_url(),
-                        'image_url': user.get_image_url(),
-                    },
-                }
-            )
-
-    for user in models.User.objects(
-        is_online=True,
-        connections__in=([], None), # None if field is missing altogether
-        connection_last_unsubscribe__lt=timezone.now() - datetime.timedelta(seconds=CHECK_ONLINE_USERS_RECONNECT_TIMEOUT),
-    ):
-        if models.User.objects(
-            pk=user.pk,
-            is_online=True,
-            connections__in=([], None), # None if field is missing altogether
-            connection_last_unsubscribe__lt=timezone.now() - datetime.timedelta(seconds=CHECK_ONLINE_USERS_RECONNECT_TIMEOUT),
-        ).update(set__is_online=False):
-            # On user disconnect we cycle channel_id, this is to improve security if somebody
-            # intercepted current channel_id as there is no authentication on HTTP push channels
-            # This is the best place to cycle channel_id as we know that user does not listen
-            # anymore to any channel
-            user.reload()
-            user.channel_id = models.generate_channel_id()
-            user.save()
-
-            updates.send_update(
-                HOME_CHANNEL_ID,
-                {
-                    'type': 'user_disconnect',
-                    'user': {
-                        'username': user.username,
-                        'profile_url': user.get_absolute_url(),
-                        'image_url': user.get_image_url(),
-                    },
-                }
-            )
+def send_updates(serialized_updates):
+    """
+    Sends a batch of already serialized updates, a list of ``(channel ID, update)`` pairs.
+    """
+
+    updates.send_updates(serialized_updates, True)
 
 @task.task
-def send_update_on_new_post(serialized_update):
-    updates.send_update(HOME_CHANNEL_ID, serialized_update, True)
+def expire_presence():
+    """
+    Task which marks offline users whose reconnect timeout expired. It is
+    scheduled periodically, so that only one process expires users.
+    """
+
+    return len(presence.presence.expire())
+
+# Presence signal receivers are here and not with other receivers in views,
+# so that they are connected also in workers running expire_presence
+
+def send_presence_update(update_type, user_id):
+    user = account_models.User.objects.get(pk=user_id)
+
+    # We send update asynchronously as it could block
+    send_update.delay(channels.HOME_CHANNEL_ID, {
+        'type': update_type,
+        'user': {
+            'username': user.username,
+            'profile_url': user.get_profile_url(),
+            'image_url': user.get_image_url(),
+        },
+    })
+
+@dispatch.receiver(account_signals.user_online)
+def send_update_on_user_online(sender, user_id, **kwargs):
+    """
+    Sends update through push server when user becomes online.
+    """
+
+    send_presence_update('user_connect', user_id)
+
+@dispatch.receiver(account_signals.user_offline)
+def send_update_on_user_offline(sender, user_id, **kwargs):
+    """
+    Sends update through push server when user becomes offline.
+    """
+
+    send_presence_update('user_disconnect', user_id)
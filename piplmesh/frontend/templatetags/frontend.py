@@ -1,7 +1,13 @@
 from django import template
 
+from piplmesh.utils import updates
+
 register = template.Library()
 
 @register.filter()
 def is_active(current_path, url_path):
     return current_path.startswith(url_path)
+
+@register.simple_tag
+def stream_url(channel_id):
+    return updates.stream_url(channel_id)
@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.test import client, utils
+
+from tastypie_mongoengine import test_runner
+
+from piplmesh import nodes
+from piplmesh.frontend import channels, middleware
+
+@utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.RandomNodesBackend',))
+class ChannelsTest(test_runner.MongoEngineTestCase):
+    @utils.override_settings(HOME_CHANNEL_NEIGHBOURS=2, HOME_CHANNEL_SHARDS=1)
+    def test_broadcast_channels(self):
+        node = next(nodes.get_all_nodes())
+
+        channel_ids = channels.get_broadcast_channel_ids(node)
+
+        self.assertEqual(len(channel_ids), 3)
+        self.assertEqual(channel_ids[0], channels.get_node_channel_id(node))
+        self.assertEqual(channel_ids[1:], [channels.get_node_channel_id(neighbour) for neighbour in node.get_neighbours(k=2)])
+
+        # Users without a node have their own channel
+
+        self.assertEqual(channels.get_broadcast_channel_ids(None), [channels.NODE_CHANNEL_PREFIX])
+
+    @utils.override_settings(HOME_CHANNEL_NEIGHBOURS=0, HOME_CHANNEL_SHARDS=4)
+    def test_shards(self):
+        node = next(nodes.get_all_nodes())
+
+        channel_ids = channels.get_broadcast_channel_ids(node)
+
+        self.assertEqual(len(channel_ids), 4)
+        self.assertEqual(len(set(channel_ids)), 4)
+
+        # Every subscriber is in one of the shards, always the same
+
+        for user_id in range(20):
+            shard = channels.get_shard(user_id)
+            self.assertTrue(0 <= shard < 4)
+            self.assertEqual(shard, channels.get_shard(user_id))
+            self.assertTrue(channels.get_node_channel_id(node, shard) in channel_ids)
+
+@utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.RandomNodesBackend',))
+class NodesMiddlewareTest(test_runner.MongoEngineTestCase):
+    def test_lazy_node(self):
+        factory = client.RequestFactory()
+
+        # Requests not processed by the middleware do not resolve the node
+
+        request = factory.get(settings.STATIC_URL)
+        request.session = {}
+        self.assertFalse(hasattr(request, 'node'))
+
+        resolved = []
+        get_node = nodes.get_node
+        def counting_get_node(request):
+            resolved.append(request)
+            return get_node(request)
+
+        request = factory.get(settings.STATIC_URL)
+        request.session = {}
+        nodes.get_node = counting_get_node
+        try:
+            self.assertEqual(middleware.NodesMiddleware().process_request(request), None)
+            self.assertFalse('node' in request.__class__.__dict__)
+            self.assertEqual(resolved, [])
+
+            self.assertTrue(request.node)
+            self.assertTrue(request.node.get_full_node_id())
+            self.assertEqual(resolved, [request])
+        finally:
+            nodes.get_node = get_node
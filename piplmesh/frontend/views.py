@@ -17,17 +17,23 @@ from tastypie import http as tastypie_http
 
 from mongogeneric import detail
 
-from pushserver.utils import updates
-
 from piplmesh import nodes
 from piplmesh.nodes import models as nodes_models
 from piplmesh.account import models as account_models
-from piplmesh.api import models as api_models, resources, signals
-from piplmesh.frontend import forms, tasks
+from piplmesh.api import dereference, models as api_models, resources, signals
+from piplmesh.frontend import channels, forms, tasks
+from piplmesh.utils import updates
 
 class HomeView(generic_views.TemplateView):
     template_name = 'home.html'
 
+    def get_context_data(self, **kwargs):
+        context = super(HomeView, self).get_context_data(**kwargs)
+        context.update({
+            'node_channel_id': channels.get_subscriber_channel_id(self.request.node, self.request.user),
+        })
+        return context
+
 # TODO: Get HTML5 geolocation data and store it into request session
 class OutsideView(generic_views.TemplateView):
     template_name = 'outside.html'
@@ -140,7 +146,8 @@ def forbidden_view(request, reason=''):
 @dispatch.receiver(signals.post_created)
 def send_update_on_new_post(sender, post, request, bundle, **kwargs):
     """
-    Sends update through push server when a new post is created.
+    Sends update through push server when a new post is created, to channels
+    of the node where it was made and of its neighbours.
     """
     if post.is_published:
         output_bundle = sender.full_dehydrate(bundle)
@@ -153,7 +160,7 @@ def send_update_on_new_post(sender, post, request, bundle, **kwargs):
 
         # We send update asynchronously as it could block and we
         # want REST request to finish quick
-        tasks.send_update_on_new_post.delay(serialized_update)
+        tasks.send_update_on_new_post.delay(serialized_update, channels.get_broadcast_channel_ids(request.node))
 
 @mongoengine_signals.post_save.connect_via(sender=api_models.Notification)
 def send_update_on_new_notification(sender, document, created, **kwargs):
@@ -191,6 +198,49 @@ def send_update_on_new_notification(sender, document, created, **kwargs):
     }, 'application/json')
     updates.send_update(notification.recipient.get_user_channel(), serialized, True)
 
+@dispatch.receiver(signals.notifications_created)
+def send_updates_on_new_notifications(sender, notifications, post, comment, **kwargs):
+    """
+    Sends updates through push server to recipients of notifications created in bulk.
+
+    All notifications are about the same comment, so notification is dehydrated only
+    once and only its ID and URI are changed for each recipient. Updates include the
+    number of unread notifications and are sent in a batch by a background task.
+    """
+
+    if not notifications:
+        return
+
+    # Dummy request object, as in send_update_on_new_notification
+    request = client.RequestFactory().request()
+
+    from piplmesh import urls
+
+    resource = urls.notification_resource
+
+    bundle = resource.build_bundle(obj=notifications[0], request=request)
+    output_bundle = resource.full_dehydrate(bundle)
+    output_bundle = resource.alter_detail_data_to_serialize(request, output_bundle)
+    data = resource._meta.serializer.to_simple(output_bundle, {})
+
+    recipient_ids = [dereference.get_reference_id(notification, 'recipient') for notification in notifications]
+    recipients = dict((user.pk, user) for user in account_models.User.objects(pk__in=recipient_ids).only('channel_id', 'unread_notifications_count'))
+
+    serialized_updates = []
+    for notification, recipient_id in zip(notifications, recipient_ids):
+        recipient = recipients.get(recipient_id)
+        if recipient is None:
+            continue
+
+        notification_data = dict(data, id=unicode(notification.pk), resource_uri=resource.get_resource_uri(notification))
+        serialized_updates.append((recipient.get_user_channel(), simplejson.dumps({
+            'type': 'notification',
+            'notification': notification_data,
+            'unread_count': max(0, recipient.unread_notifications_count or 0),
+        })))
+
+    tasks.send_updates.delay(serialized_updates)
+
 def panels_collapse(request):
     if request.method == 'POST':
         request.user.panels_collapsed[request.POST['name']] = True if request.POST['collapsed'] == 'true' else False
@@ -1,7 +1,7 @@
-import math
+import heapq, itertools, math
 
-from django.core import exceptions
-from django.utils import importlib
+from piplmesh.nodes import models
+from piplmesh.nodes.registry import backends_registry
 
 LATITUDE_SESSION_KEY = '_latitude'
 LONGITUDE_SESSION_KEY = '_longitude'
@@ -15,37 +15,36 @@ MOCKING_SESSION_KEY = '_nodes_mocking'
 def is_mocking(request):
     return request.session.get(MOCKING_SESSION_KEY, False)
 
+NODES_SESSION_KEYS = (SESSION_KEY, BACKEND_SESSION_KEY, CLOSEST_LATITUDE_SESSION_KEY, CLOSEST_LONGITUDE_SESSION_KEY, MOCKING_SESSION_KEY)
+
+def update_session(request, values):
+    """
+    Sets nodes session keys to given values and removes those not given.
+
+    Session is written only for keys whose values really change, so that an
+    unchanged session does not have to be saved. Returns ``True`` if session
+    was modified.
+    """
+
+    modified = False
+    for key in NODES_SESSION_KEYS:
+        if key in values:
+            if key not in request.session or request.session[key] != values[key]:
+                request.session[key] = values[key]
+                modified = True
+        elif key in request.session:
+            del request.session[key]
+            modified = True
+    return modified
+
 def flush_session(request):
-    for key in (SESSION_KEY, BACKEND_SESSION_KEY, CLOSEST_LATITUDE_SESSION_KEY, CLOSEST_LONGITUDE_SESSION_KEY, MOCKING_SESSION_KEY):
-        try:
-            del(request.session[key])
-        except KeyError:
-            pass
+    return update_session(request, {})
 
 def load_backend(path):
-    i = path.rfind('.')
-    module, attr = path[:i], path[i+1:]
-    try:
-        mod = importlib.import_module(module)
-    except ImportError, e:
-        raise exceptions.ImproperlyConfigured('Error importing nodes backend %s: "%s"' % (path, e))
-    except ValueError, e:
-        raise exceptions.ImproperlyConfigured('Error importing nodes backends. Is NODES_BACKENDS a correctly defined list or tuple?')
-    try:
-        cls = getattr(mod, attr)
-    except AttributeError:
-        raise exceptions.ImproperlyConfigured('Module "%s" does not define a "%s" nodes backend' % (module, attr))
-
-    return cls()
+    return backends_registry.get_backend(path)
 
 def get_backends():
-    from django.conf import settings
-    backends = []
-    for backend_path in getattr(settings, 'NODES_BACKENDS', ()):
-        backends.append(load_backend(backend_path))
-    if not backends:
-        raise exceptions.ImproperlyConfigured('No nodes backends have been defined. Does NODES_BACKENDS contain anything?')
-    return backends
+    return backends_registry.get_backends()
 
 def distance(latitude_a, longitude_a, latitude_b, longitude_b):
     latitude_a, longitude_a, latitude_b, longitude_b = map(math.radians, (latitude_a, longitude_a, latitude_b, longitude_b))
@@ -54,12 +53,54 @@ def distance(latitude_a, longitude_a, latitude_b, longitude_b):
     a = math.sin(dlatitude / 2)**2 + math.cos(latitude_a) * math.cos(latitude_b) * math.sin(dlongitude / 2)**2
     return 2 * math.asin(math.sqrt(a))
 
+def distances(latitude, longitude, coordinates):
+    """
+    Returns a list of great-circle distances between the given point and each
+    ``(latitude, longitude)`` pair in ``coordinates``, in the same order.
+
+    Values depending only on the given point are computed once for all coordinates.
+    Distances are computed in a single plain Python loop and not with array
+    operations, as NumPy is not a dependency.
+    """
+
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    cos_latitude = math.cos(latitude)
+
+    radians, sin, cos, asin, sqrt = math.radians, math.sin, math.cos, math.asin, math.sqrt
+
+    result = []
+    for latitude_b, longitude_b in coordinates:
+        latitude_b, longitude_b = radians(latitude_b), radians(longitude_b)
+        a = sin((latitude_b - latitude) / 2)**2 + cos_latitude * cos(latitude_b) * sin((longitude_b - longitude) / 2)**2
+        result.append(2 * asin(sqrt(a)))
+    return result
+
+def distance_matrix(points, coordinates):
+    """
+    Returns a matrix (list of lists) of great-circle distances, with a row for each
+    ``(latitude, longitude)`` pair in ``points`` and a column for each pair in ``coordinates``.
+    """
+
+    coordinates = list(coordinates)
+    return [distances(latitude, longitude, coordinates) for latitude, longitude in points]
+
+def closest(latitude, longitude, coordinates, k=1):
+    """
+    Returns a list of up to ``k`` ``(distance, index)`` pairs for ``(latitude, longitude)``
+    pairs in ``coordinates`` closest to the given point, ordered by increasing distance.
+    """
+
+    return heapq.nsmallest(k, itertools.izip(distances(latitude, longitude, coordinates), itertools.count()))
+
 def get_node(request, allow_mocking=True):
     """
     Returns wireless node from which request originated. Or the closest
     wireless node based on geolocation data stored in request session.
 
     Returns ``None`` if no node could be determined.
+
+    Nodes session keys are written only if they change, so that the session
+    is saved only when node resolution really modified it.
     """
 
     # TODO: What if user moves from inside to outside, or outside to inside, inside existing session? How should we invalidate node?
@@ -75,7 +116,9 @@ def get_node(request, allow_mocking=True):
 
         # Return node if mocking is in progress and user is authenticated
         if allow_mocking and mocking and request.user and request.user.is_authenticated() and request.user.is_staff:
-            return node
+            if node is None:
+                return None
+            return models.RequestNode(node)
         # If mocking was in progress and user isn't allowed to mock reset nodes value
         elif mocking:
             node = None
@@ -85,7 +128,7 @@ def get_node(request, allow_mocking=True):
         pass
 
     if node is not None:
-        node._outside_request = CLOSEST_LATITUDE_SESSION_KEY in request.session or CLOSEST_LONGITUDE_SESSION_KEY in request.session
+        node = models.RequestNode(node, CLOSEST_LATITUDE_SESSION_KEY in request.session or CLOSEST_LONGITUDE_SESSION_KEY in request.session)
         if node.is_inside_request():
             if LATITUDE_SESSION_KEY not in request.session and LONGITUDE_SESSION_KEY not in request.session:
                 return node
@@ -93,46 +136,46 @@ def get_node(request, allow_mocking=True):
             if request.session.get(CLOSEST_LATITUDE_SESSION_KEY) == request.session.get(LATITUDE_SESSION_KEY) and request.session.get(CLOSEST_LONGITUDE_SESSION_KEY) == request.session.get(LONGITUDE_SESSION_KEY):
                 return node
 
-    node = None
-    flush_session(request)
+    # We have to resolve the node again, but we write to the session only if the result differs from what is already stored
 
     for backend in get_backends():
         node = backend.get_source_node(request)
         if node is None:
             continue
 
-        request.session[SESSION_KEY] = node.id
-        request.session[BACKEND_SESSION_KEY] = backend.get_full_name()
-
-        return node
+        update_session(request, {
+            SESSION_KEY: node.id,
+            BACKEND_SESSION_KEY: backend.get_full_name(),
+        })
+        return models.RequestNode(node)
 
     if LATITUDE_SESSION_KEY not in request.session or LONGITUDE_SESSION_KEY not in request.session:
+        flush_session(request)
         return None
 
-    assert node is None
-
-    node_backend = None
+    candidates = []
     for backend in get_backends():
         new_node = backend.get_closest_node(request, request.session[LATITUDE_SESSION_KEY], request.session[LONGITUDE_SESSION_KEY])
         if new_node is None:
             continue
 
-        # Compare our current best match with the new one
-        if node is None or distance(request.session[LATITUDE_SESSION_KEY], request.session[LONGITUDE_SESSION_KEY], new_node.latitude, new_node.longitude) < distance(request.session[LATITUDE_SESSION_KEY], request.session[LONGITUDE_SESSION_KEY], node.latitude, node.longitude):
-            node_backend = backend.get_full_name()
-            node = new_node
+        candidates.append((backend.get_full_name(), new_node))
 
-    if node is None:
+    if not candidates:
+        flush_session(request)
         return None
 
-    node._outside_request = True
-
-    request.session[SESSION_KEY] = node.id
-    request.session[BACKEND_SESSION_KEY] = node_backend
-    request.session[CLOSEST_LATITUDE_SESSION_KEY] = request.session[LATITUDE_SESSION_KEY]
-    request.session[CLOSEST_LONGITUDE_SESSION_KEY] = request.session[LONGITUDE_SESSION_KEY]
-
-    return node
+    # Rank closest nodes from all backends in one pass
+    [(_, index)] = closest(request.session[LATITUDE_SESSION_KEY], request.session[LONGITUDE_SESSION_KEY], [(node.latitude, node.longitude) for _, node in candidates])
+    node_backend, node = candidates[index]
+
+    update_session(request, {
+        SESSION_KEY: node.id,
+        BACKEND_SESSION_KEY: node_backend,
+        CLOSEST_LATITUDE_SESSION_KEY: request.session[LATITUDE_SESSION_KEY],
+        CLOSEST_LONGITUDE_SESSION_KEY: request.session[LONGITUDE_SESSION_KEY],
+    })
+    return models.RequestNode(node, True)
 
 def get_all_nodes():
     """
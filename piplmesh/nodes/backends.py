@@ -1,49 +1,351 @@
 from __future__ import absolute_import
 
-import copy, random
+import random, threading, time
 
-from . import data
+from django.conf import settings
+
+from . import data, models, neighbourhood, spatial, subnets
 
 class NodeBackend(object):
     def get_full_name(self):
         return '%s.%s' % (self.__module__, self.__class__.__name__)
 
-class RandomNodesBackend(NodeBackend):
+    def warm_up(self):
+        """
+        Called at startup so that backend can preload its data.
+        """
+
+        pass
+
+    def get_neighbours(self, node, k=None, radius=None):
+        """
+        Returns a list of nodes neighbouring the given node, up to ``k`` nearest
+        of them and/or those inside ``radius`` (in kilometers), ordered by
+        increasing distance.
+
+        Backends which do not know neighbours of their nodes return an empty list.
+        """
+
+        return []
+
+class DataNodesBackend(NodeBackend):
+    """
+    Base class for backends serving temporary hard-coded nodes data.
+
+    Node instances and a spatial index over nodes, so that closest nodes
+    can be found without a linear scan, are created once per backend.
+    Neighbourhood of a node (see ``NODES_NEIGHBOURS`` and
+    ``NODES_NEIGHBOURHOOD_RADII`` settings) is built on its first use and
+    then reused.
+    """
+
+    def __init__(self):
+        self._nodes = None
+        self._index = None
+        self._neighbourhoods = {}
+
+    def warm_up(self):
+        self.get_nodes()
+        self.get_index()
+
+    def get_data(self):
+        """
+        Returns a list of unbound nodes this backend serves.
+        """
+
+        return data.nodes
+
+    def get_nodes(self):
+        if self._nodes is None:
+            self._nodes = tuple(node.bind(i, self) for i, node in enumerate(self.get_data()))
+        return self._nodes
+
+    def get_index(self):
+        if self._index is None:
+            nodes = self.get_nodes()
+            self._index = spatial.KDTree(range(len(nodes)), [(node.latitude, node.longitude) for node in nodes])
+        return self._index
+
+    def get_neighbourhood(self, node):
+        node_neighbourhood = self._neighbourhoods.get(node.id)
+        if node_neighbourhood is None:
+            k, radii = neighbourhood.get_settings()
+            # Concurrent builds of the same neighbourhood give the same result, so we do not lock
+            node_neighbourhood = self._neighbourhoods[node.id] = neighbourhood.build_one(self.get_nodes(), self.get_index(), node.id, k, radii)
+        return node_neighbourhood
+
+    def get_neighbours(self, node, k=None, radius=None):
+        """
+        Returns a list of nodes neighbouring the given node, up to ``k`` nearest
+        of them and/or those inside ``radius`` (in kilometers), ordered by
+        increasing distance.
+
+        Neighbours are served from cached neighbourhoods, only lookups
+        beyond them use the spatial index.
+        """
+
+        neighbours = self.get_neighbourhood(node).get(k, radius)
+        if neighbours is not None:
+            return neighbours
+
+        nodes = self.get_nodes()
+        if radius is not None:
+            candidates = self.get_index().within(node.latitude, node.longitude, neighbourhood.to_radians(radius))
+        else:
+            # Without a limit all nodes are neighbours
+            candidates = self.get_index().nearest(node.latitude, node.longitude, len(nodes) if k is None else k + 1)
+        neighbours = [nodes[node_id] for distance, node_id in candidates if node_id != node.id]
+        if k is not None:
+            neighbours = neighbours[:k]
+        return neighbours
+
+    def get_source_node(self, request):
+        return None
+
+    def get_closest_node(self, request, latitude, longitude):
+        """
+        Returns the closest node to the given location.
+        """
+
+        nodes = self.get_closest_nodes(request, latitude, longitude, 1)
+        if not nodes:
+            return None
+        return nodes[0]
+
+    def get_closest_nodes(self, request, latitude, longitude, k):
+        """
+        Returns a list of up to ``k`` nodes closest to the given location,
+        ordered by increasing distance.
+        """
+
+        nodes = self.get_nodes()
+        return [nodes[node_id] for distance, node_id in self.get_index().nearest(latitude, longitude, k)]
+
+    def get_node(self, node_id):
+        try:
+            return self.get_nodes()[int(node_id)]
+        except IndexError:
+            return None
+
+    def get_all_nodes(self):
+        return iter(self.get_nodes())
+
+class NearestNodesBackend(DataNodesBackend):
+    """
+    Backend which does not know from which node request originated, but
+    finds the real closest node based on geolocation data.
+    """
+
+class RandomNodesBackend(DataNodesBackend):
     def get_source_node(self, request):
         """
         Returns a node at random.
         """
 
-        node_id = random.randrange(len(data.nodes))
-        node = copy.copy(data.nodes[node_id])
-        node.id = node_id
-        node.backend = self
-        return node
+        return random.choice(self.get_nodes())
 
     def get_closest_node(self, request, latitude, longitude):
         """
-        Because searching for real closest node is complex,
-        it just returns a random node.
+        Returns a node at random. Use ``NearestNodesBackend``
+        to search for the real closest node.
         """
 
-        node_id = random.randrange(len(data.nodes))
-        node = copy.copy(data.nodes[node_id])
-        node.id = node_id
-        node.backend = self
+        return random.choice(self.get_nodes())
+
+class SubnetNodesBackend(DataNodesBackend):
+    """
+    Backend which determines from which node request originated by matching
+    client's IP address against node subnets, using the longest-prefix match.
+
+    Subnets are read from the file configured with ``NODES_SUBNETS_FILE`` or,
+    if not set, from the database, and are reloaded when they change.
+    """
+
+    def __init__(self):
+        super(SubnetNodesBackend, self).__init__()
+
+        self._subnets = subnets.SubnetsTable(
+            getattr(settings, 'NODES_SUBNETS_FILE', None),
+            getattr(settings, 'NODES_SUBNETS_RELOAD_INTERVAL', 60),
+        )
+        self._node_ids = None
+
+    def warm_up(self):
+        super(SubnetNodesBackend, self).warm_up()
+        self._subnets.reload()
+
+    def get_node_ids(self):
+        if self._node_ids is None:
+            self._node_ids = dict((node.name, node.id) for node in self.get_nodes())
+        return self._node_ids
+
+    def get_client_address(self, request):
+        if getattr(settings, 'NODES_USE_X_FORWARDED_FOR', False) and request.META.get('HTTP_X_FORWARDED_FOR'):
+            # The first address is the address of the client, others are of proxies
+            return request.META['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
+        return request.META.get('REMOTE_ADDR')
+
+    def get_source_node(self, request):
+        """
+        Returns a node to which subnet client's address belongs.
+        """
+
+        address = self.get_client_address(request)
+        if not address:
+            return None
+
+        node_name = self._subnets.lookup(address)
+        if node_name is None:
+            return None
+
+        try:
+            return self.get_nodes()[self.get_node_ids()[node_name]]
+        except KeyError:
+            return None
+
+class CatalogueNodesBackend(NodeBackend):
+    """
+    Backend serving nodes from the nodes catalogue in the database (see
+    ``syncnodes`` management command). Closest nodes are found through the
+    geospatial index.
+
+    Node instances are cached and the cache is cleared at most every
+    ``NODES_CATALOGUE_RELOAD_INTERVAL`` seconds, so that catalogue changes
+    are picked up.
+
+    Neighbourhoods are precomputed in the catalogue by the
+    ``build_nodes_neighbourhoods`` task and cached together with nodes.
+    """
+
+    def __init__(self):
+        self.reload_interval = getattr(settings, 'NODES_CATALOGUE_RELOAD_INTERVAL', 60)
+
+        self._nodes = {}
+        self._neighbourhoods = {}
+        self._cleared_time = time.time()
+        self._lock = threading.Lock()
+
+    def _clear_stale_cache(self):
+        if self.reload_interval is not None and time.time() - self._cleared_time >= self.reload_interval:
+            with self._lock:
+                self._nodes = {}
+                self._neighbourhoods = {}
+                self._cleared_time = time.time()
+
+    def _get_cached_nodes(self):
+        self._clear_stale_cache()
+        return self._nodes
+
+    def _get_cached_neighbourhoods(self):
+        self._clear_stale_cache()
+        return self._neighbourhoods
+
+    def _to_node(self, document):
+        nodes = self._get_cached_nodes()
+        node = nodes.get(document.node_id)
+        if node is None:
+            node = nodes[document.node_id] = models.Node(document.node_id, document.name, document.location, document.latitude, document.longitude, document.url, self)
         return node
 
+    def get_source_node(self, request):
+        return None
+
+    def get_closest_node(self, request, latitude, longitude):
+        """
+        Returns the closest node to the given location.
+        """
+
+        nodes = self.get_closest_nodes(request, latitude, longitude, 1)
+        if not nodes:
+            return None
+        return nodes[0]
+
+    def get_closest_nodes(self, request, latitude, longitude, k):
+        """
+        Returns a list of up to ``k`` nodes closest to the given location,
+        ordered by increasing distance.
+        """
+
+        if k < 1:
+            return []
+
+        return [self._to_node(document) for document in models.CatalogueNode.objects(position__near_sphere=(longitude, latitude)).limit(k)]
+
     def get_node(self, node_id):
-        try:
-            node = copy.copy(data.nodes[int(node_id)])
-            node.id = node_id
-            node.backend = self
+        node = self._get_cached_nodes().get(node_id)
+        if node is not None:
             return node
-        except IndexError:
+
+        try:
+            return self._to_node(models.CatalogueNode.objects.get(node_id=node_id))
+        except models.CatalogueNode.DoesNotExist:
             return None
 
     def get_all_nodes(self):
-        for i, node in enumerate(data.nodes):
-            node = copy.copy(node)
-            node.id = i
-            node.backend = self
-            yield node
+        for document in models.CatalogueNode.objects.order_by('node_id'):
+            yield self._to_node(document)
+
+    def get_neighbourhood(self, node):
+        """
+        Returns precomputed neighbourhood of the given node, or ``None`` if it
+        has not been computed yet.
+        """
+
+        neighbourhoods = self._get_cached_neighbourhoods()
+        if node.id in neighbourhoods:
+            return neighbourhoods[node.id]
+
+        try:
+            document = models.CatalogueNode.objects.only('neighbours', 'neighbours_k', 'neighbourhood_radii').get(node_id=node.id)
+        except models.CatalogueNode.DoesNotExist:
+            return None
+
+        if document.neighbours_k is None:
+            result = None
+        else:
+            neighbour_ids = [neighbour.node_id for neighbour in document.neighbours]
+            nodes = self._get_cached_nodes()
+            missing = [node_id for node_id in neighbour_ids if node_id not in nodes]
+            if missing:
+                for neighbour_document in models.CatalogueNode.objects(node_id__in=missing):
+                    self._to_node(neighbour_document)
+            result = neighbourhood.Neighbourhood(
+                ((neighbour.distance, nodes[neighbour.node_id]) for neighbour in document.neighbours if neighbour.node_id in nodes),
+                document.neighbours_k, document.neighbourhood_radii,
+            )
+
+        neighbourhoods[node.id] = result
+        return result
+
+    def get_neighbours(self, node, k=None, radius=None):
+        """
+        Returns a list of nodes neighbouring the given node, up to ``k`` nearest
+        of them and/or those inside ``radius`` (in kilometers), ordered by
+        increasing distance.
+
+        Neighbours are served from precomputed neighbourhoods, only lookups
+        beyond them query the geospatial index.
+        """
+
+        node_neighbourhood = self.get_neighbourhood(node)
+        if node_neighbourhood is not None:
+            neighbours = node_neighbourhood.get(k, radius)
+            if neighbours is not None:
+                return neighbours
+
+        if radius is not None or k is None:
+            if radius is not None:
+                documents = models.CatalogueNode.objects(position__within_spherical_distance=[(node.longitude, node.latitude), neighbourhood.to_radians(radius)])
+            else:
+                # Without a limit all nodes are neighbours, we do not use near query
+                # for them as MongoDB limits its results to 100 documents by default
+                documents = models.CatalogueNode.objects
+            neighbours = [(neighbourhood.nodes_distance(node, document), self._to_node(document)) for document in documents]
+            neighbours.sort(key=lambda neighbour: neighbour[0])
+            neighbours = [neighbour for distance, neighbour in neighbours]
+        else:
+            neighbours = [self._to_node(document) for document in models.CatalogueNode.objects(position__near_sphere=(node.longitude, node.latitude)).limit(k + 1)]
+        neighbours = [neighbour for neighbour in neighbours if neighbour.id != node.id]
+        if k is not None:
+            neighbours = neighbours[:k]
+        return neighbours
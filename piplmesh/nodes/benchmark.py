@@ -0,0 +1,245 @@
+from __future__ import absolute_import
+
+import datetime, random, timeit
+
+from django.conf import settings
+from django.contrib.auth import hashers, models as auth_models
+from django.contrib.sessions.backends import base as sessions_base
+from django.test import client, utils
+
+from piplmesh import nodes
+from piplmesh.account import models as account_models
+from piplmesh.frontend import middleware
+
+from . import backends, models
+
+DEFAULT_NODES_COUNTS = (10, 100, 1000, 10000, 100000)
+DEFAULT_REQUESTS = 1000
+PERCENTILES = (50, 90, 99)
+
+# Synthetic nodes are spread over the area of Slovenia
+SYNTHETIC_LATITUDE_RANGE = (45.4, 46.9)
+SYNTHETIC_LONGITUDE_RANGE = (13.4, 16.6)
+SYNTHETIC_SEED = 42
+
+INSIDE_ADDRESS_PREFIX = '10.'
+
+class SyntheticNodesBackend(backends.DataNodesBackend):
+    """
+    Backend serving ``NODES_SYNTHETIC_COUNT`` randomly placed nodes.
+
+    Requests from ``10.0.0.0/8`` addresses are inside requests, node is
+    chosen based on the address, other requests are outside requests.
+    """
+
+    def get_data(self):
+        count = getattr(settings, 'NODES_SYNTHETIC_COUNT', 10)
+        rand = random.Random(SYNTHETIC_SEED)
+        return [
+            models.Node(None, 'synthetic-%d' % i, '', rand.uniform(*SYNTHETIC_LATITUDE_RANGE), rand.uniform(*SYNTHETIC_LONGITUDE_RANGE), '')
+            for i in xrange(count)
+        ]
+
+    def get_source_node(self, request):
+        address = request.META.get('REMOTE_ADDR', '')
+        if not address.startswith(INSIDE_ADDRESS_PREFIX):
+            return None
+        nodes = self.get_nodes()
+        return nodes[hash(address) % len(nodes)]
+
+class MemorySessionStore(sessions_base.SessionBase):
+    """
+    Session which is stored only in memory, so that benchmark
+    measures node resolution and not the session engine.
+    """
+
+    def load(self):
+        return {}
+
+    def exists(self, session_key):
+        return False
+
+    def create(self):
+        self.modified = True
+
+    def save(self, must_create=False):
+        pass
+
+    def delete(self, session_key=None):
+        pass
+
+def inside_address(i):
+    return '10.%d.%d.%d' % ((i >> 16) & 255, (i >> 8) & 255, i & 255)
+
+def random_location(rand):
+    return rand.uniform(*SYNTHETIC_LATITUDE_RANGE), rand.uniform(*SYNTHETIC_LONGITUDE_RANGE)
+
+class Scenario(object):
+    """
+    Prepares requests for a benchmark case. Request preparation
+    is not measured, only processing through the middleware.
+    """
+
+    name = None
+    description = None
+
+    def __init__(self, factory, staff_user):
+        self.factory = factory
+        self.staff_user = staff_user
+        self.rand = random.Random(SYNTHETIC_SEED)
+
+    def make_request(self, session_values, remote_address):
+        request = self.factory.get('/', REMOTE_ADDR=remote_address)
+        request.user = auth_models.AnonymousUser()
+        request.session = MemorySessionStore()
+        request.session.update(session_values)
+        request.session.modified = False
+        return request
+
+    def prepare(self, i):
+        raise NotImplementedError
+
+class InsideCacheHitScenario(Scenario):
+    name = 'inside_cache_hit'
+    description = "Inside request with node already stored in the session."
+
+    def prepare(self, i):
+        address = inside_address(i)
+        request = self.make_request({}, address)
+        nodes.get_node(request)
+        return self.make_request(dict(request.session.items()), address)
+
+class InsideResolveScenario(Scenario):
+    name = 'inside_resolve'
+    description = "Inside request with an empty session."
+
+    def prepare(self, i):
+        return self.make_request({}, inside_address(i))
+
+class OutsideCacheHitScenario(Scenario):
+    name = 'outside_cache_hit'
+    description = "Outside request with geolocation and the closest node already stored in the session."
+
+    def prepare(self, i):
+        latitude, longitude = random_location(self.rand)
+        session_values = {
+            nodes.LATITUDE_SESSION_KEY: latitude,
+            nodes.LONGITUDE_SESSION_KEY: longitude,
+        }
+        request = self.make_request(session_values, '192.0.2.1')
+        nodes.get_node(request)
+        return self.make_request(dict(request.session.items()), '192.0.2.1')
+
+class OutsideResolveScenario(Scenario):
+    name = 'outside_resolve'
+    description = "Outside request with new geolocation, so the closest node has to be found."
+
+    def prepare(self, i):
+        latitude, longitude = random_location(self.rand)
+        return self.make_request({
+            nodes.LATITUDE_SESSION_KEY: latitude,
+            nodes.LONGITUDE_SESSION_KEY: longitude,
+        }, '192.0.2.1')
+
+class MockingScenario(Scenario):
+    name = 'mocking'
+    description = "Staff request mocking location."
+
+    def prepare(self, i):
+        backend_nodes = nodes.get_backends()[0].get_nodes()
+        node = backend_nodes[i % len(backend_nodes)]
+        request = self.make_request({
+            nodes.SESSION_KEY: node.id,
+            nodes.BACKEND_SESSION_KEY: node.backend.get_full_name(),
+            nodes.MOCKING_SESSION_KEY: True,
+        }, '192.0.2.1')
+        request.user = self.staff_user
+        return request
+
+SCENARIOS = (
+    InsideCacheHitScenario,
+    InsideResolveScenario,
+    OutsideCacheHitScenario,
+    OutsideResolveScenario,
+    MockingScenario,
+)
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = int(round(percent / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def measure(scenario, requests):
+    nodes_middleware = middleware.NodesMiddleware()
+    timer = timeit.default_timer
+
+    prepared = [scenario.prepare(i) for i in xrange(requests)]
+
+    latencies = []
+    resolved = 0
+    session_writes = 0
+    start = timer()
+    for request in prepared:
+        request_start = timer()
+        response = nodes_middleware.process_request(request)
+        node = request.node if response is None else None
+        latencies.append(timer() - request_start)
+
+        if node:
+            resolved += 1
+        if request.session.modified:
+            session_writes += 1
+    total = timer() - start
+
+    latencies.sort()
+    return {
+        'scenario': scenario.name,
+        'description': scenario.description,
+        'requests': requests,
+        'resolved': resolved,
+        'session_writes': session_writes,
+        'throughput': requests / total if total else None,
+        'latency': dict([('mean', sum(latencies) / len(latencies) if latencies else None), ('max', latencies[-1] if latencies else None)] + [
+            ('p%d' % percent, percentile(latencies, percent)) for percent in PERCENTILES
+        ]),
+    }
+
+def run(nodes_counts=DEFAULT_NODES_COUNTS, requests=DEFAULT_REQUESTS, scenarios=SCENARIOS, log=None):
+    """
+    Runs node resolution benchmark for all scenarios and nodes counts and
+    returns results as a JSON-serializable dict. Latencies are in seconds.
+    """
+
+    factory = client.RequestFactory()
+
+    staff_user = account_models.User(username='benchmark', is_staff=True)
+    # We set password directly, because set_password would save the user
+    staff_user.password = hashers.make_password('benchmark')
+
+    results = []
+    for nodes_count in nodes_counts:
+        with utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.benchmark.SyntheticNodesBackend',), NODES_SYNTHETIC_COUNT=nodes_count):
+            warm_up_start = timeit.default_timer()
+            nodes.backends_registry.warm_up()
+            warm_up_time = timeit.default_timer() - warm_up_start
+
+            if log:
+                log("Nodes: %d, warm up: %.3f s\n" % (nodes_count, warm_up_time))
+
+            for scenario_class in scenarios:
+                result = measure(scenario_class(factory, staff_user), requests)
+                result.update({
+                    'nodes': nodes_count,
+                    'warm_up_time': warm_up_time,
+                })
+                results.append(result)
+
+                if log:
+                    log("  %(scenario)s: %(throughput).1f requests/s, p50 %(p50).6f s, p99 %(p99).6f s\n" % dict(result, **result['latency']))
+
+    return {
+        'created_time': datetime.datetime.utcnow().isoformat(),
+        'requests': requests,
+        'results': results,
+    }
@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import csv, hashlib, json, os
+
+from . import models, neighbourhood, spatial
+
+CATALOGUE_FIELDS = ('node_id', 'name', 'location', 'latitude', 'longitude', 'url')
+
+REQUIRED_FIELDS = ('name', 'latitude', 'longitude')
+
+def read_export(path):
+    """
+    Reads nodes database export and returns an iterator over records (dicts).
+
+    Export is a JSON file with a list of objects, or a CSV file with a header
+    row. Each record has ``name``, ``latitude`` and ``longitude``, and optional
+    ``location``, ``url`` and ``node_id`` (which defaults to the name) fields.
+
+    The whole export is validated before any record is returned, so that an
+    invalid record does not leave the catalogue partially synchronized.
+    Invalid records raise ``ValueError`` with their position in the export.
+    """
+
+    with open(path, 'rb') as export_file:
+        if os.path.splitext(path)[1].lower() == '.csv':
+            reader = csv.DictReader(export_file)
+            records = []
+            for row in reader:
+                # Short rows have None for missing values and long rows have extra values under None key,
+                # we treat both as missing
+                records.append(('line %d' % reader.line_num, dict((key, value.decode('utf-8')) for key, value in row.items() if key is not None and value is not None)))
+        else:
+            records = [('record %d' % (i + 1), record) for i, record in enumerate(json.load(export_file))]
+
+    parsed = []
+    for position, record in records:
+        try:
+            parsed.append(parse_record(record))
+        except (AttributeError, TypeError, ValueError), e:
+            raise ValueError("Invalid %s of '%s': %s" % (position, path, e))
+
+    return iter(parsed)
+
+def parse_record(record):
+    for field in REQUIRED_FIELDS:
+        if record.get(field) in (None, ''):
+            raise ValueError("Missing '%s' field" % field)
+
+    return {
+        'node_id': unicode(record.get('node_id') or record['name']),
+        'name': unicode(record['name']),
+        'location': unicode(record.get('location') or ''),
+        'latitude': float(record['latitude']),
+        'longitude': float(record['longitude']),
+        'url': unicode(record.get('url') or ''),
+    }
+
+def content_hash(record):
+    return hashlib.sha1(json.dumps([record[field] for field in CATALOGUE_FIELDS])).hexdigest()
+
+def sync(records, prune=False):
+    """
+    Synchronizes nodes catalogue in the database with given records, upserting
+    only new and changed records. If ``prune`` is set, nodes not among records
+    are removed.
+
+    Returns a dict with counts of ``created``, ``updated``, ``unchanged`` and
+    ``removed`` nodes.
+    """
+
+    existing = dict((node.node_id, node.content_hash) for node in models.CatalogueNode.objects.only('node_id', 'content_hash'))
+
+    stats = {
+        'created': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'removed': 0,
+    }
+
+    seen = set()
+    for record in records:
+        node_id = record['node_id']
+        seen.add(node_id)
+
+        record_hash = content_hash(record)
+        if existing.get(node_id) == record_hash:
+            stats['unchanged'] += 1
+            continue
+
+        models.CatalogueNode.objects(node_id=node_id).update(
+            upsert=True,
+            set__name=record['name'],
+            set__location=record['location'],
+            set__latitude=record['latitude'],
+            set__longitude=record['longitude'],
+            set__url=record['url'],
+            set__position=[record['longitude'], record['latitude']],
+            set__content_hash=record_hash,
+        )
+
+        if node_id in existing:
+            stats['updated'] += 1
+        else:
+            stats['created'] += 1
+
+    if prune:
+        removed = [node_id for node_id in existing if node_id not in seen]
+        if removed:
+            models.CatalogueNode.objects(node_id__in=removed).delete()
+        stats['removed'] = len(removed)
+
+    return stats
+
+def build_neighbourhoods(k, radii):
+    """
+    Precomputes neighbourhoods of all nodes in the nodes catalogue and stores
+    them with nodes. Returns the number of nodes.
+    """
+
+    documents = list(models.CatalogueNode.objects.only('node_id', 'latitude', 'longitude'))
+    index = spatial.KDTree(range(len(documents)), [(document.latitude, document.longitude) for document in documents])
+
+    for document, node_neighbourhood in zip(documents, neighbourhood.build(documents, index, k, radii)):
+        models.CatalogueNode.objects(node_id=document.node_id).update(
+            set__neighbours=[
+                models.CatalogueNeighbour(node_id=neighbour.node_id, distance=distance)
+                for distance, neighbour in zip(node_neighbourhood.distances, node_neighbourhood.neighbours)
+            ],
+            set__neighbours_k=k,
+            set__neighbourhood_radii=[float(radius) for radius in radii],
+        )
+
+    return len(documents)
@@ -0,0 +1,45 @@
+import json
+from optparse import make_option
+
+from django.core.management import base
+
+from piplmesh.nodes import benchmark
+
+class Command(base.BaseCommand):
+    option_list = base.BaseCommand.option_list + (
+        make_option('--nodes', action='store', dest='nodes', default=','.join(str(count) for count in benchmark.DEFAULT_NODES_COUNTS),
+            help='Comma-separated list of synthetic nodes counts. Default is "%default".'),
+        make_option('--requests', action='store', type='int', dest='requests', default=benchmark.DEFAULT_REQUESTS,
+            help='Number of requests per scenario. Default is %default.'),
+        make_option('--output', action='store', dest='output', default=None,
+            help='File to write JSON results to. By default they are written to standard output.'),
+    )
+    help = 'Benchmark per-request node resolution (NodesMiddleware and nodes backends).'
+
+    def handle(self, *args, **options):
+        """
+        Runs node resolution benchmark and outputs results as JSON.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        try:
+            nodes_counts = [int(count) for count in options['nodes'].split(',')]
+        except ValueError:
+            raise base.CommandError("Invalid nodes counts: '%s'" % options['nodes'])
+
+        if options['requests'] < 1:
+            raise base.CommandError("Number of requests has to be positive.")
+
+        log = self.stderr.write if verbosity > 1 else None
+
+        results = benchmark.run(nodes_counts, options['requests'], log=log)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=4)
+            if verbosity > 0:
+                self.stdout.write("Results written to '%s'.\n" % options['output'])
+        else:
+            json.dump(results, self.stdout, indent=4)
+            self.stdout.write('\n')
@@ -0,0 +1,37 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management import base
+
+from piplmesh.nodes import tasks
+
+class Command(base.BaseCommand):
+    option_list = base.BaseCommand.option_list + (
+        make_option('--prune', action='store_true', dest='prune', default=False,
+            help='Remove nodes which are not in the export file.'),
+    )
+    args = '[export file]'
+    help = 'Synchronize nodes catalogue with the nodes database export file (JSON or CSV).'
+
+    def handle(self, *args, **options):
+        """
+        Synchronizes nodes catalogue.
+        """
+
+        verbosity = int(options['verbosity'])
+
+        if len(args) > 1:
+            raise base.CommandError("Usage is syncnodes %s" % self.args)
+
+        path = args[0] if args else getattr(settings, 'NODES_CATALOGUE_FILE', None)
+        if not path:
+            raise base.CommandError("No export file given and NODES_CATALOGUE_FILE is not set.")
+
+        if verbosity > 1:
+            self.stdout.write('Synchronizing nodes catalogue...\n')
+
+        # We run the task in this process as the export file is local
+        stats = tasks.sync_nodes_catalogue(path, options['prune'])
+
+        if verbosity > 0:
+            self.stdout.write('Nodes created: %(created)d, updated: %(updated)d, unchanged: %(unchanged)d, removed: %(removed)d.\n' % stats)
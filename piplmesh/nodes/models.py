@@ -1,27 +1,124 @@
-from piplmesh import nodes
+import mongoengine
 
 NODE_ID_SEPARATOR = '-'
 
 class Node(object):
-    def __init__(self, id, name, location, latitude, longitude, url):
-        self.id = id
-        self.name = name
-        self.location = location
-        self.latitude = latitude
-        self.longitude = longitude
-        self.url = url
+    """
+    Immutable description of a wireless node.
 
-        self._outside_request = False
+    Instances are shared between requests, so a backend creates them once and
+    returns the same instance every time. Request-specific information is
+    stored in ``RequestNode`` which wraps a node.
+    """
 
-    def is_outside_request(self):
-        return self._outside_request
+    __slots__ = ('id', 'name', 'location', 'latitude', 'longitude', 'url', 'backend')
 
-    def is_inside_request(self):
-        return not self._outside_request
+    def __init__(self, id, name, location, latitude, longitude, url, backend=None):
+        for attribute, value in zip(self.__slots__, (id, name, location, latitude, longitude, url, backend)):
+            object.__setattr__(self, attribute, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("'%s' object is immutable" % self.__class__.__name__)
+
+    def __reduce__(self):
+        return (self.__class__, tuple(getattr(self, attribute) for attribute in self.__slots__))
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.name)
+
+    def bind(self, id, backend):
+        """
+        Returns a copy of the node with given ID and backend.
+        """
+
+        return self.__class__(id, self.name, self.location, self.latitude, self.longitude, self.url, backend)
 
     def get_full_node_id(self):
         return '%s%s%s' % (self.backend.get_full_name(), NODE_ID_SEPARATOR, self.id)
 
+    def get_neighbours(self, k=None, radius=None):
+        """
+        Returns a list of nodes neighbouring this node, up to ``k`` nearest of
+        them and/or those inside ``radius`` (in kilometers), ordered by
+        increasing distance.
+        """
+
+        return self.backend.get_neighbours(self, k, radius)
+
     @classmethod
     def parse_full_node_id(cls, full_node_id):
         return full_node_id.split(NODE_ID_SEPARATOR, 1)
+
+class RequestNode(object):
+    """
+    Lightweight request-scoped wrapper around a shared ``Node``, which knows
+    whether request is from inside the node or from outside of it (and node
+    was determined based on geolocation data).
+
+    All other attributes are those of the wrapped node.
+    """
+
+    __slots__ = ('node', '_outside_request')
+
+    def __init__(self, node, outside_request=False):
+        self.node = node
+        self._outside_request = outside_request
+
+    def __getattr__(self, name):
+        # Called only for attributes not found on the wrapper itself
+        if name in self.__slots__:
+            raise AttributeError(name)
+        return getattr(self.node, name)
+
+    def __repr__(self):
+        return '<%s: %s%s>' % (self.__class__.__name__, self.node.name, ' (outside)' if self._outside_request else '')
+
+    def is_outside_request(self):
+        return self._outside_request
+
+    def is_inside_request(self):
+        return not self._outside_request
+
+class NodeSubnet(mongoengine.Document):
+    """
+    Network (in CIDR notation) from which requests originate on the given node.
+    """
+
+    network = mongoengine.StringField(required=True, unique=True)
+    node_name = mongoengine.StringField(required=True)
+
+class CatalogueNeighbour(mongoengine.EmbeddedDocument):
+    """
+    Precomputed neighbour of a node in the nodes catalogue.
+    """
+
+    node_id = mongoengine.StringField(required=True)
+    distance = mongoengine.FloatField(required=True) # km
+
+class CatalogueNode(mongoengine.Document):
+    """
+    Node stored in the nodes catalogue in the database.
+
+    Position is stored as ``(longitude, latitude)``, as required by spherical
+    geospatial queries.
+    """
+
+    node_id = mongoengine.StringField(required=True, unique=True)
+    name = mongoengine.StringField(required=True)
+    location = mongoengine.StringField(default='')
+    latitude = mongoengine.FloatField(required=True)
+    longitude = mongoengine.FloatField(required=True)
+    url = mongoengine.StringField(default='')
+    position = mongoengine.GeoPointField(required=True)
+
+    # Hash of the exported record, so that sync can skip unchanged records
+    content_hash = mongoengine.StringField(required=True)
+
+    # Precomputed neighbourhood, ordered by increasing distance, see
+    # build_nodes_neighbourhoods task; neighbours_k is not set if not computed
+    neighbours = mongoengine.ListField(mongoengine.EmbeddedDocumentField(CatalogueNeighbour))
+    neighbours_k = mongoengine.IntField()
+    neighbourhood_radii = mongoengine.ListField(mongoengine.FloatField())
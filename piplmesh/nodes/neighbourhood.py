@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+
+import bisect, math
+
+from . import spatial
+
+# Mean Earth radius, to convert great-circle distances to kilometers
+EARTH_RADIUS = 6371.0 # km
+
+DEFAULT_NEIGHBOURS = 10
+DEFAULT_RADII = (1, 5, 10) # km
+
+def to_kilometers(distance):
+    return distance * EARTH_RADIUS
+
+def to_radians(kilometers):
+    return kilometers / EARTH_RADIUS
+
+def nodes_distance(node_a, node_b):
+    """
+    Returns great-circle distance between two nodes in kilometers.
+    """
+
+    point_a = spatial.to_cartesian(node_a.latitude, node_a.longitude)
+    point_b = spatial.to_cartesian(node_b.latitude, node_b.longitude)
+    return to_kilometers(spatial.chord_to_distance(math.sqrt(sum((a - b)**2 for a, b in zip(point_a, point_b)))))
+
+class Neighbourhood(object):
+    """
+    Precomputed neighbours of a node: neighbours are ordered by increasing
+    distance and contain at least the ``k`` nearest nodes and all nodes inside
+    the largest of ``radii``. For each of ``radii`` the number of neighbours
+    inside it is stored, so both kinds of lookups are just a slice.
+    """
+
+    __slots__ = ('k', 'neighbours', 'distances', 'buckets')
+
+    def __init__(self, neighbours, k, radii):
+        """
+        ``neighbours`` is an iterable of ``(distance, node)`` pairs, with
+        distance in kilometers, ordered by increasing distance.
+        """
+
+        neighbours = list(neighbours)
+
+        self.k = k
+        self.neighbours = tuple(node for distance, node in neighbours)
+        self.distances = tuple(distance for distance, node in neighbours)
+        self.buckets = dict((radius, bisect.bisect_right(self.distances, radius)) for radius in radii)
+
+    def get(self, k=None, radius=None):
+        """
+        Returns a list of neighbours, up to ``k`` nearest of them and/or those
+        inside ``radius`` (in kilometers).
+
+        Returns ``None`` if the neighbourhood was not precomputed far enough to
+        answer, that is for ``k`` larger than the precomputed one or ``radius``
+        larger than the largest precomputed radius, or when neither is given.
+        """
+
+        if k is None and radius is None:
+            # Only a limited neighbourhood is precomputed
+            return None
+
+        end = len(self.neighbours)
+
+        if radius is not None:
+            if radius in self.buckets:
+                end = self.buckets[radius]
+            elif self.buckets and radius <= max(self.buckets):
+                end = bisect.bisect_right(self.distances, radius)
+            else:
+                return None
+
+        if k is not None:
+            # All nodes inside precomputed radii are known, otherwise only k nearest
+            if k > self.k and radius is None:
+                return None
+            end = min(end, k)
+
+        return list(self.neighbours[:end])
+
+def get_settings():
+    """
+    Returns ``(k, radii)`` pair from ``NODES_NEIGHBOURS`` and ``NODES_NEIGHBOURHOOD_RADII`` settings.
+    """
+
+    from django.conf import settings
+
+    return getattr(settings, 'NODES_NEIGHBOURS', DEFAULT_NEIGHBOURS), tuple(getattr(settings, 'NODES_NEIGHBOURHOOD_RADII', DEFAULT_RADII))
+
+def build_one(nodes, index, i, k, radii):
+    """
+    Builds neighbourhood of the ``i``-th node in ``nodes``, using the spatial
+    index over node positions in ``nodes`` (see ``spatial.KDTree``).
+    """
+
+    node = nodes[i]
+    max_radius = to_radians(max(radii)) if radii else None
+
+    # Node itself is the closest one, so we ask for one more
+    candidates = index.nearest(node.latitude, node.longitude, k + 1)
+    if max_radius is not None and (not candidates or candidates[-1][0] <= max_radius):
+        # There might be more nodes inside the largest radius
+        candidates = index.within(node.latitude, node.longitude, max_radius)
+
+    return Neighbourhood(((to_kilometers(distance), nodes[j]) for distance, j in candidates if j != i), k, radii)
+
+def build(nodes, index, k, radii):
+    """
+    Builds neighbourhoods for all nodes using the spatial index over node
+    positions in ``nodes`` (see ``spatial.KDTree``). Returns a list of
+    neighbourhoods, one for each node.
+    """
+
+    return [build_one(nodes, index, i, k, radii) for i in xrange(len(nodes))]
@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+
+import threading
+
+from django import dispatch
+from django.conf import settings
+from django.core import exceptions
+from django.test import signals as test_signals
+from django.utils import importlib
+
+class BackendsRegistry(object):
+    """
+    Process-wide registry of nodes backends.
+
+    Backends are resolved and instantiated only once and then reused, keyed by
+    their full name. Use ``invalidate`` to force them to be loaded again.
+    """
+
+    def __init__(self):
+        self.backends = {}
+        self.configured_backends = None
+        self.lock = threading.RLock()
+
+    def load_backend(self, path):
+        """
+        Imports and instantiates a backend, bypassing the registry.
+        """
+
+        i = path.rfind('.')
+        module, attr = path[:i], path[i+1:]
+        try:
+            mod = importlib.import_module(module)
+        except ImportError, e:
+            raise exceptions.ImproperlyConfigured('Error importing nodes backend %s: "%s"' % (path, e))
+        except ValueError, e:
+            raise exceptions.ImproperlyConfigured('Error importing nodes backends. Is NODES_BACKENDS a correctly defined list or tuple?')
+        try:
+            cls = getattr(mod, attr)
+        except AttributeError:
+            raise exceptions.ImproperlyConfigured('Module "%s" does not define a "%s" nodes backend' % (module, attr))
+
+        return cls()
+
+    def get_backend(self, path):
+        """
+        Returns the instance of a backend with the given full name.
+        """
+
+        try:
+            return self.backends[path]
+        except KeyError:
+            pass
+
+        with self.lock:
+            if path not in self.backends:
+                self.backends[path] = self.load_backend(path)
+            return self.backends[path]
+
+    def get_backends(self):
+        """
+        Returns a tuple of instances of backends configured in ``NODES_BACKENDS``.
+        """
+
+        configured_backends = self.configured_backends
+        if configured_backends is not None:
+            return configured_backends
+
+        with self.lock:
+            if self.configured_backends is None:
+                configured_backends = tuple(self.get_backend(backend_path) for backend_path in getattr(settings, 'NODES_BACKENDS', ()))
+                if not configured_backends:
+                    raise exceptions.ImproperlyConfigured('No nodes backends have been defined. Does NODES_BACKENDS contain anything?')
+                self.configured_backends = configured_backends
+            return self.configured_backends
+
+    def warm_up(self):
+        """
+        Loads all configured backends and lets them preload their data.
+        """
+
+        for backend in self.get_backends():
+            backend.warm_up()
+
+    def invalidate(self):
+        """
+        Forgets all loaded backends, so that they are loaded again on next use.
+        """
+
+        with self.lock:
+            self.backends = {}
+            self.configured_backends = None
+
+backends_registry = BackendsRegistry()
+
+@dispatch.receiver(test_signals.setting_changed)
+def invalidate_backends_on_setting_changed(sender, setting, value, **kwargs):
+    """
+    Invalidates loaded backends when nodes settings are changed (in tests).
+    """
+
+    if setting.startswith('NODES_'):
+        backends_registry.invalidate()
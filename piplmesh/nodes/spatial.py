@@ -0,0 +1,132 @@
+import heapq, math
+
+def to_cartesian(latitude, longitude):
+    """
+    Converts geographic coordinates (in degrees) to a point on the unit sphere.
+
+    Euclidean (chord) distance between such points grows monotonically with the
+    great-circle distance, so we can use them in a k-d tree.
+    """
+
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    cos_latitude = math.cos(latitude)
+    return (cos_latitude * math.cos(longitude), cos_latitude * math.sin(longitude), math.sin(latitude))
+
+def distance_to_chord(distance):
+    """
+    Inverse of ``chord_to_distance``.
+    """
+
+    return 2 * math.sin(min(math.pi, distance) / 2)
+
+def chord_to_distance(chord):
+    """
+    Converts chord distance between two points on the unit sphere to the
+    great-circle distance (central angle, in radians), the same unit as
+    ``piplmesh.nodes.distance`` returns.
+    """
+
+    return 2 * math.asin(min(1.0, chord / 2))
+
+class KDTree(object):
+    """
+    A static k-d tree over geographic coordinates, supporting nearest and
+    k-nearest neighbour queries in logarithmic time on average.
+
+    Items are arbitrary objects, they are returned as results of queries.
+    """
+
+    DIMENSIONS = 3
+
+    def __init__(self, items, coordinates):
+        """
+        ``items`` is an iterable of objects and ``coordinates`` an iterable of
+        ``(latitude, longitude)`` pairs, one for each item.
+        """
+
+        points = [(to_cartesian(latitude, longitude), item) for item, (latitude, longitude) in zip(items, coordinates)]
+        self._size = len(points)
+        self._root = self._build(points, 0)
+
+    def __len__(self):
+        return self._size
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+
+        axis = depth % self.DIMENSIONS
+        points.sort(key=lambda point: point[0][axis])
+        median = len(points) // 2
+        point, item = points[median]
+
+        # Node is a tuple (point, item, axis, left, right)
+        return (point, item, axis, self._build(points[:median], depth + 1), self._build(points[median + 1:], depth + 1))
+
+    def _search(self, node, target, k, heap):
+        if node is None:
+            return
+
+        point, item, axis, left, right = node
+
+        squared = sum((a - b)**2 for a, b in zip(point, target))
+        # We use a max-heap (through negated distances) of the k best candidates found so far
+        if len(heap) < k:
+            heapq.heappush(heap, (-squared, id(item), item))
+        elif squared < -heap[0][0]:
+            heapq.heapreplace(heap, (-squared, id(item), item))
+
+        difference = target[axis] - point[axis]
+        if difference < 0:
+            near, far = left, right
+        else:
+            near, far = right, left
+
+        self._search(near, target, k, heap)
+
+        # We visit the other side only if it can contain a better candidate
+        if len(heap) < k or difference**2 < -heap[0][0]:
+            self._search(far, target, k, heap)
+
+    def nearest(self, latitude, longitude, k=1):
+        """
+        Returns a list of up to ``k`` ``(distance, item)`` pairs closest to the
+        given location, ordered by increasing distance. Distance is the
+        great-circle distance in radians.
+        """
+
+        if k < 1:
+            return []
+
+        heap = []
+        self._search(self._root, to_cartesian(latitude, longitude), k, heap)
+
+        return [(chord_to_distance(math.sqrt(-squared)), item) for squared, _, item in sorted(heap, reverse=True)]
+
+    def _search_within(self, node, target, squared_radius, result):
+        if node is None:
+            return
+
+        point, item, axis, left, right = node
+
+        squared = sum((a - b)**2 for a, b in zip(point, target))
+        if squared <= squared_radius:
+            result.append((squared, id(item), item))
+
+        difference = target[axis] - point[axis]
+        if difference <= 0 or difference**2 <= squared_radius:
+            self._search_within(left, target, squared_radius, result)
+        if difference >= 0 or difference**2 <= squared_radius:
+            self._search_within(right, target, squared_radius, result)
+
+    def within(self, latitude, longitude, distance):
+        """
+        Returns a list of ``(distance, item)`` pairs for all items within the given
+        great-circle distance (in radians) from the given location, ordered by
+        increasing distance.
+        """
+
+        result = []
+        self._search_within(self._root, to_cartesian(latitude, longitude), distance_to_chord(distance)**2, result)
+
+        return [(chord_to_distance(math.sqrt(squared)), item) for squared, _, item in sorted(result)]
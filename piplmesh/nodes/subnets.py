@@ -0,0 +1,234 @@
+import binascii, logging, os, socket, threading, time
+
+logger = logging.getLogger(__name__)
+
+def parse_address(address):
+    """
+    Parses IPv4 or IPv6 address and returns a pair ``(bits, value)``, where
+    ``bits`` is the length of addresses of this family and ``value`` the
+    address as an integer.
+
+    Raises ``ValueError`` for an invalid address.
+    """
+
+    address = address.strip()
+    for family, bits in ((socket.AF_INET, 32), (socket.AF_INET6, 128)):
+        try:
+            packed = socket.inet_pton(family, address)
+        except (socket.error, TypeError, ValueError):
+            continue
+        return bits, int(binascii.hexlify(packed), 16)
+    raise ValueError("Invalid IP address: '%s'" % address)
+
+def parse_network(network):
+    """
+    Parses network in CIDR notation (for example ``10.254.0.0/16``) and returns
+    a triple ``(bits, value, prefix_length)``. Address without prefix length
+    is a network with only that address.
+
+    Raises ``ValueError`` for an invalid network.
+    """
+
+    address, _, prefix_length = network.strip().partition('/')
+    bits, value = parse_address(address)
+    prefix_length = int(prefix_length) if prefix_length else bits
+    if not 0 <= prefix_length <= bits:
+        raise ValueError("Invalid prefix length: '%s'" % network)
+    return bits, value, prefix_length
+
+class PrefixTrie(object):
+    """
+    Binary radix trie mapping IP networks to values, supporting longest-prefix
+    matching of addresses in time proportional to the address length.
+    """
+
+    def __init__(self):
+        # Separate trie for each address family, keyed by address length,
+        # trie node is a list [zero child, one child, has value, value]
+        self._roots = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, network, value):
+        bits, address, prefix_length = parse_network(network)
+
+        node = self._roots.setdefault(bits, [None, None, False, None])
+        for i in xrange(prefix_length):
+            bit = (address >> (bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False, None]
+            node = node[bit]
+
+        if not node[2]:
+            self._size += 1
+        node[2] = True
+        node[3] = value
+
+    def lookup(self, address):
+        """
+        Returns the value of the longest network containing the given address,
+        or ``None`` if there is no such network or address is invalid.
+        """
+
+        try:
+            bits, address = parse_address(address)
+        except ValueError:
+            return None
+
+        node = self._roots.get(bits)
+        value = None
+        i = bits - 1
+        while node is not None:
+            if node[2]:
+                value = node[3]
+            if i < 0:
+                break
+            node = node[(address >> i) & 1]
+            i -= 1
+        return value
+
+def read_subnets_file(path):
+    """
+    Reads subnets file and returns an iterator over ``(network, node name)`` pairs.
+
+    Each line of the file contains a network in CIDR notation and a node name,
+    separated by whitespace. Empty lines and lines starting with ``#`` are ignored,
+    lines without a node name are skipped and logged.
+    """
+
+    with open(path, 'r') as subnets_file:
+        for line_number, line in enumerate(subnets_file, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = line.split(None, 1)
+            if len(parts) != 2:
+                logger.warning("Skipping line %d of subnets file '%s' without a node name: %r", line_number, path, line)
+                continue
+            network, node_name = parts
+            yield network, node_name.strip()
+
+def read_subnets_collection():
+    """
+    Returns an iterator over ``(network, node name)`` pairs stored in the database.
+    """
+
+    from . import models
+
+    for subnet in models.NodeSubnet.objects.only('network', 'node_name'):
+        yield subnet.network, subnet.node_name
+
+class SubnetsTable(object):
+    """
+    Holds a prefix trie of node subnets, loaded from a file (if ``path`` is given)
+    or the database, and reloaded when the source changes.
+
+    To not hit the disk or the database on every lookup, the source is checked
+    for changes at most once per ``reload_interval`` seconds. Subnets from the
+    database are reloaded in a background thread, lookups meanwhile use the
+    previously loaded subnets. A missing or unreadable file is treated as
+    an empty table until it appears.
+    """
+
+    def __init__(self, path=None, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+
+        self._trie = None
+        self._mtime = None
+        self._checked_time = None
+        self._reloading = False
+        self._lock = threading.Lock()
+
+    def _is_stale(self):
+        if self._trie is None:
+            return True
+        if self.reload_interval is None:
+            return False
+
+        now = time.time()
+        if now - self._checked_time < self.reload_interval:
+            return False
+        self._checked_time = now
+
+        if self.path is None:
+            return True
+        try:
+            return os.stat(self.path).st_mtime != self._mtime
+        except OSError:
+            # File has been removed since it was loaded
+            return self._mtime is not None
+
+    def _build(self, subnets):
+        trie = PrefixTrie()
+        for network, node_name in subnets:
+            try:
+                trie.insert(network, node_name)
+            except ValueError, e:
+                logger.warning("Skipping invalid subnet for node '%s': %s", node_name, e)
+        return trie
+
+    def _load(self):
+        if self.path is None:
+            return self._build(read_subnets_collection()), None
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+            trie = self._build(read_subnets_file(self.path))
+        except (OSError, IOError):
+            return PrefixTrie(), None
+        return trie, mtime
+
+    def reload(self):
+        """
+        Reloads subnets from the source. If reloading fails, previously
+        loaded subnets are kept.
+        """
+
+        with self._lock:
+            try:
+                trie, mtime = self._load()
+            except Exception:
+                logger.exception("Reloading subnets failed.")
+                if self._trie is None:
+                    self._trie = PrefixTrie()
+                # We retry after the reload interval
+                self._checked_time = time.time()
+                return
+
+            # We replace the whole trie at once, so concurrent lookups are not affected
+            self._trie = trie
+            self._mtime = mtime
+            self._checked_time = time.time()
+
+    def _reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def run():
+            try:
+                self.reload()
+            finally:
+                self._reloading = False
+
+        thread = threading.Thread(target=run, name='subnets')
+        thread.daemon = True
+        thread.start()
+
+    def lookup(self, address):
+        """
+        Returns node name for the given address, or ``None`` if not known.
+        """
+
+        if self._is_stale():
+            # Only the first load (normally done at warm up) happens in the request
+            if self._trie is None or self.path is not None:
+                self.reload()
+            else:
+                self._reload_in_background()
+
+        return self._trie.lookup(address)
@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+
+from celery import task
+
+from . import catalogue, neighbourhood
+
+@task.task
+def sync_nodes_catalogue(path=None, prune=False):
+    """
+    Task which synchronizes nodes catalogue in the database with the nodes
+    database export file (``NODES_CATALOGUE_FILE`` by default).
+
+    If catalogue changed, neighbourhoods are rebuilt.
+    """
+
+    if path is None:
+        path = settings.NODES_CATALOGUE_FILE
+
+    stats = catalogue.sync(catalogue.read_export(path), prune)
+
+    if stats['created'] or stats['updated'] or stats['removed']:
+        build_nodes_neighbourhoods()
+
+    return stats
+
+@task.task
+def build_nodes_neighbourhoods():
+    """
+    Task which precomputes neighbourhoods of nodes in the nodes catalogue.
+    """
+
+    k, radii = neighbourhood.get_settings()
+    return catalogue.build_neighbourhoods(k, radii)
@@ -1,10 +1,28 @@
 from __future__ import absolute_import
 
+import os, tempfile
+
 from django.test import client, utils
 
 from tastypie_mongoengine import test_runner
 
 from piplmesh import nodes
+from piplmesh.nodes import backends, catalogue, models, neighbourhood, subnets
+
+class Session(dict):
+    """
+    Session which, like Django sessions, tracks whether it was modified.
+    """
+
+    modified = False
+
+    def __setitem__(self, key, value):
+        super(Session, self).__setitem__(key, value)
+        self.modified = True
+
+    def __delitem__(self, key):
+        super(Session, self).__delitem__(key)
+        self.modified = True
 
 @utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.RandomNodesBackend',))
 class BasicTest(test_runner.MongoEngineTestCase):
@@ -20,3 +38,205 @@ class BasicTest(test_runner.MongoEngineTestCase):
 
         node2 = nodes.get_node(request)
         self.assertEqual(node1.id, node2.id)
+
+    @utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.NearestNodesBackend',))
+    def test_closest_node(self):
+        backend = backends.NearestNodesBackend()
+
+        for latitude, longitude in ((46.0445688554, 14.4893038273), (46.05, 14.5), (46.55, 15.64), (45.0, 13.0)):
+            closest = min(backend.get_all_nodes(), key=lambda node: nodes.distance(latitude, longitude, node.latitude, node.longitude))
+            self.assertEqual(backend.get_closest_node(None, latitude, longitude).id, closest.id)
+
+            closest_nodes = backend.get_closest_nodes(None, latitude, longitude, 5)
+            self.assertEqual(len(closest_nodes), 5)
+            self.assertEqual(closest_nodes[0].id, closest.id)
+            distances = [nodes.distance(latitude, longitude, node.latitude, node.longitude) for node in closest_nodes]
+            self.assertEqual(distances, sorted(distances))
+
+        request = self.factory.get('/')
+        request.session = {
+            nodes.LATITUDE_SESSION_KEY: 46.0445688554,
+            nodes.LONGITUDE_SESSION_KEY: 14.4893038273,
+        }
+
+        node = nodes.get_node(request)
+        self.assertEqual(node.name, 'fri')
+        self.assertTrue(node.is_outside_request())
+
+    def test_distances(self):
+        coordinates = [(node.latitude, node.longitude) for node in nodes.get_all_nodes()]
+        points = coordinates[:3] + [(46.05, 14.5)]
+
+        matrix = nodes.distance_matrix(points, coordinates)
+
+        for (latitude, longitude), row in zip(points, matrix):
+            for (node_latitude, node_longitude), value in zip(coordinates, row):
+                self.assertAlmostEqual(value, nodes.distance(latitude, longitude, node_latitude, node_longitude))
+
+            ranked = nodes.closest(latitude, longitude, coordinates, 3)
+            self.assertEqual(ranked, sorted(zip(row, range(len(row))))[:3])
+
+    @utils.override_settings(NODES_NEIGHBOURS=3, NODES_NEIGHBOURHOOD_RADII=(1, 5))
+    def test_neighbours(self):
+        backend = backends.NearestNodesBackend()
+
+        for node in backend.get_all_nodes():
+            others = sorted((neighbourhood.nodes_distance(node, other), other.id) for other in backend.get_all_nodes() if other.id != node.id)
+
+            self.assertEqual([neighbour.id for neighbour in node.get_neighbours(k=3)], [node_id for distance, node_id in others[:3]])
+            self.assertEqual([neighbour.id for neighbour in node.get_neighbours(k=5)], [node_id for distance, node_id in others[:5]])
+            for radius in (1, 3, 5, 20):
+                self.assertEqual([neighbour.id for neighbour in node.get_neighbours(radius=radius)], [node_id for distance, node_id in others if distance <= radius])
+            self.assertEqual([neighbour.id for neighbour in node.get_neighbours()], [node_id for distance, node_id in others])
+
+    def test_prefix_trie(self):
+        trie = subnets.PrefixTrie()
+        trie.insert('10.0.0.0/8', 'a')
+        trie.insert('10.254.0.0/16', 'b')
+        trie.insert('10.254.1.0/24', 'c')
+        trie.insert('10.254.1.1', 'd')
+        trie.insert('2001:db8::/32', 'e')
+
+        self.assertEqual(len(trie), 5)
+        self.assertEqual(trie.lookup('10.1.2.3'), 'a')
+        self.assertEqual(trie.lookup('10.254.2.3'), 'b')
+        self.assertEqual(trie.lookup('10.254.1.3'), 'c')
+        self.assertEqual(trie.lookup('10.254.1.1'), 'd')
+        self.assertEqual(trie.lookup('11.0.0.1'), None)
+        self.assertEqual(trie.lookup('2001:db8::1'), 'e')
+        self.assertEqual(trie.lookup('2001:db9::1'), None)
+        self.assertEqual(trie.lookup('invalid'), None)
+
+    def test_missing_subnets_file(self):
+        table = subnets.SubnetsTable(os.path.join(os.path.dirname(__file__), 'missing_subnets'))
+
+        self.assertEqual(table.lookup('10.1.2.3'), None)
+
+    def test_malformed_subnets_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.subnets') as subnets_file:
+            subnets_file.write('# Comment\n10.0.0.0/8 a\n10.254.0.0/16\n10.300.0.0/16 b\n10.254.1.0/40 c\n2001:db8::/32 d\n')
+            subnets_file.flush()
+
+            table = subnets.SubnetsTable(subnets_file.name)
+
+            # Malformed lines are skipped
+
+            self.assertEqual(table.lookup('10.254.1.3'), 'a')
+            self.assertEqual(table.lookup('2001:db8::1'), 'd')
+
+    def test_shared_nodes(self):
+        # Requests resolve nodes through the backends registry, so we use the same backend instance
+        backend = nodes.load_backend('piplmesh.nodes.backends.RandomNodesBackend')
+
+        node = backend.get_node(12)
+        self.assertEqual(node.name, 'fri')
+        self.assertTrue(backend.get_node('12') is node)
+        self.assertTrue(list(backend.get_all_nodes())[12] is node)
+        self.assertRaises(AttributeError, setattr, node, 'name', 'other')
+
+        request = self.factory.get('/')
+        request.session = {
+            nodes.SESSION_KEY: node.id,
+            nodes.BACKEND_SESSION_KEY: node.backend.get_full_name(),
+        }
+
+        request_node = nodes.get_node(request)
+        self.assertTrue(request_node.node is node)
+        self.assertEqual(request_node.name, 'fri')
+        self.assertTrue(request_node.is_inside_request())
+
+    def test_backends_registry(self):
+        backend = nodes.load_backend('piplmesh.nodes.backends.RandomNodesBackend')
+
+        self.assertTrue(nodes.load_backend('piplmesh.nodes.backends.RandomNodesBackend') is backend)
+        self.assertEqual(nodes.get_backends(), (backend,))
+
+        nodes.backends_registry.invalidate()
+
+        self.assertFalse(nodes.load_backend('piplmesh.nodes.backends.RandomNodesBackend') is backend)
+
+        with utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.NearestNodesBackend',)):
+            self.assertTrue(isinstance(nodes.get_backends()[0], backends.NearestNodesBackend))
+
+        self.assertTrue(isinstance(nodes.get_backends()[0], backends.RandomNodesBackend))
+
+    @utils.override_settings(NODES_BACKENDS=('piplmesh.nodes.backends.NearestNodesBackend',))
+    def test_session_writes(self):
+        request = self.factory.get('/')
+        request.session = Session({
+            nodes.LATITUDE_SESSION_KEY: 46.0445688554,
+            nodes.LONGITUDE_SESSION_KEY: 14.4893038273,
+        })
+
+        node = nodes.get_node(request)
+        self.assertEqual(node.name, 'fri')
+        self.assertTrue(request.session.modified)
+
+        request.session.modified = False
+        node = nodes.get_node(request)
+        self.assertEqual(node.name, 'fri')
+        self.assertFalse(request.session.modified)
+
+        # Location changed, but the closest node is still the same
+        request.session[nodes.LATITUDE_SESSION_KEY] = 46.0445
+        request.session.modified = False
+        node = nodes.get_node(request)
+        self.assertEqual(node.name, 'fri')
+        self.assertTrue(request.session.modified)
+        self.assertEqual(request.session[nodes.CLOSEST_LATITUDE_SESSION_KEY], 46.0445)
+
+        self.assertTrue(nodes.flush_session(request))
+        self.assertFalse(nodes.flush_session(request))
+
+    def test_catalogue(self):
+        records = [{
+            'node_id': unicode(node.id),
+            'name': node.name,
+            'location': node.location,
+            'latitude': node.latitude,
+            'longitude': node.longitude,
+            'url': node.url,
+        } for node in nodes.get_all_nodes()]
+
+        stats = catalogue.sync(records)
+        self.assertEqual(stats['created'], len(records))
+
+        records[0]['location'] = u'Changed location'
+        stats = catalogue.sync(records[1:] + records[:1])
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['unchanged'], len(records) - 1)
+
+        stats = catalogue.sync(records[1:], prune=True)
+        self.assertEqual(stats['removed'], 1)
+        self.assertEqual(models.CatalogueNode.objects.count(), len(records) - 1)
+
+        backend = backends.CatalogueNodesBackend()
+        node = backend.get_closest_node(None, 46.0445688554, 14.4893038273)
+        self.assertEqual(node.name, 'fri')
+        self.assertTrue(backend.get_node(node.id) is node)
+        self.assertEqual(backend.get_node(records[0]['node_id']), None)
+
+        neighbours = backend.get_neighbours(node)
+        self.assertEqual(len(neighbours), len(records) - 2)
+        self.assertEqual(neighbours[:3], backend.get_neighbours(node, k=3))
+
+    def test_catalogue_export(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as export_file:
+            export_file.write('name,latitude,longitude,location,url\nfri,46.0446,14.4893,Ljubljana\n')
+            export_file.flush()
+
+            # Short rows are read as having missing values
+
+            records = list(catalogue.read_export(export_file.name))
+            self.assertEqual(len(records), 1)
+            self.assertEqual(records[0]['node_id'], u'fri')
+            self.assertEqual(records[0]['location'], u'Ljubljana')
+            self.assertEqual(records[0]['url'], u'')
+
+        with tempfile.NamedTemporaryFile(suffix='.csv') as export_file:
+            export_file.write('name,latitude,longitude,location,url\nfri,46.0446,14.4893,Ljubljana\nfmf,46.0449\n')
+            export_file.flush()
+
+            # Invalid records are reported with their line
+
+            self.assertRaisesRegexp(ValueError, 'line 3', catalogue.read_export, export_file.name)
@@ -14,6 +14,16 @@ mongoengine.connect(MONGO_DATABASE_NAME, **MONGO_DATABASE_OPTIONS)
 
 settings_dir = os.path.abspath(os.path.dirname(__file__))
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'presence': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+}
+
 import djcelery
 djcelery.setup_loader()
 
@@ -119,6 +129,9 @@ DEFAULT_FILE_STORAGE = 'piplmesh.utils.storage.GridFSStorage'
 # URL prefix for internationalization URLs
 I18N_URL = '/i18n/'
 
+# URL prefix for RESTful API URLs
+API_URL = '/api/'
+
 # List of configured IPs from which django-pushserver passthrough callbacks are allowed
 INTERNAL_IPS = (
     '127.0.0.1',
@@ -222,6 +235,13 @@ PUSH_SERVER = {
             'allow_credentials': True,
             'passthrough': 'http://127.0.0.1:8000' + PUSH_SERVER_URL,
         },
+        {
+            # Source for the streaming server, it notifies passthrough itself
+            'type': 'subscriber',
+            'url': r'/stream-source/(.+)/',
+            'polling': 'long',
+            'create_on_get': True,
+        },
         {
             'type': 'publisher',
             'url': r'/send-update/(.+)/',
@@ -229,7 +249,40 @@ PUSH_SERVER = {
     ),
 }
 
-CHECK_ONLINE_USERS_INTERVAL = 10 # seconds
+# Streaming (Server-Sent Events) server, run with runstreamserver command, which
+# relays updates from the push server, clients fall back to long polling if it is
+# not available or not configured
+PUSH_STREAM_SERVER = {
+    'port': 8002,
+    'address': '127.0.0.1',
+    'url': r'/stream/(.+)/',
+    'source': 'http://127.0.0.1:8001/stream-source/%s/',
+    'allow_origin': 'http://127.0.0.1:8000',
+    'allow_credentials': True,
+    'passthrough': 'http://127.0.0.1:8000' + PUSH_SERVER_URL,
+    'keepalive': 15, # seconds
+}
+
+# Time after the last connection of a user is closed when user is marked offline
+PRESENCE_RECONNECT_TIMEOUT = 20 # seconds
+# Interval at which users whose reconnect timeout expired are marked offline
+PRESENCE_EXPIRE_INTERVAL = 5 # seconds
+# Store of users' connections, shared by all processes
+PRESENCE_STORE = 'piplmesh.account.presence.CachePresenceStore'
+# Name of a cache in CACHES for presence store, it has to be shared by all processes
+PRESENCE_CACHE = 'presence'
+# Interval of writing users' connections to the database, not written if not set
+PRESENCE_SNAPSHOT_INTERVAL = None # seconds
+# Number of idle persistent connections to the push server kept per process
+PUSH_SERVER_POOL_SIZE = 4
+PUSH_SERVER_TIMEOUT = 10 # seconds
+
+# Posts are sent to users of the node where they were made and of its nearest neighbours
+# (not necessarily symmetric: B can be among nearest neighbours of A, but not A of B)
+HOME_CHANNEL_NEIGHBOURS = 5
+# Number of channels users of each node are split among
+HOME_CHANNEL_SHARDS = 1
+
 CHECK_FOR_NEW_HOROSCOPE = 6 # am every day
 POLL_BICIKELJ_INTERVAL = 60 # seconds
 
@@ -247,10 +300,12 @@ CELERY_ENABLE_UTC = USE_TZ
 CELERY_TIMEZONE = TIME_ZONE
 
 CELERYBEAT_SCHEDULE = {
-    'check_online_users': {
-        'task': 'piplmesh.frontend.tasks.check_online_users',
-        'schedule': datetime.timedelta(seconds=CHECK_ONLINE_USERS_INTERVAL),
+    'expire_presence': {
+        'task': 'piplmesh.frontend.tasks.expire_presence',
+        'schedule': datetime.timedelta(seconds=PRESENCE_EXPIRE_INTERVAL),
         'args': (),
+        # Runs which could not start in time are skipped, the next one does the same
+        'options': {'expires': PRESENCE_EXPIRE_INTERVAL},
     },
     'update_horoscope': {
         'task': 'piplmesh.panels.horoscope.tasks.update_horoscope',
@@ -310,10 +365,26 @@ NODES_BACKENDS = (
     'piplmesh.nodes.backends.RandomNodesBackend',
 )
 
+# Used by SubnetNodesBackend, if file is not set subnets are read from the database
+NODES_SUBNETS_FILE = None
+NODES_SUBNETS_RELOAD_INTERVAL = 60 # seconds
+# Set to True only if behind a trusted reverse proxy
+NODES_USE_X_FORWARDED_FOR = False
+
+# Used by CatalogueNodesBackend, default export file for syncnodes command and sync_nodes_catalogue task
+NODES_CATALOGUE_FILE = None
+NODES_CATALOGUE_RELOAD_INTERVAL = 60 # seconds
+
+# Precomputed neighbourhood of each node contains this many nearest
+# nodes and all nodes inside the largest radius
+NODES_NEIGHBOURS = 10
+NODES_NEIGHBOURHOOD_RADII = (1, 5, 10) # km
+
 NODES_MIDDLEWARE_EXCEPTIONS = (
     MEDIA_URL,
     STATIC_URL,
     I18N_URL,
+    API_URL,
     PUSH_SERVER_URL,
 )
 
@@ -355,3 +426,14 @@ CSRF_FAILURE_VIEW = 'piplmesh.frontend.views.forbidden_view'
 
 # We are using rfc-2822 because it's better supported when parsing dates in JavaScript
 TASTYPIE_DATETIME_FORMATTING = 'rfc-2822'
+
+# Number of notifications inserted (and their updates sent) at once
+NOTIFICATIONS_BATCH_SIZE = 500
+
+# Number of dehydrated posts cached in each process
+API_POSTS_CACHE_SIZE = 1000
+# Name of a cache in CACHES to share dehydrated posts between processes, not shared if not set
+API_POSTS_CACHE_BACKEND = None
+
+# Maximum number of requests in one API batch request
+API_BATCH_MAX_REQUESTS = 20
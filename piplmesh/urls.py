@@ -2,16 +2,17 @@ from django.conf import settings
 from django.conf.urls import patterns, include, url
 from django.contrib.staticfiles.urls import static, staticfiles_urlpatterns
 
-from tastypie import api
-
 from piplmesh.account import models, views as account_views
-from piplmesh.api import resources
+from piplmesh.api import batch, resources
 from piplmesh.frontend import debug as debug_views, views as frontend_views
-from piplmesh import panels
+from piplmesh import nodes, panels
 
 # PiplMesh panels auto-discovery
 panels.panels_pool.discover_panels()
 
+# Load nodes backends and their data at startup
+nodes.backends_registry.warm_up()
+
 # So that we can access resources outside their request handlers
 user_resource = resources.UserResource()
 uploadedfile_resource = resources.UploadedFileResource()
@@ -19,7 +20,7 @@ post_resource = resources.PostResource()
 notification_resource = resources.NotificationResource()
 
 API_NAME = 'v1'
-v1_api = api.Api(api_name=API_NAME)
+v1_api = batch.BatchApi(api_name=API_NAME)
 v1_api.register(user_resource)
 v1_api.register(uploadedfile_resource)
 v1_api.register(post_resource)
@@ -32,6 +33,7 @@ js_info_dict = {
 }
 
 I18N_URL = settings.I18N_URL.lstrip('/')
+API_URL = settings.API_URL.lstrip('/')
 PUSH_SERVER_URL = settings.PUSH_SERVER_URL.lstrip('/')
 
 urlpatterns = patterns('',
@@ -81,7 +83,7 @@ urlpatterns = patterns('',
     url(r'^account/setlanguage/$', account_views.set_language, name='set_language'),
 
     # RESTful API
-    url(r'^api/', include(v1_api.urls)),
+    url(r'^' + API_URL, include(v1_api.urls)),
 
     # Internationalization support
     url(r'^' + I18N_URL + 'js/$', 'django.views.i18n.javascript_catalog', js_info_dict),
@@ -0,0 +1,45 @@
+import logging
+
+from django.conf import settings
+from django.core.management import base
+
+import tornado
+from tornado import httpserver, ioloop
+
+from piplmesh.utils import streaming
+
+class Command(base.BaseCommand):
+    help = 'Starts a streaming (Server-Sent Events) server for push server channels, configured with PUSH_STREAM_SERVER setting.'
+    args = '[optional port number]'
+
+    can_import_settings = True
+    requires_model_validation = False
+
+    def handle(self, port=None, *args, **options):
+        conf = getattr(settings, 'PUSH_STREAM_SERVER', None)
+        if not conf:
+            raise base.CommandError("PUSH_STREAM_SERVER setting is not configured.")
+
+        if args:
+            raise base.CommandError("Usage is runstreamserver %s" % self.args)
+
+        port = port or conf['port']
+        address = conf.get('address', '127.0.0.1')
+
+        self.stdout.write((
+            "Streaming server on Tornado version %(tornado_version)s is running at http://%(address)s:%(port)s/\n"
+            "Quit the server with CONTROL-C.\n"
+        ) % {
+            'tornado_version': tornado.version,
+            'address': address,
+            'port': port,
+        })
+
+        logging.getLogger().setLevel('INFO')
+
+        httpserver.HTTPServer(streaming.make_application(conf)).listen(int(port), address)
+
+        try:
+            ioloop.IOLoop.instance().start()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,180 @@
+from __future__ import absolute_import
+
+import time, urllib, uuid
+
+from tornado import httpclient, ioloop, web
+
+DEFAULT_KEEPALIVE = 15 # seconds
+DEFAULT_POLL_TIMEOUT = 60 # seconds
+RETRY_DELAY = 1 # seconds
+
+# Initial position in the channel, as used by long polling clients
+INITIAL_LAST_MODIFIED = 'Thu, 1 Jan 1970 00:00:00 GMT'
+INITIAL_ETAG = '0'
+
+EVENT_ID_SEPARATOR = '|'
+
+def encode_event_id(last_modified, etag):
+    return '%s%s%s' % (last_modified, EVENT_ID_SEPARATOR, etag)
+
+def decode_event_id(event_id):
+    """
+    Returns position in the channel encoded in the event ID, or the initial position.
+    """
+
+    if not event_id or EVENT_ID_SEPARATOR not in event_id:
+        return INITIAL_LAST_MODIFIED, INITIAL_ETAG
+    return tuple(event_id.split(EVENT_ID_SEPARATOR, 1))
+
+def format_event(event_id, data):
+    lines = ['id: %s' % event_id] + ['data: %s' % line for line in data.splitlines()]
+    return '\n'.join(lines) + '\n\n'
+
+def get_poll_delay(response, poll_timeout):
+    """
+    Returns the delay (in seconds) before polling the push server again after the given response.
+
+    Only a long poll which timed out after waiting for the whole ``poll_timeout``
+    is repeated immediately, other failures (HTTP 599 also for connections which
+    were refused or closed early) are retried after a delay, so that streaming
+    server does not poll an unavailable push server in a tight loop.
+    """
+
+    if response.code in (200, 304):
+        return 0
+    elif response.code == 599 and isinstance(response.error, httpclient.HTTPError) and (response.request_time or 0) >= poll_timeout:
+        # Long poll timed out without updates
+        return 0
+    else:
+        return RETRY_DELAY
+
+class StreamingSubscriber(web.RequestHandler):
+    """
+    Server-Sent Events subscriber for push server channels.
+
+    It keeps one persistent connection open to the client and relays updates
+    from a long polling subscriber location of the push server (``source``,
+    a URL pattern with ``%s`` for the channel ID), so that updates have the
+    same channel names and format. Client's position in the channel is sent
+    as event ID, so a reconnecting client continues where it stopped.
+
+    Passthrough is notified only when the stream is opened and closed, not
+    for every update as with long polling.
+    """
+
+    def initialize(self, source, passthrough=None, allow_origin=None, allow_credentials=False, keepalive=DEFAULT_KEEPALIVE, poll_timeout=DEFAULT_POLL_TIMEOUT):
+        self.source = source
+        self.passthrough_url = passthrough
+        self.allow_origin = allow_origin
+        self.allow_credentials = allow_credentials
+        self.keepalive = keepalive
+        self.poll_timeout = poll_timeout
+
+        self.http_client = httpclient.AsyncHTTPClient()
+        self.closed = False
+        self.keepalive_callback = None
+
+    def set_access_control_headers(self):
+        if self.allow_origin:
+            self.set_header('Access-Control-Allow-Origin', self.allow_origin)
+        if self.allow_credentials:
+            self.set_header('Access-Control-Allow-Credentials', 'true')
+
+    def options(self, channel_id):
+        self.set_access_control_headers()
+        self.set_header('Access-Control-Allow-Headers', 'Last-Event-ID, Cache-Control')
+        self.set_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+
+    @web.asynchronous
+    def get(self, channel_id):
+        self.channel_id = channel_id
+        # Identifies the stream to passthrough like long polling requests are identified
+        self.connection_id = uuid.uuid4().hex
+        self.last_modified, self.etag = decode_event_id(self.request.headers.get('Last-Event-ID') or self.get_argument('last_event_id', None))
+
+        self.set_access_control_headers()
+        self.set_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.set_header('Cache-Control', 'no-cache')
+        # Event stream starts with a comment, so that headers are sent immediately
+        self.write(': stream\n\n')
+        self.flush()
+
+        self.notify_passthrough('subscribe')
+
+        self.keepalive_callback = ioloop.PeriodicCallback(self.send_keepalive, self.keepalive * 1000)
+        self.keepalive_callback.start()
+
+        self.poll()
+
+    def on_connection_close(self):
+        self.closed = True
+        if self.keepalive_callback is not None:
+            self.keepalive_callback.stop()
+        self.notify_passthrough('unsubscribe')
+
+    def notify_passthrough(self, action):
+        if not self.passthrough_url:
+            return
+
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'If-None-Match': self.connection_id,
+            'If-Modified-Since': 'stream',
+        }
+        if 'Cookie' in self.request.headers:
+            headers['Cookie'] = self.request.headers['Cookie']
+
+        self.http_client.fetch(httpclient.HTTPRequest(
+            self.passthrough_url,
+            method='POST',
+            headers=headers,
+            body=urllib.urlencode({'channel_id': self.channel_id, action: 1}),
+        ), lambda response: None)
+
+    def send_keepalive(self):
+        if self.closed:
+            return
+        self.write(': keepalive\n\n')
+        self.flush()
+
+    def poll(self):
+        if self.closed:
+            return
+
+        self.http_client.fetch(httpclient.HTTPRequest(
+            self.source % self.channel_id,
+            headers={
+                'If-None-Match': self.etag,
+                'If-Modified-Since': self.last_modified,
+            },
+            request_timeout=self.poll_timeout,
+        ), self.on_update)
+
+    def on_update(self, response):
+        if self.closed:
+            return
+
+        if response.code == 200:
+            self.last_modified = response.headers.get('Last-Modified', self.last_modified)
+            self.etag = response.headers.get('Etag', self.etag)
+            if response.body:
+                self.write(format_event(encode_event_id(self.last_modified, self.etag), response.body))
+                self.flush()
+
+        delay = get_poll_delay(response, self.poll_timeout)
+        if delay:
+            # Push server is not available, we retry after a delay
+            ioloop.IOLoop.instance().add_timeout(time.time() + delay, self.poll)
+        else:
+            self.poll()
+
+def make_application(conf):
+    """
+    Returns a Tornado application serving streaming subscribers, configured
+    with ``PUSH_STREAM_SERVER`` settings.
+    """
+
+    kwargs = dict((key, conf[key]) for key in ('source', 'passthrough', 'allow_origin', 'allow_credentials', 'keepalive', 'poll_timeout') if key in conf)
+    return web.Application([
+        (conf['url'], StreamingSubscriber, kwargs),
+    ])
@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+
+import socket
+
+from django.test import utils
+from django.utils import simplejson
+
+from tornado import httpclient
+
+from tastypie_mongoengine import test_runner
+
+from piplmesh.utils import streaming, updates
+
+class RecordingPublisher(updates.Publisher):
+    """
+    Publisher which records publishes instead of sending them to the push server.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingPublisher, self).__init__(*args, **kwargs)
+        self.published = []
+
+    def publish(self, channel_id, serialized):
+        self.published.append((channel_id, simplejson.loads(serialized)))
+
+class FailingPublisher(updates.Publisher):
+    """
+    Publisher for which every publish fails.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FailingPublisher, self).__init__(*args, **kwargs)
+        self.attempted = []
+
+    def publish(self, channel_id, serialized):
+        self.attempted.append(channel_id)
+        raise updates.PublishError("Publishing to '%s' failed." % channel_id)
+
+class UpdatesTest(test_runner.MongoEngineTestCase):
+    def test_coalescing(self):
+        publisher = RecordingPublisher()
+
+        publisher.send_updates([
+            ('home', {'type': 'post_new', 'post': 1}),
+            ('user/1', {'type': 'notification'}),
+            ('home', {'type': 'post_new', 'post': 2}),
+        ])
+
+        self.assertEqual(publisher.published, [
+            ('home', {'type': 'batch', 'updates': [{'type': 'post_new', 'post': 1}, {'type': 'post_new', 'post': 2}]}),
+            ('user/1', {'type': 'notification'}),
+        ])
+
+        stats = publisher.get_stats()
+        self.assertEqual(stats['updates'], 3)
+        self.assertEqual(stats['batches'], 1)
+
+    def test_send_update(self):
+        publisher = RecordingPublisher()
+
+        # Single updates are published immediately
+
+        publisher.send_update('home', {'type': 'post_new'})
+        self.assertEqual(publisher.published, [('home', {'type': 'post_new'})])
+
+        publisher.send_update('home', '{"type": "post_new"}', True)
+        self.assertEqual(publisher.published[-1], ('home', {'type': 'post_new'}))
+
+    def test_errors(self):
+        publisher = FailingPublisher()
+
+        self.assertRaises(updates.PublishError, publisher.send_update, 'home', {'type': 'post_new'})
+
+        # All channels are published to before the error is raised
+
+        self.assertRaises(updates.PublishError, publisher.send_updates, [('user/1', '{}'), ('user/2', '{}')], True)
+        self.assertEqual(publisher.attempted, ['home', 'user/1', 'user/2'])
+
+class StreamingTest(test_runner.MongoEngineTestCase):
+    def test_events(self):
+        event_id = streaming.encode_event_id('Thu, 1 Jan 1970 00:00:01 GMT', '3')
+        self.assertEqual(streaming.decode_event_id(event_id), ('Thu, 1 Jan 1970 00:00:01 GMT', '3'))
+
+        # Without a valid event ID stream starts at the beginning of the channel
+
+        self.assertEqual(streaming.decode_event_id(None), (streaming.INITIAL_LAST_MODIFIED, streaming.INITIAL_ETAG))
+        self.assertEqual(streaming.decode_event_id('invalid'), (streaming.INITIAL_LAST_MODIFIED, streaming.INITIAL_ETAG))
+
+        self.assertEqual(streaming.format_event('1|2', '{"type": "post_new"}'), 'id: 1|2\ndata: {"type": "post_new"}\n\n')
+        self.assertEqual(streaming.format_event('1|2', '{\n"type": "post_new"\n}'), 'id: 1|2\ndata: {\ndata: "type": "post_new"\ndata: }\n\n')
+
+    def test_poll_delay(self):
+        request = httpclient.HTTPRequest('http://127.0.0.1:8001/updates/home')
+
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 200, request_time=1), 60), 0)
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 304, request_time=1), 60), 0)
+
+        # Only long polls which timed out are repeated immediately
+
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 599, error=httpclient.HTTPError(599, "Timeout"), request_time=60), 60), 0)
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 599, error=httpclient.HTTPError(599, "Connection closed"), request_time=0.1), 60), streaming.RETRY_DELAY)
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 599, error=socket.error(111, "Connection refused"), request_time=0.1), 60), streaming.RETRY_DELAY)
+        self.assertEqual(streaming.get_poll_delay(httpclient.HTTPResponse(request, 500, request_time=0.1), 60), streaming.RETRY_DELAY)
+
+    @utils.override_settings(PUSH_STREAM_SERVER={'port': 8002, 'address': '127.0.0.1', 'url': r'/stream/(.+)/'})
+    def test_stream_url(self):
+        self.assertEqual(updates.stream_url('home'), 'http://127.0.0.1:8002/stream/home/')
+
+    @utils.override_settings(PUSH_STREAM_SERVER=None)
+    def test_no_stream_url(self):
+        self.assertEqual(updates.stream_url('home'), '')
@@ -0,0 +1,209 @@
+from __future__ import absolute_import
+
+import collections, httplib, socket, threading, timeit, urlparse
+
+from django.conf import settings
+from django.utils import regex_helper, simplejson
+
+from pushserver.utils import updates as pushserver_updates
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT = 10 # seconds
+
+# Type of updates which contain multiple coalesced updates
+BATCH_UPDATE_TYPE = 'batch'
+
+class PublishError(Exception):
+    pass
+
+class Publisher(object):
+    """
+    Client for push server publisher which keeps persistent connections to the
+    push server in a pool and coalesces updates.
+
+    Updates are published before sending returns, so that errors are raised
+    to the caller. Updates sent together with ``send_updates`` are coalesced,
+    multiple updates to the same channel are published as one ``batch`` update
+    with a list of ``updates``.
+
+    ``get_stats`` returns counters of published updates and publish latency.
+    """
+
+    def __init__(self, pool_size=None, timeout=None):
+        self.pool_size = pool_size if pool_size is not None else getattr(settings, 'PUSH_SERVER_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.timeout = timeout if timeout is not None else getattr(settings, 'PUSH_SERVER_TIMEOUT', DEFAULT_TIMEOUT)
+
+        self.pool = collections.defaultdict(list)
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {
+                'updates': 0,
+                'publishes': 0,
+                'batches': 0,
+                'errors': 0,
+                'bytes': 0,
+                'latency_total': 0.0,
+                'latency_max': 0.0,
+            }
+
+    def get_stats(self):
+        """
+        Returns a dict of counters, with average latency of a publish in seconds.
+        """
+
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['latency_average'] = stats['latency_total'] / stats['publishes'] if stats['publishes'] else 0.0
+        return stats
+
+    def get_connection(self, netloc):
+        with self.lock:
+            if self.pool[netloc]:
+                return self.pool[netloc].pop()
+        return httplib.HTTPConnection(netloc, timeout=self.timeout)
+
+    def release_connection(self, netloc, connection):
+        with self.lock:
+            if len(self.pool[netloc]) < self.pool_size:
+                self.pool[netloc].append(connection)
+                return
+        connection.close()
+
+    def publish(self, channel_id, serialized):
+        """
+        Publishes an already serialized update to the channel, over a pooled connection.
+        """
+
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(pushserver_updates.publisher_url(channel_id))
+        if query:
+            path = '%s?%s' % (path, query)
+
+        headers = {
+            'Content-Type': 'application/json; charset=utf-8',
+            'Content-Length': '%d' % len(serialized),
+        }
+
+        start = timeit.default_timer()
+        # Pooled connection could have been closed by the push server in the meantime, so we retry once
+        for attempt in (0, 1):
+            connection = self.get_connection(netloc)
+            try:
+                connection.request('POST', path, serialized, headers)
+                response = connection.getresponse()
+                # Response has to be read before the connection can be reused
+                response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if attempt:
+                    with self.stats_lock:
+                        self.stats['errors'] += 1
+                    raise
+                continue
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self.release_connection(netloc, connection)
+
+        latency = timeit.default_timer() - start
+        with self.stats_lock:
+            self.stats['publishes'] += 1
+            self.stats['bytes'] += len(serialized)
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            if response.status >= 400:
+                self.stats['errors'] += 1
+
+        if response.status >= 400:
+            raise PublishError("Push server responded with status %d for channel '%s'." % (response.status, channel_id))
+
+    def coalesce(self, serialized_updates):
+        """
+        Returns a serialized update containing all given serialized updates.
+        """
+
+        if len(serialized_updates) == 1:
+            return serialized_updates[0]
+
+        with self.stats_lock:
+            self.stats['batches'] += 1
+
+        # Updates are already serialized, so we do not parse them again
+        return '{"type": "%s", "updates": [%s]}' % (BATCH_UPDATE_TYPE, ', '.join(serialized_updates))
+
+    def publish_many(self, updates_by_channel):
+        """
+        Publishes updates given as a dict of lists of serialized updates per channel,
+        one publish per channel.
+        """
+
+        errors = []
+        for channel_id, serialized_updates in updates_by_channel.items():
+            try:
+                self.publish(channel_id, self.coalesce(serialized_updates))
+            except (PublishError, httplib.HTTPException, socket.error), e:
+                errors.append(e)
+
+        # We publish to all channels before reporting the first error
+        if errors:
+            raise errors[0]
+
+    def serialize(self, data, already_serialized):
+        if already_serialized:
+            return data
+        return simplejson.dumps(data)
+
+    def send_update(self, channel_id, data, already_serialized=False):
+        with self.stats_lock:
+            self.stats['updates'] += 1
+
+        self.publish(channel_id, self.serialize(data, already_serialized))
+
+    def send_updates(self, updates, already_serialized=False):
+        """
+        Sends a list of ``(channel ID, update)`` pairs, coalesced per channel.
+        """
+
+        with self.stats_lock:
+            self.stats['updates'] += len(updates)
+
+        updates_by_channel = collections.OrderedDict()
+        for channel_id, data in updates:
+            updates_by_channel.setdefault(channel_id, []).append(self.serialize(data, already_serialized))
+
+        self.publish_many(updates_by_channel)
+
+publisher = Publisher()
+
+def stream_url(channel_id):
+    """
+    Returns URL of the streaming subscriber for the channel, or an empty string
+    if streaming server is not configured.
+    """
+
+    stream_server = getattr(settings, 'PUSH_STREAM_SERVER', None)
+    if not stream_server:
+        return ''
+
+    stream = regex_helper.normalize(stream_server['url'])
+    if len(stream) != 1 or len(stream[0][1]) != 1:
+        raise ValueError("Non-reversible reg-exp: '%s'" % (stream_server['url'],))
+    stream, (arg,) = stream[0]
+
+    port = stream_server['port']
+    port = '' if port == 80 else ':%s' % (port,)
+    return 'http://%s%s%s' % (stream_server.get('address', '127.0.0.1'), port, stream % {arg: channel_id})
+
+def send_update(channel_id, data, already_serialized=False):
+    publisher.send_update(channel_id, data, already_serialized)
+
+def send_updates(updates, already_serialized=False):
+    publisher.send_updates(updates, already_serialized)
+
+def get_stats():
+    return publisher.get_stats()